@@ -0,0 +1,229 @@
+# Analytics Python 3 Module
+# Rhorix: An interface between quantum chemical topology and the 3D graphics program Blender
+
+# Quantities derived from a topology for offline analysis, without Blender: the lengths and
+# curvature of bond paths against internuclear distances, the areas of interatomic surfaces and
+# the statistics of a scalar property (rho by default) over each atomic basin.
+#
+# Each table is a dict from column names to (N,) arrays with a row per object, in the order of the
+# objects in the gradient vector field. Rather than looping over points, the coordinates of every
+# gradient path (or triangulation) of a kind are joined into one array with the offsets of each,
+# and the sums, minima and maxima per path or per object are taken with numpy.bincount and
+# ufunc.at, so the cost per file is a handful of NumPy calls. Missing values (e.g. the area of an
+# interatomic surface without a triangulation) are NaN, and missing CP indices are -1.
+#
+# analyseFiles yields the tables of many files in turn, parsing each as columnar arrays.
+
+import numpy
+from . import BinaryTopology, ParseTopology, TiledTopology
+
+# All the tables of a topology, as a dict from table name to table
+def analyseTopology(topology,key='rho'):
+    if topology.index is None:
+        topology.buildIndex()
+    return {'bond_paths'          : bondPathTable(topology,key=key),
+            'interatomic_surfaces': interatomicSurfaceTable(topology),
+            'atomic_basins'       : atomicBasinTable(topology,key=key)}
+
+# Tables of each of a list of .top or binary topology files, yielded as (filepath,tables). Every
+# tile of a tiled binary topology file is read.
+def analyseFiles(filepaths,key='rho',use_cache=False,parser='scan'):
+    for filepath in filepaths:
+        if filepath.endswith(BinaryTopology.file_extension) and TiledTopology.isTiled(filepath):
+            with TiledTopology.TiledTopologyFile(filepath) as tiled_file:
+                tiled_file.loadAll()
+                topology = tiled_file.topology
+        elif filepath.endswith(BinaryTopology.file_extension):
+            topology = BinaryTopology.readTopology(filepath)
+        else:
+            topology = ParseTopology.parseTopology(filepath,columnar=True,use_cache=use_cache,parser=parser)
+        yield filepath, analyseTopology(topology,key=key)
+
+# One row per AIL of the molecular graph:
+#   nacp_a, nacp_b, bcp      - CP indices of the nuclei joined and of the BCP
+#   path_length              - length of the bond path, the sum of the lengths of its gradient paths
+#   internuclear_distance    - straight line distance between the nuclei
+#   path_ratio               - path_length / internuclear_distance, 1 for a straight path
+#   total_turning            - sum of the angles (in radians) turned at each point of the path
+#   max_curvature            - greatest turning angle per unit length at any point of the path
+#   bcp_value                - value of key at the BCP
+def bondPathTable(topology,key='rho'):
+
+    critical_points = topology.critical_points
+    ails = topology.gradient_vector_field.molecular_graph.atomic_interaction_lines
+    num_ails = len(ails)
+
+    nacps = numpy.full((num_ails,2),-1,dtype=numpy.int64)
+    bcps  = numpy.full(num_ails,-1,dtype=numpy.int64)
+    for n, ail in enumerate(ails):
+        nacp_indices = ail.getNuclearIndices(critical_points)
+        if len(nacp_indices) == 2:
+            nacps[n] = nacp_indices
+        if ail.bcp_index is not None:
+            bcps[n] = ail.bcp_index
+
+    gradient_paths = [gradient_path for ail in ails for gradient_path in ail.gradient_paths]
+    owners = numpy.repeat(numpy.arange(num_ails),[len(ail.gradient_paths) for ail in ails])
+    coordinates, offsets = joinPaths(gradient_paths)
+    lengths = pathLengths(coordinates,offsets)
+    turning, curvature = pathTurning(coordinates,offsets)
+
+    positions = cpPositions(critical_points)
+    joined = (nacps >= 0).all(axis=1)
+    distance = numpy.full(num_ails,numpy.nan)
+    distance[joined] = numpy.linalg.norm(positions[nacps[joined,0]] - positions[nacps[joined,1]],axis=1)
+    path_length = numpy.bincount(owners,weights=lengths,minlength=num_ails)
+
+    max_curvature = numpy.full(num_ails,numpy.nan)
+    if len(owners):
+        numpy.fmax.at(max_curvature,owners,curvature)
+
+    bcp_value = cpValues(critical_points,key)
+    return {'nacp_a'               : nacps[:,0],
+            'nacp_b'               : nacps[:,1],
+            'bcp'                  : bcps,
+            'path_length'          : path_length,
+            'internuclear_distance': distance,
+            'path_ratio'           : path_length / distance,
+            'total_turning'        : numpy.bincount(owners,weights=turning,minlength=num_ails),
+            'max_curvature'        : max_curvature,
+            'bcp_value'            : numpy.where(bcps >= 0,bcp_value[bcps],numpy.nan)}
+
+# One row per interatomic surface:
+#   atomic_surface - index of its atomic surface
+#   nacp           - CP index of the nucleus of its atomic surface
+#   bcp            - CP index of its BCP
+#   num_paths      - number of gradient paths
+#   area           - area of its triangulation, NaN if it has none
+def interatomicSurfaceTable(topology):
+
+    atomic_surfaces = topology.gradient_vector_field.atomic_surfaces
+    interatomic_surfaces = [interatomic_surface for atomic_surface in atomic_surfaces for interatomic_surface in atomic_surface.interatomic_surfaces]
+    atomic_surface_numbers = numpy.repeat(numpy.arange(len(atomic_surfaces)),[len(atomic_surface.interatomic_surfaces) for atomic_surface in atomic_surfaces])
+    nacps = numpy.array([atomic_surface.nacp_index for atomic_surface in atomic_surfaces],dtype=numpy.int64)
+
+    area = numpy.full(len(interatomic_surfaces),numpy.nan)
+    triangulated = [n for n, interatomic_surface in enumerate(interatomic_surfaces) if interatomic_surface.triangulation is not None]
+    area[triangulated] = triangulationAreas([interatomic_surfaces[n].triangulation for n in triangulated])
+
+    return {'atomic_surface': atomic_surface_numbers,
+            'nacp'          : nacps[atomic_surface_numbers],
+            'bcp'           : numpy.array([-1 if interatomic_surface.bcp_index is None else interatomic_surface.bcp_index for interatomic_surface in interatomic_surfaces],dtype=numpy.int64),
+            'num_paths'     : numpy.array([len(interatomic_surface.gradient_paths) for interatomic_surface in interatomic_surfaces],dtype=numpy.int64),
+            'area'          : area}
+
+# One row per atomic basin, over the points of all its gradient paths at which key has a value:
+#   nacp                  - CP index of its nucleus
+#   num_paths, num_points - numbers of gradient paths and points
+#   min, max, mean        - statistics of key, NaN if it has no values
+def atomicBasinTable(topology,key='rho'):
+
+    critical_points = topology.critical_points
+    atomic_basins = topology.gradient_vector_field.atomic_basins
+    num_basins = len(atomic_basins)
+
+    gradient_paths = [gradient_path for atomic_basin in atomic_basins for gradient_path in atomic_basin.gradient_paths]
+    num_paths = numpy.array([len(atomic_basin.gradient_paths) for atomic_basin in atomic_basins],dtype=numpy.int64)
+    path_points = numpy.array([len(gradient_path.getCoordinates()) for gradient_path in gradient_paths],dtype=numpy.int64)
+    num_points = numpy.bincount(numpy.repeat(numpy.arange(num_basins),num_paths),weights=path_points,minlength=num_basins).astype(numpy.int64)
+
+    values = numpy.concatenate([gradient_path.getScalarProperty(key) for gradient_path in gradient_paths]) if gradient_paths else numpy.zeros(0)
+    owners = numpy.repeat(numpy.arange(num_basins),num_points)
+    present = ~numpy.isnan(values)
+    counts = numpy.bincount(owners[present],minlength=num_basins)
+    sums = numpy.bincount(owners[present],weights=values[present],minlength=num_basins)
+    minima = numpy.full(num_basins,numpy.nan)
+    maxima = numpy.full(num_basins,numpy.nan)
+    numpy.fmin.at(minima,owners,values)
+    numpy.fmax.at(maxima,owners,values)
+
+    nacps = [atomic_basin.getNuclearAttractorCriticalPointIndex(critical_points) for atomic_basin in atomic_basins]
+    with numpy.errstate(invalid='ignore',divide='ignore'):
+        means = sums / counts
+    return {'nacp'      : numpy.array([-1 if nacp is None else nacp for nacp in nacps],dtype=numpy.int64),
+            'num_paths' : num_paths,
+            'num_points': num_points,
+            'min'       : minima,
+            'max'       : maxima,
+            'mean'      : numpy.where(counts > 0,means,numpy.nan)}
+
+# The following functions work on many gradient paths or triangulations at once
+
+# Coordinates of a list of gradient paths joined into one (N,3) array, and the (P+1,) offsets at
+# which each path starts, as taken by the functions below
+def joinPaths(gradient_paths):
+    coordinates = [gradient_path.getCoordinates() for gradient_path in gradient_paths]
+    offsets = numpy.concatenate(([0],numpy.cumsum([len(path_coordinates) for path_coordinates in coordinates],dtype=numpy.int64)))
+    if not coordinates:
+        return numpy.zeros((0,3)), offsets
+    return numpy.concatenate(coordinates).astype(numpy.float64,copy=False), offsets
+
+# Length of each of the polylines held end to end in coordinates, as a (P,) array
+def pathLengths(coordinates,offsets):
+    lengths = numpy.zeros(len(offsets) - 1)
+    if len(coordinates) == 0:
+        return lengths
+    step_lengths = numpy.linalg.norm(numpy.diff(coordinates,axis=0),axis=1)
+    # Steps from the last point of one path to the first of the next are not part of either
+    boundaries = offsets[1:-1]
+    step_lengths[boundaries[(boundaries > 0) & (boundaries < len(coordinates))] - 1] = 0
+    # Length along the paths to each point
+    cumulative = numpy.concatenate(([0],numpy.cumsum(step_lengths)))
+    nonempty = offsets[1:] > offsets[:-1]
+    lengths[nonempty] = cumulative[offsets[1:][nonempty] - 1] - cumulative[offsets[:-1][nonempty]]
+    return lengths
+
+# Turning of each polyline: the sum of the angles (in radians) between consecutive steps, and the
+# greatest angle per unit length (the mean length of the two steps), as (P,) arrays. Paths of fewer
+# than three points have no turning and a curvature of NaN.
+def pathTurning(coordinates,offsets):
+    num_paths = len(offsets) - 1
+    total = numpy.zeros(num_paths)
+    greatest = numpy.full(num_paths,numpy.nan)
+    if len(coordinates) < 3:
+        return total, greatest
+
+    steps = numpy.diff(coordinates,axis=0)
+    before = steps[:-1]
+    after  = steps[1:]
+    # Interior point i+1 turns between steps i and i+1, both within its own path
+    path_of_point = numpy.repeat(numpy.arange(num_paths),numpy.diff(offsets))
+    interior = (path_of_point[:-2] == path_of_point[2:])
+    before_length = numpy.linalg.norm(before,axis=1)
+    after_length  = numpy.linalg.norm(after,axis=1)
+    interior &= (before_length > 0) & (after_length > 0)
+
+    # atan2 of the sine and cosine keeps small angles accurate, where arccos would not
+    sine   = numpy.linalg.norm(numpy.cross(before[interior],after[interior]),axis=1)
+    cosine = numpy.einsum('ij,ij->i',before[interior],after[interior])
+    angle = numpy.arctan2(sine,cosine)
+    curvature = angle / ((before_length[interior] + after_length[interior]) / 2)
+    owners = path_of_point[1:-1][interior]
+    total += numpy.bincount(owners,weights=angle,minlength=num_paths)
+    numpy.fmax.at(greatest,owners,curvature)
+    return total, greatest
+
+# Area of each of a list of triangulations, as a (T,) array
+def triangulationAreas(triangulations):
+    areas = numpy.zeros(len(triangulations))
+    if not triangulations:
+        return areas
+    coordinates = [triangulation.getCoordinates() for triangulation in triangulations]
+    faces = [triangulation.getFaceIndices() for triangulation in triangulations]
+    point_offsets = numpy.concatenate(([0],numpy.cumsum([len(vertices) for vertices in coordinates])))[:-1]
+    all_faces = numpy.concatenate([face_indices.astype(numpy.int64) + offset for face_indices, offset in zip(faces,point_offsets.tolist())])
+    if len(all_faces) == 0:
+        return areas
+    vertices = numpy.concatenate(coordinates).astype(numpy.float64,copy=False)
+    a = vertices[all_faces[:,0]]
+    face_areas = numpy.linalg.norm(numpy.cross(vertices[all_faces[:,1]] - a,vertices[all_faces[:,2]] - a),axis=1) / 2
+    owners = numpy.repeat(numpy.arange(len(triangulations)),[len(face_indices) for face_indices in faces])
+    return numpy.bincount(owners,weights=face_areas,minlength=len(triangulations))
+
+# Position of each critical point as an (N,3) array
+def cpPositions(critical_points):
+    return numpy.array([cp.position_vector for cp in critical_points],dtype=numpy.float64).reshape(-1,3)
+
+# Value of key at each critical point as an (N,) array, NaN where absent
+def cpValues(critical_points,key):
+    return numpy.array([cp.scalar_properties.get(key,numpy.nan) for cp in critical_points],dtype=numpy.float64)
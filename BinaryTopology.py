@@ -0,0 +1,464 @@
+# BinaryTopology Python 3 Module
+# Rhorix: An interface between quantum chemical topology and the 3D graphics program Blender
+
+# A compact binary counterpart to the XML format defined in Topology.dtd.
+# The file is a short header, a sequence of aligned array blocks and a JSON table of contents:
+#
+#   magic (8 bytes) | TOC offset (uint64) | TOC length (uint64) | array blocks ... | TOC
+#
+# The TOC holds, for each section (nuclei, critical points, the molecular graph, each atomic
+# basin, each atomic surface, the ring surfaces, envelopes, rings and cages), the dtype, shape
+# and file offset of every array belonging to that section plus any small scalar metadata.
+# Gradient paths are stored per section as one concatenated coordinate block with offset arrays
+# delimiting the paths, and one column per scalar property.
+# In a deduplicated file (format version 2), the rings section stores only the AILs not already in
+# the molecular graph, and an ail_references array gives for each AIL of each ring either the index
+# i >= 0 of an AIL of the molecular graph or -1-k for the k-th AIL stored in the section. The cages
+# section likewise refers to the rings section with ring_references.
+# Reading memory-maps the file, so only the pages of the sections actually requested are touched
+# and the arrays are used in place without copying; those of float32 files stay float32.
+
+import collections
+import functools
+import json
+import mmap
+import struct
+import sys
+import numpy
+from . import TopologyClasses
+
+file_extension = '.btop'
+magic          = b'RHORIXB1'
+format_version = 1
+deduplicated_format_version = 2
+header_format  = '<8sQQ'
+header_size    = struct.calcsize(header_format)
+alignment      = 64
+
+# Names of the sections that may be passed to readTopology
+section_names = ('nuclei','critical_points','molecular_graph','atomic_basins',
+                 'envelopes','atomic_surfaces','ring_surfaces','rings','cages')
+
+# Write an in-memory Topology to filepath. precision is the dtype used for coordinates
+# and scalar properties, either 'float64' or 'float32'. If deduplicate is True, the AILs of rings
+# and the rings of cages identical to ones of the molecular graph and rings are written as
+# references to them, in a form only read by this version of readTopology onwards.
+def writeTopology(topology,filepath,precision='float64',deduplicate=False):
+    toc, sections = encodeTopology(topology,numpy.dtype(precision),deduplicate=deduplicate)
+    writeSections(filepath,toc,sections.items())
+
+# Convert a Topology to the table of contents (less the array entries) and the sections, each a
+# pair of metadata and named arrays, of a binary topology file
+def encodeTopology(topology,dtype,deduplicate=False):
+
+    gvf = topology.gradient_vector_field
+    sections = collections.OrderedDict()
+
+    sections['nuclei'] = ({'elements': [nucleus.element for nucleus in topology.nuclei]},
+                          {'coordinates': numpy.array([nucleus.position_vector for nucleus in topology.nuclei],dtype=dtype).reshape(-1,3)})
+
+    arrays = collections.OrderedDict()
+    encodePoints(arrays,'',topology.critical_points,dtype)
+    arrays['rank']      = numpy.array([cp.rank for cp in topology.critical_points],dtype=numpy.int32)
+    arrays['signature'] = numpy.array([cp.signature for cp in topology.critical_points],dtype=numpy.int32)
+    sections['critical_points'] = ({},arrays)
+
+    ails = gvf.molecular_graph.atomic_interaction_lines
+    arrays = collections.OrderedDict()
+    encodeGradientPaths(arrays,'',[path for ail in ails for path in ail.gradient_paths],dtype)
+    arrays['ail_offsets'] = encodeOffsets([len(ail.gradient_paths) for ail in ails])
+    sections['molecular_graph'] = ({},arrays)
+
+    for i, atomic_basin in enumerate(gvf.atomic_basins):
+        arrays = collections.OrderedDict()
+        encodeGradientPaths(arrays,'',atomic_basin.gradient_paths,dtype)
+        sections['atomic_basin/'+str(i)] = ({},arrays)
+
+    for i, atomic_surface in enumerate(gvf.atomic_surfaces):
+        surfaces = atomic_surface.interatomic_surfaces
+        arrays = collections.OrderedDict()
+        encodeGradientPaths(arrays,'',[path for surface in surfaces for path in surface.gradient_paths],dtype)
+        arrays['ias_offsets'] = encodeOffsets([len(surface.gradient_paths) for surface in surfaces])
+        triangulated = []
+        for j, surface in enumerate(surfaces):
+            triangulated.append(surface.triangulation is not None)
+            if surface.triangulation is not None:
+                encodeTriangulation(arrays,'triangulation/'+str(j)+'/',surface.triangulation,dtype)
+        sections['atomic_surface/'+str(i)] = ({'nacp_index': atomic_surface.nacp_index,'triangulated': triangulated},arrays)
+
+    arrays = collections.OrderedDict()
+    isovalues = []
+    triangulated = []
+    for i, envelope in enumerate(gvf.envelopes):
+        isovalues.append(envelope.isovalue)
+        triangulated.append(envelope.triangulation is not None)
+        encodePoints(arrays,'envelope/'+str(i)+'/',envelope.points,dtype)
+        if envelope.triangulation is not None:
+            encodeTriangulation(arrays,'envelope/'+str(i)+'/triangulation/',envelope.triangulation,dtype)
+    sections['envelopes'] = ({'isovalues': isovalues,'triangulated': triangulated},arrays)
+
+    arrays = collections.OrderedDict()
+    encodeGradientPaths(arrays,'',[path for surface in gvf.ring_surfaces for path in surface.gradient_paths],dtype)
+    arrays['surface_offsets'] = encodeOffsets([len(surface.gradient_paths) for surface in gvf.ring_surfaces])
+    sections['ring_surfaces'] = ({},arrays)
+
+    cage_rings = [ring for cage in gvf.cages for ring in cage.rings]
+    ail_numbers = None
+    if deduplicate == True:
+        ail_numbers = TopologyClasses.IdenticalObjects(TopologyClasses.atomicInteractionLineSignature,TopologyClasses.sameAtomicInteractionLine)
+        for n, ail in enumerate(ails):
+            ail_numbers.add(ail,n)
+        ring_numbers = TopologyClasses.IdenticalObjects(ringSignature,sameRing)
+        for n, ring in enumerate(gvf.rings):
+            ring_numbers.add(ring,n)
+        cage_rings, ring_references = referenceOrStore(cage_rings,ring_numbers)
+
+    arrays = collections.OrderedDict()
+    encodeRings(arrays,gvf.rings,dtype,ail_numbers)
+    sections['rings'] = ({},arrays)
+
+    arrays = collections.OrderedDict()
+    encodeRings(arrays,cage_rings,dtype,ail_numbers)
+    arrays['cage_offsets'] = encodeOffsets([len(cage.rings) for cage in gvf.cages])
+    if deduplicate == True:
+        arrays['ring_references'] = ring_references
+    sections['cages'] = ({},arrays)
+
+    toc = {'format_version': deduplicated_format_version if deduplicate == True else format_version,
+           'name': topology.name,
+           'precision': dtype.name,
+           'atomic_basin_count': len(gvf.atomic_basins),
+           'atomic_surface_count': len(gvf.atomic_surfaces),
+           'sections': {}}
+    return toc, sections
+
+# Write (name,(metadata,arrays)) pairs to filepath, adding the dtype, shape and offset of each
+# array to the TOC. sections may be a generator, so that only one section is held at a time.
+def writeSections(filepath,toc,sections):
+
+    with open(filepath,'wb') as binary_file:
+        binary_file.write(b'\0' * header_size)
+        for section_name, (metadata, arrays) in sections:
+            entries = {}
+            for array_name, array in arrays.items():
+                padding = -binary_file.tell() % alignment
+                binary_file.write(b'\0' * padding)
+                array = numpy.ascontiguousarray(array)
+                entries[array_name] = [array.dtype.str,list(array.shape),binary_file.tell()]
+                binary_file.write(array.tobytes())
+            toc['sections'][section_name] = {'metadata': metadata,'arrays': entries}
+
+        toc_bytes = json.dumps(toc).encode('utf-8')
+        toc_offset = binary_file.tell()
+        binary_file.write(toc_bytes)
+        binary_file.seek(0)
+        binary_file.write(struct.pack(header_format,magic,toc_offset,len(toc_bytes)))
+
+# Read filepath and return a Topology. If sections is given, only those of section_names
+# are read and the remaining collections of the gradient vector field are left empty.
+# If lazy is True, each collection of the gradient vector field is only read when first accessed.
+def readTopology(filepath,sections=None,lazy=False):
+    return BinaryTopologyFile(filepath).readTopology(sections=sections,lazy=lazy)
+
+# Read the table of contents of a binary topology file without mapping it
+def readTableOfContents(filepath):
+    with open(filepath,'rb') as binary_file:
+        header = binary_file.read(header_size)
+        if len(header) < header_size:
+            raise ValueError(filepath+' is not a binary topology file')
+        file_magic, toc_offset, toc_length = struct.unpack(header_format,header)
+        if file_magic != magic:
+            raise ValueError(filepath+' is not a binary topology file')
+        binary_file.seek(toc_offset)
+        toc = json.loads(binary_file.read(toc_length).decode('utf-8'))
+    if toc['format_version'] not in (format_version,deduplicated_format_version):
+        raise ValueError(filepath+' has unsupported binary topology version '+str(toc['format_version']))
+    return toc
+
+# A memory-mapped binary topology file from which individual sections can be read
+# Arrays read from the file are views of the mapping, so close() only unmaps the file at once if
+# none of them remain; otherwise the mapping is released when the last of them is freed. May be
+# used as a context manager, but a lazily read topology needs the file to stay open.
+class BinaryTopologyFile():
+
+    def __init__(self,filepath):
+        self.toc = readTableOfContents(filepath)
+        with open(filepath,'rb') as binary_file:
+            self.buffer = mmap.mmap(binary_file.fileno(),0,access=mmap.ACCESS_READ)
+        self.name                 = self.toc['name']
+        self.atomic_basin_count   = self.toc['atomic_basin_count']
+        self.atomic_surface_count = self.toc['atomic_surface_count']
+
+    def close(self):
+        if self.buffer is not None:
+            try:
+                self.buffer.close()
+            except BufferError:
+                pass # arrays read from the file still use the mapping
+            self.buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+    def readTopology(self,sections=None,lazy=False):
+
+        if sections is None:
+            sections = section_names
+
+        nuclei          = self.readNuclei() if 'nuclei' in sections else []
+        critical_points = self.readCriticalPoints() if 'critical_points' in sections else []
+
+        readers = {'molecular_graph' : self.readMolecularGraph,
+                   'atomic_basins'   : self.readAtomicBasins,
+                   'envelopes'       : self.readEnvelopes,
+                   'atomic_surfaces' : self.readAtomicSurfaces,
+                   'ring_surfaces'   : self.readRingSurfaces,
+                   'rings'           : self.readRings,
+                   'cages'           : self.readCages}
+        loaders = {name: reader for name, reader in readers.items() if name in sections}
+
+        # The rings and cages of a deduplicated file refer to the molecular graph and rings, which
+        # are taken from this topology when it has them, so that they are shared
+        def collection(name):
+            if name in loaders:
+                return lambda: getattr(gradient_vector_field,name)
+        if 'rings' in loaders:
+            loaders['rings'] = functools.partial(self.readRings,collection('molecular_graph'))
+        if 'cages' in loaders:
+            loaders['cages'] = functools.partial(self.readCages,collection('molecular_graph'),collection('rings'))
+
+        gradient_vector_field = TopologyClasses.LazyGradientVectorField(loaders)
+        if lazy == False:
+            gradient_vector_field = TopologyClasses.GradientVectorField(gradient_vector_field.molecular_graph,
+                                                                        gradient_vector_field.atomic_basins,
+                                                                        gradient_vector_field.envelopes,
+                                                                        gradient_vector_field.atomic_surfaces,
+                                                                        gradient_vector_field.ring_surfaces,
+                                                                        gradient_vector_field.rings,
+                                                                        gradient_vector_field.cages)
+            TopologyClasses.shareRepeatedObjects(gradient_vector_field)
+        return TopologyClasses.Topology(self.name,nuclei,critical_points,gradient_vector_field)
+
+    def readNuclei(self):
+        section = self.section('nuclei')
+        coordinates = section.array('coordinates')
+        nuclei = []
+        for element, position_vector in zip(section.metadata['elements'],coordinates.tolist()):
+            nuclei.append(TopologyClasses.Nucleus(element,tuple(position_vector)))
+        return nuclei
+
+    def readCriticalPoints(self):
+        section = self.section('critical_points')
+        points = TopologyClasses.pointsFromColumns(section.array('coordinates'),section.properties(''))
+        critical_points = []
+        for point, rank, signature in zip(points,section.array('rank').tolist(),section.array('signature').tolist()):
+            critical_points.append(TopologyClasses.CriticalPoint(point.position_vector,point.scalar_properties,rank,signature))
+        return critical_points
+
+    def readMolecularGraph(self):
+        section = self.section('molecular_graph')
+        gradient_paths = section.gradientPaths('')
+        ails = [TopologyClasses.AtomicInteractionLine(paths) for paths in split(gradient_paths,section.array('ail_offsets'))]
+        return TopologyClasses.MolecularGraph(ails)
+
+    def readAtomicBasin(self,index):
+        section = self.section('atomic_basin/'+str(index))
+        return TopologyClasses.AtomicBasin(section.gradientPaths(''))
+
+    def readAtomicBasins(self):
+        return [self.readAtomicBasin(i) for i in range(self.atomic_basin_count)]
+
+    def readAtomicSurfaces(self):
+        return [self.readAtomicSurface(i) for i in range(self.atomic_surface_count)]
+
+    def readAtomicSurface(self,index):
+        section = self.section('atomic_surface/'+str(index))
+        gradient_paths = section.gradientPaths('')
+        interatomic_surfaces = []
+        for j, paths in enumerate(split(gradient_paths,section.array('ias_offsets'))):
+            triangulation = None
+            if section.metadata['triangulated'][j]:
+                triangulation = section.triangulation('triangulation/'+str(j)+'/')
+            interatomic_surfaces.append(TopologyClasses.InteratomicSurface(paths,triangulation))
+        return TopologyClasses.AtomicSurface(interatomic_surfaces,nacp_index=section.metadata['nacp_index'])
+
+    def readEnvelopes(self):
+        section = self.section('envelopes')
+        envelopes = []
+        for i, isovalue in enumerate(section.metadata['isovalues']):
+            prefix = 'envelope/'+str(i)+'/'
+            points = TopologyClasses.pointsFromColumns(section.array(prefix+'coordinates'),section.properties(prefix))
+            triangulation = None
+            if section.metadata['triangulated'][i]:
+                triangulation = section.triangulation(prefix+'triangulation/')
+            envelopes.append(TopologyClasses.Envelope(isovalue,points,triangulation))
+        return envelopes
+
+    def readRingSurfaces(self):
+        section = self.section('ring_surfaces')
+        gradient_paths = section.gradientPaths('')
+        return [TopologyClasses.RingSurface(paths) for paths in split(gradient_paths,section.array('surface_offsets'))]
+
+    # read_molecular_graph and read_rings return the molecular graph and rings referred to by a
+    # deduplicated file; if not given, these are read from the file
+    def readRings(self,read_molecular_graph=None):
+        section = self.section('rings')
+        return section.rings(self.referencedAtomicInteractionLines(section,read_molecular_graph))
+
+    def readCages(self,read_molecular_graph=None,read_rings=None):
+        section = self.section('cages')
+        if read_molecular_graph is None and 'ail_references' in section.arrays:
+            molecular_graph = self.readMolecularGraph()
+            read_molecular_graph = lambda: molecular_graph
+        rings = section.rings(self.referencedAtomicInteractionLines(section,read_molecular_graph))
+        if 'ring_references' in section.arrays:
+            referenced_rings = read_rings() if read_rings is not None else self.readRings(read_molecular_graph)
+            rings = resolveReferences(section.array('ring_references'),referenced_rings,rings)
+        return [TopologyClasses.Cage(cage_rings) for cage_rings in split(rings,section.array('cage_offsets'))]
+
+    def referencedAtomicInteractionLines(self,section,read_molecular_graph):
+        if 'ail_references' not in section.arrays:
+            return None
+        molecular_graph = read_molecular_graph() if read_molecular_graph is not None else self.readMolecularGraph()
+        return molecular_graph.atomic_interaction_lines
+
+    def section(self,name):
+        return BinarySection(self.buffer,self.toc['sections'][name])
+
+# The arrays and metadata of a single section, viewed in place in the mapped file
+class BinarySection():
+
+    def __init__(self,buffer,entry):
+        self.buffer   = buffer
+        self.metadata = entry['metadata']
+        self.arrays   = entry['arrays']
+
+    def array(self,name):
+        dtype, shape, offset = self.arrays[name]
+        count = 1
+        for n in shape:
+            count *= n
+        return numpy.frombuffer(self.buffer,dtype=numpy.dtype(dtype),count=count,offset=offset).reshape(shape)
+
+    # Scalar property columns stored under prefix+'property/<key>'
+    def properties(self,prefix):
+        properties = {}
+        start = prefix+'property/'
+        for name in self.arrays:
+            if name.startswith(start):
+                properties[sys.intern(name[len(start):])] = self.array(name)
+        return properties
+
+    def gradientPaths(self,prefix):
+        coordinates = self.array(prefix+'coordinates')
+        properties  = self.properties(prefix)
+        point_offsets = self.array(prefix+'point_offsets').tolist()
+        cp_offsets    = self.array(prefix+'cp_offsets').tolist()
+        cp_indices    = self.array(prefix+'cp_indices').tolist()
+        gradient_paths = []
+        for i in range(len(point_offsets)-1):
+            start, end = point_offsets[i], point_offsets[i+1]
+            path_properties = {key: column[start:end] for key, column in properties.items()}
+            gradient_paths.append(TopologyClasses.ColumnarGradientPath(cp_indices[cp_offsets[i]:cp_offsets[i+1]],
+                                                                      coordinates[start:end],
+                                                                      path_properties))
+        return gradient_paths
+
+    def triangulation(self,prefix):
+        return TopologyClasses.ColumnarTriangulation(self.array(prefix+'coordinates'),
+                                                     self.properties(prefix),
+                                                     self.array(prefix+'edges'),
+                                                     self.array(prefix+'faces'))
+
+    # referenced_ails are the AILs of the molecular graph, for a section with ail_references
+    def rings(self,referenced_ails=None):
+        ails = [TopologyClasses.AtomicInteractionLine(paths) for paths in split(self.gradientPaths(''),self.array('ail_offsets'))]
+        if 'ail_references' in self.arrays:
+            ails = resolveReferences(self.array('ail_references'),referenced_ails,ails)
+        return [TopologyClasses.Ring(ring_ails) for ring_ails in split(ails,self.array('ring_offsets'))]
+
+# The following functions convert topology objects to named arrays for writing
+
+# Offsets delimiting consecutive groups of the given sizes
+def encodeOffsets(sizes):
+    offsets = numpy.zeros(len(sizes)+1,dtype=numpy.int64)
+    numpy.cumsum(sizes,out=offsets[1:])
+    return offsets
+
+# Split a list into the groups delimited by an offset array
+def split(items,offsets):
+    offsets = offsets.tolist()
+    return [items[offsets[i]:offsets[i+1]] for i in range(len(offsets)-1)]
+
+def encodePoints(arrays,prefix,points,dtype):
+    arrays[prefix+'coordinates'] = numpy.array([point.position_vector for point in points],dtype=dtype).reshape(-1,3)
+    for key in TopologyClasses.scalarPropertyKeys(points):
+        arrays[prefix+'property/'+key] = numpy.array([point.scalar_properties.get(key,float('nan')) for point in points],dtype=dtype)
+
+def encodeGradientPaths(arrays,prefix,gradient_paths,dtype):
+
+    coordinates = [path.getCoordinates() for path in gradient_paths]
+    arrays[prefix+'coordinates'] = numpy.concatenate(coordinates).astype(dtype) if coordinates else numpy.zeros((0,3),dtype=dtype)
+    arrays[prefix+'point_offsets'] = encodeOffsets([len(c) for c in coordinates])
+    arrays[prefix+'cp_indices'] = numpy.array([index for path in gradient_paths for index in path.cp_indices],dtype=numpy.int32)
+    arrays[prefix+'cp_offsets'] = encodeOffsets([len(path.cp_indices) for path in gradient_paths])
+
+    keys = []
+    for path in gradient_paths:
+        for key in path.getScalarPropertyKeys():
+            if key not in keys:
+                keys.append(key)
+    for key in keys:
+        arrays[prefix+'property/'+key] = numpy.concatenate([path.getScalarProperty(key) for path in gradient_paths]).astype(dtype)
+
+def encodeTriangulation(arrays,prefix,triangulation,dtype):
+    arrays[prefix+'coordinates'] = triangulation.getCoordinates().astype(dtype)
+    for key in triangulation.getScalarPropertyKeys():
+        arrays[prefix+'property/'+key] = triangulation.getScalarProperty(key).astype(dtype)
+    arrays[prefix+'edges'] = triangulation.getEdgeIndices()
+    arrays[prefix+'faces'] = triangulation.getFaceIndices()
+
+# If ail_numbers (a TopologyClasses.IdenticalObjects of the AILs of the molecular graph, numbered
+# by their index) is given, AILs of the molecular graph are written as references to it
+def encodeRings(arrays,rings,dtype,ail_numbers=None):
+    ails = [ail for ring in rings for ail in ring.atomic_interaction_lines]
+    if ail_numbers is not None:
+        ails, arrays['ail_references'] = referenceOrStore(ails,ail_numbers)
+    encodeGradientPaths(arrays,'',[path for ail in ails for path in ail.gradient_paths],dtype)
+    arrays['ail_offsets']  = encodeOffsets([len(ail.gradient_paths) for ail in ails])
+    arrays['ring_offsets'] = encodeOffsets([len(ring.atomic_interaction_lines) for ring in rings])
+
+def ringSignature(ring):
+    return tuple(TopologyClasses.atomicInteractionLineSignature(ail) for ail in ring.atomic_interaction_lines)
+
+def sameRing(a,b):
+    return (len(a.atomic_interaction_lines) == len(b.atomic_interaction_lines)
+            and all(ail_a is ail_b or TopologyClasses.sameAtomicInteractionLine(ail_a,ail_b)
+                    for ail_a, ail_b in zip(a.atomic_interaction_lines,b.atomic_interaction_lines)))
+
+# Split items into those to store and an array of references to them: the number of each item
+# found in numbers (a TopologyClasses.IdenticalObjects), or -1-k for the k-th item stored.
+# Repeated items not in numbers are stored once.
+def referenceOrStore(items,numbers):
+    stored = TopologyClasses.IdenticalObjects(numbers.signature,numbers.same)
+    stored_items = []
+    references = numpy.zeros(len(items),dtype=numpy.int64)
+    for n, item in enumerate(items):
+        found = numbers.find(item)
+        if found is None:
+            found = stored.find(item)
+            if found is None:
+                found = (item,len(stored_items))
+                stored.add(item,len(stored_items))
+                stored_items.append(item)
+            references[n] = -1 - found[1]
+        else:
+            references[n] = found[1]
+    return stored_items, references
+
+# The inverse of referenceOrStore, given the referenced and stored items
+def resolveReferences(references,referenced,stored):
+    return [referenced[reference] if reference >= 0 else stored[-1-reference] for reference in references.tolist()]
@@ -0,0 +1,129 @@
+# Filters Python 3 Module
+# Rhorix: An interface between quantum chemical topology and the 3D graphics program Blender
+
+# A TopologyFilter describes the part of a topology to keep, and is passed to the functions of
+# ParseTopology so that it is evaluated while parsing: rejected points, gradient paths and
+# surfaces are never converted to objects.
+#
+# Critical points are never removed from the critical point list, as the gradient vector field
+# refers to them by index. Instead a critical point may be rejected, and every gradient path
+# ending at a rejected critical point is dropped along with it.
+#
+#   scalar_ranges   - dict from scalar property name to (low,high) applied to the points of
+#                     gradient paths, envelopes and triangulations; either bound may be None
+#   cp_scalar_ranges - as scalar_ranges, but applied to critical points
+#   cp_kinds        - the kinds of critical point to keep, e.g. {'nacp','bcp'}
+#   elements        - the element symbols of the nuclei to keep (case-insensitive)
+#   nucleus_indices - the (zero-based) indices of the nuclei to keep
+#   bounding_box    - ((x_min,y_min,z_min),(x_max,y_max,z_max)) containing the points to keep
+#
+# Nuclear attractor CPs take the element and index of the nucleus with the same index.
+# An atomic interaction line, ring or cage is kept only if none of its gradient paths ends at a
+# rejected CP; any object left with no points, paths or surfaces is dropped.
+
+import numpy
+
+class TopologyFilter():
+
+    def __init__(self,
+                 scalar_ranges=None,
+                 cp_scalar_ranges=None,
+                 cp_kinds=None,
+                 elements=None,
+                 nucleus_indices=None,
+                 bounding_box=None):
+
+        self.scalar_ranges    = scalar_ranges
+        self.cp_scalar_ranges = cp_scalar_ranges
+        self.cp_kinds         = None if cp_kinds is None else frozenset(cp_kinds)
+        self.elements         = None if elements is None else frozenset(element.lower() for element in elements)
+        self.nucleus_indices  = None if nucleus_indices is None else frozenset(nucleus_indices)
+        self.bounding_box     = bounding_box
+        self.cp_accepted      = None
+
+    # A string identifying the filter settings, used in cache keys
+    def key(self):
+        return repr((sorted((self.scalar_ranges or {}).items()),
+                     sorted((self.cp_scalar_ranges or {}).items()),
+                     None if self.cp_kinds is None else sorted(self.cp_kinds),
+                     None if self.elements is None else sorted(self.elements),
+                     None if self.nucleus_indices is None else sorted(self.nucleus_indices),
+                     self.bounding_box))
+
+    # Return a copy of this filter that has decided which of the given critical points are
+    # accepted. Called by the parser once the nuclei and critical points have been read.
+    def bind(self,nuclei,critical_points):
+
+        bound = TopologyFilter(self.scalar_ranges,self.cp_scalar_ranges,self.cp_kinds,
+                               self.elements,self.nucleus_indices,self.bounding_box)
+        bound.cp_accepted = []
+        for index, cp in enumerate(critical_points):
+            kind = cp.computeType()
+            accepted = self.cp_kinds is None or kind in self.cp_kinds
+            accepted = accepted and inRanges(cp.scalar_properties,self.cp_scalar_ranges)
+            if kind == 'nacp' and index < len(nuclei):
+                if self.elements is not None and nuclei[index].element.lower() not in self.elements:
+                    accepted = False
+                if self.nucleus_indices is not None and index not in self.nucleus_indices:
+                    accepted = False
+            bound.cp_accepted.append(accepted)
+        return bound
+
+    # True if none of the given (zero-based) CP indices refers to a rejected critical point
+    # Indices outside the critical point list (e.g. paths to infinity) are ignored
+    def acceptsCriticalPointIndices(self,cp_indices):
+        if self.cp_accepted is None:
+            return True
+        for index in cp_indices:
+            if 0 <= index < len(self.cp_accepted) and not self.cp_accepted[index]:
+                return False
+        return True
+
+    # True if this filter may reject individual points
+    def filtersPoints(self):
+        return bool(self.scalar_ranges) or self.bounding_box is not None
+
+    def acceptsPosition(self,position_vector):
+        if self.bounding_box is None:
+            return True
+        low, high = self.bounding_box
+        for i in range(3):
+            if position_vector[i] < low[i] or position_vector[i] > high[i]:
+                return False
+        return True
+
+    def acceptsScalarProperties(self,scalar_properties):
+        return inRanges(scalar_properties,self.scalar_ranges)
+
+    # Vectorized form of acceptsPosition and acceptsScalarProperties for an (N,3) coordinate
+    # array and a dict of (N,) property columns (NaN where absent). Returns an (N,) bool mask.
+    def acceptsPoints(self,coordinates,scalar_properties):
+        mask = numpy.ones(len(coordinates),dtype=bool)
+        if self.bounding_box is not None:
+            low, high = self.bounding_box
+            mask &= numpy.all((coordinates >= numpy.asarray(low)) & (coordinates <= numpy.asarray(high)),axis=1)
+        for key, (low, high) in (self.scalar_ranges or {}).items():
+            if key not in scalar_properties:
+                mask[:] = False
+                break
+            column = scalar_properties[key]
+            mask &= ~numpy.isnan(column)
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        return mask
+
+# True if every property named in ranges is present and within its (low,high) range
+def inRanges(scalar_properties,ranges):
+    if not ranges:
+        return True
+    for key, (low, high) in ranges.items():
+        value = scalar_properties.get(key)
+        if value is None:
+            return False
+        if low is not None and value < low:
+            return False
+        if high is not None and value > high:
+            return False
+    return True
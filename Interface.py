@@ -0,0 +1,315 @@
+# Interface Python 3 Module
+# Rhorix: An interface between quantum chemical topology and the 3D graphics program Blender
+
+# The user interface of the add-on: its operators, the tool shelf panel and the import menu entry.
+# These subclass bpy types, so unlike the parsing and analysis modules this module can only be
+# imported within Blender. The add-on info and the register functions are in __init__.
+
+import bpy
+import time
+import fnmatch
+from . import BinaryTopology, Mapping, ParseTopology, RingPerception, Simplification, TiledTopology, World
+
+# Tiled binary topology files opened by ImportTopology, from which LoadTiles loads more tiles,
+# keyed by path. They are closed when another .blend file is loaded or the add-on is disabled.
+tiled_files = {}
+
+# Close the tiled files and forget them
+def closeTiledFiles():
+    for tiled_file in tiled_files.values():
+        tiled_file.close()
+    tiled_files.clear()
+
+# Handler run before a .blend file is loaded (File > New, File > Open), whose scene has none of the
+# tiles of the files opened before
+@bpy.app.handlers.persistent
+def closeTiledFilesOnLoad(dummy):
+    closeTiledFiles()
+
+# Choice of the tiles of a tiled binary topology file (see TiledTopology) to load
+tile_region_items = [('CAMERA','Camera view','Tiles in view of the scene camera, or all tiles if there is no camera'),
+                     ('CURSOR','Around cursor','Tiles within the radius of the 3D cursor'),
+                     ('ALL','All','Every tile')]
+
+# The numbers of the tiles of tiled_file in the chosen region
+def tilesInRegion(tiled_file,context,region,radius):
+    if region == 'CAMERA' and context.scene.camera is not None:
+        return tiled_file.tilesInFrustum(World.cameraFrustumPlanes(context.scene.camera,context.scene))
+    if region == 'CURSOR':
+        cursor = context.scene.cursor_location
+        return tiled_file.tilesInBox([x - radius for x in cursor],[x + radius for x in cursor])
+    return range(len(tiled_file.tiles))
+
+# Classes subclassing the Superclass bpy.types.Operator
+
+class ImportTopology(bpy.types.Operator):
+
+    bl_idname   = "rhorix.import_topology"
+    bl_label    = "Import Topology File"
+    bl_options  = {'REGISTER'}
+    filter_glob = bpy.props.StringProperty(default="*.top;*"+BinaryTopology.file_extension, options={'HIDDEN'})
+    filepath    = bpy.props.StringProperty(subtype="FILE_PATH")
+    tile_region = bpy.props.EnumProperty(name="Tiles",items=tile_region_items,default='CAMERA')
+    tile_radius = bpy.props.FloatProperty(name="Radius",default=5.0,min=0.0)
+    path_tolerance = bpy.props.FloatProperty(name="Path Tolerance",default=0.0,min=0.0,precision=4)
+    path_spacing   = bpy.props.FloatProperty(name="Path Spacing",default=0.0,min=0.0)
+    perceive_rings = bpy.props.BoolProperty(name="Perceive Rings",default=True)
+    batch_curves   = bpy.props.BoolProperty(name="Batch Curves",default=True)
+    max_ring_size  = bpy.props.IntProperty(name="Max Ring Size",default=12,min=3)
+    use_cache      = bpy.props.BoolProperty(name="Use Parse Cache",default=False)
+
+    def execute(self,context):
+        start = time.time()
+        if self.filepath.endswith(BinaryTopology.file_extension) and TiledTopology.isTiled(self.filepath):
+            # A file imported again replaces the one opened before, so its tiles are loaded once
+            if self.filepath in tiled_files:
+                tiled_files.pop(self.filepath).close()
+            tiled_file = TiledTopology.TiledTopologyFile(self.filepath)
+            tiled_files[self.filepath] = tiled_file
+            tiled_file.loadTiles(tilesInRegion(tiled_file,context,self.tile_region,self.tile_radius))
+            top = tiled_file.topology
+        elif self.filepath.endswith(BinaryTopology.file_extension):
+            top = BinaryTopology.readTopology(self.filepath)
+        else:
+            top = ParseTopology.parseTopology(self.filepath,use_cache=self.use_cache)
+        print('Parse Time ', time.time() - start)
+        for problem in top.buildIndex().problems:
+            self.report({'WARNING'},problem)
+        if self.perceive_rings:
+            start = time.time()
+            num_rings, num_cages = RingPerception.completeRingsAndCages(top,max_ring_size=self.max_ring_size)
+            if num_rings or num_cages:
+                self.report({'INFO'},'Perceived '+str(num_rings)+' rings and '+str(num_cages)+' cages')
+            print('Ring Perception Time ', time.time() - start)
+        if self.path_tolerance > 0.0:
+            start = time.time()
+            removed, total = Simplification.simplifyTopology(top,self.path_tolerance)
+            self.report({'INFO'},'Simplification removed '+str(removed)+' of '+str(total)+' gradient path points')
+            print('Simplification Time ', time.time() - start)
+        start = time.time()
+        Mapping.drawTopology(top,path_spacing=self.path_spacing,batch_curves=self.batch_curves) # further settings will go here as arguments
+        print('Mapping Time', time.time() - start)
+
+        bounds = top.computeBounds()
+        World.setup(bounds.center,bounds.radius)
+
+        return {'FINISHED'}
+
+    def invoke(self,context,event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+# Load and draw the tiles of the open tiled topology files newly within the chosen region, e.g.
+# after moving the camera
+class LoadTiles(bpy.types.Operator):
+
+    bl_idname   = "rhorix.load_tiles"
+    bl_label    = "Load Tiles"
+    tile_region = bpy.props.EnumProperty(name="Tiles",items=tile_region_items,default='CAMERA')
+    tile_radius = bpy.props.FloatProperty(name="Radius",default=5.0,min=0.0)
+    path_tolerance = bpy.props.FloatProperty(name="Path Tolerance",default=0.0,min=0.0,precision=4)
+    path_spacing   = bpy.props.FloatProperty(name="Path Spacing",default=0.0,min=0.0)
+    batch_curves   = bpy.props.BoolProperty(name="Batch Curves",default=True)
+
+    def execute(self,context):
+        for tiled_file in tiled_files.values():
+            top = tiled_file.topology
+            gradient_vector_field = tiled_file.loadTiles(tilesInRegion(tiled_file,context,self.tile_region,self.tile_radius))
+            for problem in tiled_file.indexTiles(gradient_vector_field).problems:
+                self.report({'WARNING'},problem)
+            Simplification.simplifyGradientVectorField(gradient_vector_field,self.path_tolerance)
+            Mapping.drawGradientVectorField(gradient_vector_field,
+                                            top.critical_points,
+                                            top.nuclei,
+                                            triangulate_basins=True,
+                                            triangulate_surfaces=True,
+                                            path_spacing=self.path_spacing,
+                                            batch_curves=self.batch_curves)
+        return {'FINISHED'}
+
+class RenderStereo(bpy.types.Operator):
+
+    bl_idname = "rhorix.render_stereo"
+    bl_label = "Render Stereo"
+
+    def invoke(self,context,event):
+
+        bpy.context.scene.render.use_full_sample = False
+        # These two lines set the values in the Render layers tab
+        bpy.context.scene.render.use_multiview = True
+        bpy.context.scene.render.views_format = 'STEREO_3D'
+        for object in bpy.data.objects:
+            object.select = False
+        bpy.ops.object.select_pattern(pattern="Cam")
+        # These 3 lines set the values in the camera's object data tab
+        bpy.context.object.data.stereo.convergence_mode = 'OFFAXIS'
+        bpy.context.object.data.stereo.convergence_distance = 1.95
+        bpy.context.object.data.stereo.interocular_distance = 0.06
+        # These 3 lines set the values in the render tab
+        bpy.context.scene.render.image_settings.views_format = 'STEREO_3D'
+        bpy.context.scene.render.image_settings.stereo_3d_format.display_mode = 'SIDEBYSIDE'
+        bpy.context.scene.render.image_settings.stereo_3d_format.use_sidebyside_crosseyed = True
+
+        return {'FINISHED'}
+
+class ResizeAILs(bpy.types.Operator):
+
+    bl_idname = "rhorix.resize_ails"
+    bl_label = "Resize AILs"
+
+    def invoke(self,context,event):
+        for object in bpy.data.objects:
+            object.select = False
+        bpy.ops.object.select_pattern(pattern="bond-BevelCircle")
+        return {'FINISHED'}
+
+class ResizeIASPaths(bpy.types.Operator):
+
+    bl_idname = "rhorix.resize_ias_paths"
+    bl_label = "Resize IAS Paths"
+
+    def invoke(self,context,event):
+        for object in bpy.data.objects:
+            object.select = False
+        bpy.ops.object.select_pattern(pattern="IAS-BevelCircle")
+        return {'FINISHED'}
+
+class ResizeAtomicBasins(bpy.types.Operator):
+
+    bl_idname = "rhorix.resize_atomic_basins"
+    bl_label = "Resize Atomic Basins"
+
+    def invoke(self,context,event):
+        for object in bpy.data.objects:
+            object.select = False
+        bpy.ops.object.select_pattern(pattern="Basin-BevelCircle")
+        return {'FINISHED'}
+
+class ResizeNonbondedInteractions(bpy.types.Operator):
+
+    bl_idname = "rhorix.resize_nbs"
+    bl_label = "Resize NonbondedInteractions"
+
+    def invoke(self,context,event):
+        for object in bpy.data.objects:
+            object.select = False
+        bpy.ops.object.select_pattern(pattern="non_bond-BevelCircle")
+        return {'FINISHED'}
+
+class ResizeRingLines(bpy.types.Operator):
+
+    bl_idname = "rhorix.resize_ringlines"
+    bl_label = "Resize Ring Lines"
+
+    def invoke(self,context,event):
+        for object in bpy.data.objects:
+            object.select = False
+        bpy.ops.object.select_pattern(pattern="RingSurfaces-BevelCircle")
+        return {'FINISHED'}
+
+class ToggleBCPs(bpy.types.Operator):
+
+    bl_idname = "rhorix.toggle_bcps"
+    bl_label = "Toggle BCPs"
+
+    def invoke(self,context,event):
+        for object in bpy.data.objects:
+            object.select = False
+        bcps = [obj for obj in bpy.context.scene.objects if fnmatch.fnmatchcase(obj.name, "*bcp*")]
+        for bcp in bcps:
+            if (bcp.hide == True):
+                bcp.hide = False
+                bcp.hide_render = False
+            else:
+                bcp.hide = True
+                bcp.hide_render = True
+
+        return {'FINISHED'}
+
+class ToggleRCPs(bpy.types.Operator):
+
+    bl_idname = "rhorix.toggle_rcps"
+    bl_label = "Toggle RCPs"
+
+    def invoke(self,context,event):
+        for object in bpy.data.objects:
+            object.select = False
+        rcps = [obj for obj in bpy.context.scene.objects if fnmatch.fnmatchcase(obj.name, "*rcp*")]
+        for rcp in rcps:
+            if (rcp.hide == True):
+                rcp.hide = False
+                rcp.hide_render = False
+            else:
+                rcp.hide = True
+                rcp.hide_render = True
+
+        return {'FINISHED'}
+
+class ToggleCCPs(bpy.types.Operator):
+
+    bl_idname = "rhorix.toggle_ccps"
+    bl_label = "Toggle CCPs"
+
+    def invoke(self,context,event):
+        for object in bpy.data.objects:
+            object.select = False
+        ccps = [obj for obj in bpy.context.scene.objects if fnmatch.fnmatchcase(obj.name, "*ccp*")]
+        for ccp in ccps:
+            if (ccp.hide == True):
+                ccp.hide = False
+                ccp.hide_render = False
+            else:
+                ccp.hide = True
+                ccp.hide_render = True
+
+        return {'FINISHED'}
+
+class ToggleNACPs(bpy.types.Operator):
+
+    bl_idname = "rhorix.toggle_nacps"
+    bl_label = "Toggle NACPs"
+
+    def invoke(self,context,event):
+        for object in bpy.data.objects:
+            object.select = False
+        ccps = [obj for obj in bpy.context.scene.objects if fnmatch.fnmatchcase(obj.name, "*nacp*")]
+        for ccp in ccps:
+            if (ccp.hide == True):
+                ccp.hide = False
+                ccp.hide_render = False
+            else:
+                ccp.hide = True
+                ccp.hide_render = True
+
+        return {'FINISHED'}
+
+# Classes subclassing the Superclass bpy.types.Panel
+
+class RhorixControlPanel(bpy.types.Panel):
+    
+    bl_region_type = "TOOLS"      # Appear in the toolshelf (T)
+    bl_space_type  = "VIEW_3D"    # when the 3D view
+    bl_context     = "objectmode" # is in object mode.
+    bl_category    = "Tools"      # Appear in the Create tab of the toolshelf.
+    bl_label = "RhoRix Controls"  # The title of the GUI panel
+
+    def draw(self,context):
+        uiColumn = self.layout.column(align=True)
+        uiColumn.operator("rhorix.import_topology",      text="Import Topology")
+        uiColumn.operator("rhorix.load_tiles",           text="Load Tiles")
+        uiColumn.operator("rhorix.render_stereo",        text="Render Stereo")
+        uiColumn.operator("rhorix.resize_ails",          text="Resize AILs")
+        uiColumn.operator("rhorix.resize_nbs",           text="Resize NBs")
+        uiColumn.operator("rhorix.resize_ringlines",     text="Resize Ring Lines")
+        uiColumn.operator("rhorix.resize_atomic_basins", text="Resize Basin Lines")
+        uiColumn.operator("rhorix.resize_ias_paths",     text="Resize IAS Paths")
+        uiColumn.operator("rhorix.toggle_bcps",          text="Toggle BCPs") 
+        uiColumn.operator("rhorix.toggle_rcps",          text="Toggle RCPs")
+        uiColumn.operator("rhorix.toggle_ccps",          text="Toggle CCPs")
+        uiColumn.operator("rhorix.toggle_nacps",         text="Toggle NACPs")
+
+
+# Add a menu function for the main operator by defining a new draw function
+# and adding it to an existing class (in the register function)
+def menu_function(self, context):
+    self.layout.operator(ImportTopology.bl_idname, text="Quantum Chemical Topology (.top)")
@@ -5,11 +5,17 @@
 # There are ultimately only 3 objects being drawn - spheres for points, curves for gradient paths
 # and meshes for surfaces. The remaining functions eventually call one or more of the
 # 3 functions that create these objects.
+#
+# Objects are made with the bpy.data API only, not with operators, which update the scene and
+# push undo steps on every call. They are kept off the scene as they are made, in a list made by
+# drawTopology or drawGradientVectorField and passed down as new_objects (see addObject), and
+# linked to it together, with a single scene update, when that call ends, even if it fails.
 
 import bpy
 import mathutils
+import numpy
 import time
-from . import Resources, Materials, TopologyClasses
+from . import Resources, Materials, RingPerception, Simplification, SurfaceMesh, TopologyClasses
 
 def drawTopology(topology,
                  drawNACP=True,
@@ -23,7 +29,9 @@ def drawTopology(topology,
                  cp_subsurf_render_levels=4,
                  triangulate_basins=True,
                  triangulate_surfaces=True,
-                 max_rho=0.0):
+                 max_rho=0.0,
+                 path_spacing=0.0,
+                 batch_curves=False):
 
     elementRadii     = Resources.defineRadii()
     cpMaterials      = Materials.createAllMaterials('critical_point','SURFACE')
@@ -31,36 +39,48 @@ def drawTopology(topology,
     basinMaterials   = Materials.createAllMaterials('atomic_basin','WIRE')
     Materials.createGenericMaterials()
 
-    start = time.time()
-    drawNuclei(topology.nuclei,
-               elementRadii,
-               nucleus_segments=nucleus_segments,
-               nucleus_ring_count=nucleus_ring_count,
-               nucleus_subsurf_render_levels=nucleus_subsurf_render_levels)
-
-    print('Nuclei Time ', time.time() - start)
-
-    start = time.time()
-    drawCriticalPoints(topology.critical_points,
-                       elementRadii,
-                       drawNACP=drawNACP,
-                       cp_segments=cp_segments,
-                       cp_ring_count=cp_ring_count,
-                       cp_subsurf_render_levels=cp_subsurf_render_levels)
-
-    print('CP Time ', time.time() - start)
-
-    start = time.time()
-    drawGradientVectorField(topology.gradient_vector_field,
-                            topology.critical_points,
-                            topology.nuclei,
-                            color_bonds=color_bonds,
-                            color_nonbonds=color_nonbonds,
-                            triangulate_basins=triangulate_basins,
-                            triangulate_surfaces=triangulate_surfaces,
-                            max_rho=max_rho)
-
-    print('GVF Time ', time.time() - start)
+    if topology.index is None:
+        topology.buildIndex()
+
+    new_objects = []
+    try:
+        start = time.time()
+        drawNuclei(topology.nuclei,
+                   elementRadii,
+                   nucleus_segments=nucleus_segments,
+                   nucleus_ring_count=nucleus_ring_count,
+                   nucleus_subsurf_render_levels=nucleus_subsurf_render_levels,
+                   new_objects=new_objects)
+
+        print('Nuclei Time ', time.time() - start)
+
+        start = time.time()
+        drawCriticalPoints(topology.critical_points,
+                           elementRadii,
+                           drawNACP=drawNACP,
+                           cp_segments=cp_segments,
+                           cp_ring_count=cp_ring_count,
+                           cp_subsurf_render_levels=cp_subsurf_render_levels,
+                           new_objects=new_objects)
+
+        print('CP Time ', time.time() - start)
+
+        start = time.time()
+        drawGradientVectorField(topology.gradient_vector_field,
+                                topology.critical_points,
+                                topology.nuclei,
+                                color_bonds=color_bonds,
+                                color_nonbonds=color_nonbonds,
+                                triangulate_basins=triangulate_basins,
+                                triangulate_surfaces=triangulate_surfaces,
+                                max_rho=max_rho,
+                                path_spacing=path_spacing,
+                                batch_curves=batch_curves,
+                                new_objects=new_objects)
+
+        print('GVF Time ', time.time() - start)
+    finally:
+        linkObjects(new_objects)
 
 def drawGradientVectorField(gradient_vector_field,
                             critical_points,
@@ -69,40 +89,84 @@ def drawGradientVectorField(gradient_vector_field,
                             color_nonbonds=False,
                             triangulate_basins=False,
                             triangulate_surfaces=False,
-                            max_rho=0.0):
+                            max_rho=0.0,
+                            path_spacing=0.0,
+                            batch_curves=False,
+                            new_objects=None):
+
+    # Objects are linked by the caller when it passes its own list, e.g. drawTopology
+    if new_objects is None:
+        new_objects = []
+        try:
+            drawGradientVectorField(gradient_vector_field,
+                                    critical_points,
+                                    nuclei,
+                                    color_bonds=color_bonds,
+                                    color_nonbonds=color_nonbonds,
+                                    triangulate_basins=triangulate_basins,
+                                    triangulate_surfaces=triangulate_surfaces,
+                                    max_rho=max_rho,
+                                    path_spacing=path_spacing,
+                                    batch_curves=batch_curves,
+                                    new_objects=new_objects)
+        finally:
+            linkObjects(new_objects)
+        return
+
+    # Gradient paths are gathered and drawn as one curve object per bevel and material at the end
+    batch = CurveBatch(spacing=path_spacing) if batch_curves else None
 
     drawMolecularGraph(gradient_vector_field.molecular_graph,
                        critical_points,
                        nuclei,
                        color_bonds=color_bonds,
                        color_nonbonds=color_nonbonds,
-                       weak_limit=0.025)
+                       weak_limit=0.025,
+                       path_spacing=path_spacing,
+                       batch=batch,
+                       new_objects=new_objects)
 
     drawAtomicBasins(gradient_vector_field.atomic_basins,
                      critical_points,
                      nuclei,
-                     triangulate=triangulate_basins)
+                     triangulate=triangulate_basins,
+                     path_spacing=path_spacing,
+                     batch=batch,
+                     new_objects=new_objects)
     
-    drawEnvelopes(gradient_vector_field.envelopes)
+    drawEnvelopes(gradient_vector_field.envelopes,new_objects=new_objects)
     
     drawAtomicSurfaces(gradient_vector_field.atomic_surfaces,
                        critical_points,
                        nuclei,
                        triangulate=triangulate_surfaces,
-                       max_rho=max_rho)
+                       max_rho=max_rho,
+                       path_spacing=path_spacing,
+                       batch=batch,
+                       new_objects=new_objects)
     
-    drawRingSurfaces(gradient_vector_field.ring_surfaces)
+    drawRingSurfaces(gradient_vector_field.ring_surfaces,
+                     path_spacing=path_spacing,
+                     batch=batch,
+                     critical_points=critical_points,
+                     triangulate=triangulate_surfaces,
+                     max_rho=max_rho,
+                     new_objects=new_objects)
     
-    drawRings(gradient_vector_field.rings) # note: no implementation
-    
-    drawCages(gradient_vector_field.cages) # note: no implementation
+    drawRings(gradient_vector_field.rings,critical_points,new_objects=new_objects)
+
+    drawCages(gradient_vector_field.cages,critical_points,new_objects=new_objects)
+
+    if (batch is not None):
+        batch.draw(new_objects)
 
 def drawCriticalPoints(critical_points,
                        radii,
                        drawNACP=True,
                        cp_segments=32,
                        cp_ring_count=16,
-                       cp_subsurf_render_levels=4):
+                       cp_subsurf_render_levels=4,
+                       new_objects=None):
 
     critical_point_radius_coeff = 0.25
 
@@ -119,13 +183,15 @@ def drawCriticalPoints(critical_points,
                        material_name,
                        segments=cp_segments,
                        ring_count=cp_ring_count,
-                       subsurf_render_levels=cp_subsurf_render_levels)
+                       subsurf_render_levels=cp_subsurf_render_levels,
+                       new_objects=new_objects)
 
 def drawNuclei(nuclei,
                radii,
                nucleus_segments=32,
                nucleus_ring_count=16,
-               nucleus_subsurf_render_levels=4):
+               nucleus_subsurf_render_levels=4,
+               new_objects=None):
 
     nuclear_radius_coeff = 0.25
 
@@ -141,49 +207,105 @@ def drawNuclei(nuclei,
                    material_name,
                    segments=nucleus_segments,
                    ring_count=nucleus_ring_count,
-                   subsurf_render_levels=nucleus_subsurf_render_levels)
+                   subsurf_render_levels=nucleus_subsurf_render_levels,
+                   new_objects=new_objects)
 
+# Draw a sphere as an object sharing the mesh of every sphere of the same name, tessellation and
+# material (see sphereMesh), placed at location and scaled to the radius size
 def drawSphere(name,
                location,
                size,
                material_name,
                segments=32,
                ring_count=16,
-               subsurf_render_levels=4):
-
-    """ Draw a sphere """
+               subsurf_render_levels=4,
+               new_objects=None):
+
+    sphere = bpy.data.objects.new(name,sphereMesh(name,material_name,segments,ring_count,subsurf_render_levels))
+    sphere.location = location
+    sphere.scale = (size,size,size)
+    addObject(sphere,new_objects)
+
+# The mesh of a sphere of unit radius with the given material, built once and found by its name in
+# bpy.data.meshes afterwards, so that the thousands of spheres of a large system share a handful
+# of meshes. It is a UV sphere with one level of subdivision if subsurf_render_levels is greater
+# than 1, as applying the SUBSURF modifier of each sphere used to make, but built from arrays
+# rather than with operators.
+def sphereMesh(name,material_name,segments,ring_count,subsurf_render_levels):
+
+    mesh_name = name+'-sphere-'+str(segments)+'-'+str(ring_count)+'-'+str(subsurf_render_levels)
+    if mesh_name in bpy.data.meshes:
+        return bpy.data.meshes[mesh_name]
+
+    coordinates, faces, face_sizes = uvSphere(segments,ring_count)
+    mesh = bpy.data.meshes.new(mesh_name)
+    fillMesh(mesh,coordinates,numpy.zeros((0,2),dtype=numpy.int32),faces,face_sizes)
+    mesh.update(calc_edges=True)
 
-    cpSphere = bpy.ops.mesh.primitive_uv_sphere_add(segments=segments,ring_count=ring_count,size=size,location=location)
-    bpy.context.object.name = name
-
-    bpy.context.scene.objects.active = bpy.context.object
-    bpy.context.object.data.materials.append(bpy.data.materials[material_name])
-
-    #Create and apply the subsurface modifiers for smooth rendering
     if (subsurf_render_levels > 1):
-        bpy.context.object.modifiers.new("subd", type='SUBSURF')
-        bpy.context.object.modifiers['subd'].levels=1
-        bpy.context.object.modifiers['subd'].render_levels=subsurf_render_levels
-        bpy.ops.object.modifier_apply(apply_as='DATA', modifier='subd')
+        # An object that is never linked to the scene carries the modifier while it is applied
+        unsubdivided = bpy.data.objects.new(mesh_name,mesh)
+        unsubdivided.modifiers.new("subd", type='SUBSURF')
+        unsubdivided.modifiers['subd'].levels=1
+        unsubdivided.modifiers['subd'].render_levels=subsurf_render_levels
+        subdivided = unsubdivided.to_mesh(bpy.context.scene,True,'PREVIEW')
+        bpy.data.objects.remove(unsubdivided)
+        bpy.data.meshes.remove(mesh)
+        subdivided.name = mesh_name
+        mesh = subdivided
+
+    mesh.materials.append(bpy.data.materials[material_name])
+    return mesh
+
+# Vertices and faces of a UV sphere of unit radius, as made by primitive_uv_sphere_add: a pole at
+# each end of the z axis and ring_count-1 rings of segments vertices between them, joined by
+# triangles at the poles and quads elsewhere, all facing outwards. Returns the (N,3) coordinates, the
+# vertices of every face in one flat array and the number of vertices of each face.
+def uvSphere(segments,ring_count):
+
+    polar     = numpy.pi * numpy.arange(1,ring_count) / ring_count
+    azimuthal = 2 * numpy.pi * numpy.arange(segments) / segments
+    rings = numpy.column_stack(((numpy.sin(polar)[:,None] * numpy.cos(azimuthal)).ravel(),
+                                (numpy.sin(polar)[:,None] * numpy.sin(azimuthal)).ravel(),
+                                numpy.repeat(numpy.cos(polar),segments)))
+    top    = len(rings)
+    bottom = top + 1
+    coordinates = numpy.concatenate((rings,[[0,0,1],[0,0,-1]]))
+
+    # Vertex j of ring i (from the top) is i*segments + j
+    around = numpy.arange(segments)
+    following = (around + 1) % segments
+    top_faces = numpy.column_stack((numpy.full(segments,top),around,following))
+    upper = numpy.arange(ring_count-2)[:,None] * segments
+    quads = numpy.stack((upper + following,upper + around,upper + segments + around,upper + segments + following),axis=-1).reshape(-1,4)
+    last = (ring_count-2) * segments
+    bottom_faces = numpy.column_stack((numpy.full(segments,bottom),last + following,last + around))
+
+    faces = numpy.concatenate((top_faces.ravel(),quads.ravel(),bottom_faces.ravel()))
+    face_sizes = numpy.concatenate((numpy.full(segments,3),numpy.full(len(quads),4),numpy.full(segments,3)))
+    return coordinates, faces, face_sizes
 
 def drawMolecularGraph(molecular_graph,
                        critical_points,
                        nuclei,
                        color_bonds=True,
                        color_nonbonds=True,
-                       weak_limit=0.025):
+                       weak_limit=0.025,
+                       path_spacing=0.0,
+                       batch=None,
+                       new_objects=None):
 
     bond_scale    = 0.120
     nonbond_scale = 0.050
 
-    createBevelCircle('non_bond-BevelCircle',nonbond_scale)
-    createBevelCircle('bond-BevelCircle',bond_scale)
+    createBevelCircle('non_bond-BevelCircle',nonbond_scale,new_objects)
+    createBevelCircle('bond-BevelCircle',bond_scale,new_objects)
 
     for ail in molecular_graph.atomic_interaction_lines:
         bcp = ail.getBCP(critical_points)
 
         is_weak = False
-        if 'rho' in bcp.scalar_properties:
+        if bcp is not None and 'rho' in bcp.scalar_properties:
             if bcp.scalar_properties.get('rho') < weak_limit:
                 is_weak = True
 
@@ -191,72 +313,67 @@ def drawMolecularGraph(molecular_graph,
             if (color_nonbonds == True):
                 for gradient_path in ail.gradient_paths:
                     nacp_index = gradient_path.getNuclearIndex(critical_points)
-                    element = nuclei[nacp_index].element.lower()
-                    material_name = element+'-critical_point-material'
-                    drawGradientPath(gradient_path,bpy.data.objects['bond-BevelCircle'],material_name)
+                    material_name = elementMaterialName(nuclei,nacp_index,'critical_point',default='Non-Bond-curve-material')
+                    drawGradientPath(gradient_path,bpy.data.objects['bond-BevelCircle'],material_name,spacing=path_spacing,batch=batch,new_objects=new_objects)
             else:
-                drawAtomicInteractionLine(ail,bpy.data.objects['non_bond-BevelCircle'],'Non-Bond-curve-material')
+                drawAtomicInteractionLine(ail,bpy.data.objects['non_bond-BevelCircle'],'Non-Bond-curve-material',path_spacing=path_spacing,batch=batch,new_objects=new_objects)
         else:
             if (color_bonds == True):
                 for gradient_path in ail.gradient_paths:
                     nacp_index = gradient_path.getNuclearIndex(critical_points)
-                    element = nuclei[nacp_index].element.lower()
-                    material_name = element+'-critical_point-material'
-                    drawGradientPath(gradient_path,bpy.data.objects['bond-BevelCircle'],material_name)
+                    material_name = elementMaterialName(nuclei,nacp_index,'critical_point')
+                    drawGradientPath(gradient_path,bpy.data.objects['bond-BevelCircle'],material_name,spacing=path_spacing,batch=batch,new_objects=new_objects)
             else:
-                drawAtomicInteractionLine(ail,bpy.data.objects['bond-BevelCircle'],'Bond-curve-material')
+                drawAtomicInteractionLine(ail,bpy.data.objects['bond-BevelCircle'],'Bond-curve-material',path_spacing=path_spacing,batch=batch,new_objects=new_objects)
 
-def drawAtomicInteractionLine(atomic_interaction_line,bevel,material_name):
+def drawAtomicInteractionLine(atomic_interaction_line,bevel,material_name,path_spacing=0.0,batch=None,new_objects=None):
 
     for gradient_path in atomic_interaction_line.gradient_paths:
-        drawGradientPath(gradient_path,bevel,material_name) 
+        drawGradientPath(gradient_path,bevel,material_name,spacing=path_spacing,batch=batch,new_objects=new_objects)
 
-def drawAtomicBasins(atomic_basins,critical_points,nuclei,triangulate=False):
+def drawAtomicBasins(atomic_basins,critical_points,nuclei,triangulate=False,path_spacing=0.0,batch=None,new_objects=None):
 
     basin_path_scale = 0.01
 
     bevel_name = 'Basin-BevelCircle'
-    createBevelCircle(bevel_name,basin_path_scale)
+    createBevelCircle(bevel_name,basin_path_scale,new_objects)
 
     for atomic_basin in atomic_basins:
         nacp_index = atomic_basin.getNuclearAttractorCriticalPointIndex(critical_points)
-        element = nuclei[nacp_index].element.lower()
-        material_name = element+'-atomic_basin-material'
+        material_name = elementMaterialName(nuclei,nacp_index,'atomic_basin')
 
         if (triangulate == True):
 
-            surface_edges  = []
-            surface_faces  = []
-            surface_points = []
+            coordinates = [gradient_path.getCoordinates() for gradient_path in atomic_basin.gradient_paths]
+            surface_points = numpy.concatenate(coordinates) if coordinates else numpy.zeros((0,3))
 
-            index = 0
-            for gradient_path in atomic_basin.gradient_paths:
-                for i, point in enumerate(gradient_path.points):
-                    surface_points.append(point)
-                    if (i < len(gradient_path.points)-1): # ignore last point
-                        surface_edges.append(TopologyClasses.Edge(index,index+1))
-                    index += 1
+            # join each point to the next on the same path, so not the last point of each path
+            not_last = numpy.ones(max(len(surface_points)-1,0),dtype=bool)
+            last = numpy.cumsum([len(path_coordinates) for path_coordinates in coordinates],dtype=numpy.int64) - 1
+            not_last[last[(last >= 0) & (last < len(not_last))]] = False
+            starts = numpy.flatnonzero(not_last)
+            surface_edges = numpy.column_stack((starts,starts+1))
 
-            surface_triangulation = TopologyClasses.Triangulation(surface_points,surface_edges,surface_faces)
-            drawMesh(surface_triangulation,material_name)
+            surface_triangulation = TopologyClasses.ColumnarTriangulation(surface_points,{},surface_edges,[])
+            drawMesh(surface_triangulation,material_name,new_objects=new_objects)
 
         else:
             for gradient_path in atomic_basin.gradient_paths:
-                drawGradientPath(gradient_path,bpy.data.objects[bevel_name],material_name)
+                drawGradientPath(gradient_path,bpy.data.objects[bevel_name],material_name,spacing=path_spacing,batch=batch,new_objects=new_objects)
 
-def drawEnvelopes(envelopes):
+def drawEnvelopes(envelopes,new_objects=None):
     for envelope in envelopes:
         if (not envelope.triangulation):
             print("drawEnvelopes: Auto-triangulation be implemented")
         else:
-            drawMesh(envelope.triangulation,'Bond-curve-material')
+            drawMesh(envelope.triangulation,'Bond-curve-material',new_objects=new_objects)
 
-def drawAtomicSurfaces(atomic_surfaces,critical_points,nuclei,triangulate=False,max_rho=0.0000):
+def drawAtomicSurfaces(atomic_surfaces,critical_points,nuclei,triangulate=False,max_rho=0.0000,path_spacing=0.0,batch=None,new_objects=None):
 
     ias_path_scale = 0.005
 
     bevel_name = 'IAS-BevelCircle'
-    createBevelCircle(bevel_name,ias_path_scale)
+    createBevelCircle(bevel_name,ias_path_scale,new_objects)
 
     for atomic_surface in atomic_surfaces:
         for interatomic_surface in atomic_surface.interatomic_surfaces:
@@ -264,133 +381,241 @@ def drawAtomicSurfaces(atomic_surfaces,critical_points,nuclei,triangulate=False,
 
                 if (triangulate == True):
 
-                    surface_edges  = []
-                    surface_faces  = []
-                    surface_points = []
-
-                    material_name = 'Bond-curve-material'
-
-                    for gradient_path in interatomic_surface.gradient_paths:
-                        nacp_index = gradient_path.getNuclearIndex(critical_points)
-                        element = nuclei[nacp_index].element.lower()
-                        material_name = element+'-interatomic_surface-material'
-                        for point in gradient_path.points:
-                            if (point.scalar_properties.get('rho') > max_rho):
-                                surface_points.append(point)
-
-                    index = 0
-                    num_paths = len(interatomic_surface.gradient_paths)
-                    for j, gradient_path in enumerate(interatomic_surface.gradient_paths):
-
-                        num_points_on_path = len(gradient_path.points)
-
-                        if (j < num_paths-1):
-                            n_points_on_next_path = len(interatomic_surface.gradient_paths[j+1].points)
-                            surface_edges.append(TopologyClasses.Edge(index+num_points_on_path-1,index+num_points_on_path+n_points_on_next_path-1))
-                        else:
-                            n_points_on_next_path = len(interatomic_surface.gradient_paths[0].points)
-                            surface_edges.append(TopologyClasses.Edge(index+num_points_on_path-1,n_points_on_next_path-1))
-
-                        # walk along the path point by point
-                        for i, point in enumerate(gradient_path.points): # [:-1]
-
-                            # make all connections along each gradient path
-                            if (i < num_points_on_path-1): # ignore last point
-                                surface_edges.append(TopologyClasses.Edge(index,index+1))
-
-                            # make connections between neighbouring gradient paths
-                            if (i > 0 and j < num_paths-1):
-                                if (i < n_points_on_next_path-1):
-                                    surface_edges.append(TopologyClasses.Edge(index,index+num_points_on_path))                             
-                                
-                            elif (i > 0 and j == num_paths-1):
-                                if (i < num_points_on_path-1):
-                                    surface_edges.append(TopologyClasses.Edge(index,i))
-
-                            index += 1
-
-                    surface_triangulation = TopologyClasses.Triangulation(surface_points,surface_edges,surface_faces)
-                    drawMesh(surface_triangulation,material_name)
+                    # a mesh of strips between neighbouring paths, from the BCP outwards
+                    bcp = interatomic_surface.getBondCriticalPoint(critical_points)
+                    surface_triangulation = SurfaceMesh.gradientPathSurface(interatomic_surface.gradient_paths,
+                                                                            centre=None if bcp is None else bcp.position_vector,
+                                                                            max_rho=max_rho)
+                    if (surface_triangulation is not None):
+                        # coloured by the nucleus of its paths, as when drawn as curves
+                        nacp_indices = (gradient_path.getNuclearIndex(critical_points) for gradient_path in interatomic_surface.gradient_paths)
+                        nacp_index = next((index for index in nacp_indices if index is not None),atomic_surface.nacp_index)
+                        material_name = elementMaterialName(nuclei,nacp_index,'interatomic_surface')
+                        drawMesh(surface_triangulation,material_name,new_objects=new_objects)
 
                 else:
 
                     for gradient_path in interatomic_surface.gradient_paths:
                         nacp_index = gradient_path.getNuclearIndex(critical_points)
-                        element = nuclei[nacp_index].element.lower()
-                        material_name = element+'-interatomic_surface-material'
-                        drawGradientPath(gradient_path,bpy.data.objects['IAS-BevelCircle'],material_name)
+                        material_name = elementMaterialName(nuclei,nacp_index,'interatomic_surface')
+                        drawGradientPath(gradient_path,bpy.data.objects['IAS-BevelCircle'],material_name,spacing=path_spacing,batch=batch,new_objects=new_objects)
 
             else:
-                element = nuclei[atomic_surface.nacp_index].element.lower()
-                material_name = element+'-interatomic_surface-material'
-                drawMesh(interatomic_surface.triangulation,material_name)
+                material_name = elementMaterialName(nuclei,atomic_surface.nacp_index,'interatomic_surface')
+                drawMesh(interatomic_surface.triangulation,material_name,new_objects=new_objects)
+
+# Name of the material of the given kind for the element of the nucleus of a NACP, or default if
+# there is no such nucleus (such missing references are reported by TopologyClasses.TopologyIndex)
+def elementMaterialName(nuclei,nacp_index,kind,default='Bond-curve-material'):
+    if nacp_index is None or not 0 <= nacp_index < len(nuclei):
+        return default
+    return nuclei[nacp_index].element.lower()+'-'+kind+'-material'
 
-def drawRingSurfaces(ring_surfaces,material_name='Ring-Path-curve-material'):
+# Ring surfaces are drawn as their paths, or if triangulate is True as a mesh of strips between
+# neighbouring paths, ordered by angle around the RCP (see SurfaceMesh)
+def drawRingSurfaces(ring_surfaces,material_name='Ring-Path-curve-material',path_spacing=0.0,batch=None,
+                     critical_points=None,triangulate=False,max_rho=0.0,mesh_material_name='Ring-surface-material',new_objects=None):
 
     ring_path_scale = 0.1
 
-    createBevelCircle('RingSurfaces-BevelCircle',ring_path_scale)
+    createBevelCircle('RingSurfaces-BevelCircle',ring_path_scale,new_objects)
 
     for ring_surface in ring_surfaces:
+        if (triangulate == True and critical_points is not None and ring_surface.rcp_index is not None):
+            surface_triangulation = SurfaceMesh.gradientPathSurface(ring_surface.gradient_paths,
+                                                                    centre=critical_points[ring_surface.rcp_index].position_vector,
+                                                                    max_rho=max_rho,
+                                                                    sort_by_angle=True)
+            if (surface_triangulation is not None):
+                drawMesh(surface_triangulation,mesh_material_name,new_objects=new_objects)
+                continue
         for gradient_path in ring_surface.gradient_paths:
-            drawGradientPath(gradient_path,bpy.data.objects['RingSurfaces-BevelCircle'],material_name)
+            drawGradientPath(gradient_path,bpy.data.objects['RingSurfaces-BevelCircle'],material_name,spacing=path_spacing,batch=batch,new_objects=new_objects)
 
-def drawMesh(triangulation,material_name):
+def drawMesh(triangulation,material_name,new_objects=None):
 
     newMesh = bpy.data.meshes.new('SURFACE')
-    coords = []
-    for point in triangulation.points:
-        vec = mathutils.Vector(point.position_vector)
-        coords.append(vec)
+    faces = triangulation.getFaceIndices()
 
-    if (not triangulation.face_objects):
-        newMesh.from_pydata(coords,triangulation.edge_arrays,[])
+    if (len(faces) == 0):
+        fillMesh(newMesh,triangulation.getCoordinates(),triangulation.getEdgeIndices(),faces)
     else:
-        newMesh.from_pydata(coords,[],triangulation.face_arrays)
+        # the edges are calculated from the faces
+        fillMesh(newMesh,triangulation.getCoordinates(),numpy.zeros((0,2),dtype=numpy.int32),faces)
 
-    newMesh.update()
+    newMesh.update(calc_edges=len(faces) > 0)
     newObj = bpy.data.objects.new('SURFACE',newMesh)
     newObj.data.materials.append(bpy.data.materials[material_name])
-    bpy.context.scene.objects.link(newObj)
-
-def drawGradientPath(gradient_path,bevel,material_name):
+    addObject(newObj,new_objects)
+
+# Fill an empty mesh with vertices, edges and triangles from (N,3), (E,2) and (F,3) arrays. Each is
+# passed to foreach_set as one flat array of the type Blender stores (float32 coordinates, int32
+# indices), which is copied as a buffer, rather than as the nested lists of from_pydata, which
+# also sets each polygon in a Python loop. Faces of other sizes may be given as a flat array of
+# the vertices of every face with the number of vertices of each face in face_sizes.
+def fillMesh(mesh,coordinates,edges,faces,face_sizes=None):
+
+    faces = numpy.ascontiguousarray(faces,dtype=numpy.int32)
+    if (face_sizes is None):
+        face_sizes = numpy.full(len(faces),3,dtype=numpy.int32)
+    face_sizes = numpy.asarray(face_sizes,dtype=numpy.int32)
+
+    mesh.vertices.add(len(coordinates))
+    mesh.vertices.foreach_set('co',numpy.ascontiguousarray(coordinates,dtype=numpy.float32).ravel())
+
+    mesh.edges.add(len(edges))
+    mesh.edges.foreach_set('vertices',numpy.ascontiguousarray(edges,dtype=numpy.int32).ravel())
+
+    mesh.loops.add(faces.size)
+    mesh.loops.foreach_set('vertex_index',faces.ravel())
+    mesh.polygons.add(len(face_sizes))
+    mesh.polygons.foreach_set('loop_start',(numpy.cumsum(face_sizes) - face_sizes).astype(numpy.int32))
+    mesh.polygons.foreach_set('loop_total',face_sizes)
+
+# Draw a gradient path as a curve. If spacing (in bohr) is greater than zero, the path is resampled
+# evenly by arc length and drawn as a smooth Bezier spline through the samples, otherwise as a
+# polyline through every point of the path. If batch is given, the path is added to it instead, to
+# be drawn with the other paths of the same bevel and material (see CurveBatch).
+def drawGradientPath(gradient_path,bevel,material_name,spacing=0.0,batch=None,new_objects=None):
+
+    if (batch is not None):
+        batch.add(gradient_path,bevel,material_name)
+        return
+
+    curveData = createCurveObject('ObjCurve',bevel,material_name,new_objects)
+    addSpline(curveData,gradient_path.getCoordinates(),spacing)
+
+# Gradient paths gathered to be drawn as one curve object with a spline per path for each bevel
+# object and material, rather than an object per path, so that a large system makes tens of
+# objects rather than tens of thousands. Paths are added by drawGradientPath and the curves are
+# created by draw, once everything has been added.
+class CurveBatch():
+
+    __slots__ = ('spacing','paths')
+
+    def __init__(self,spacing=0.0):
+        self.spacing = spacing
+        self.paths   = {} # (bevel name,material_name) -> list of coordinate arrays
+
+    def add(self,gradient_path,bevel,material_name):
+        self.paths.setdefault((bevel.name,material_name),[]).append(gradient_path.getCoordinates())
+
+    def draw(self,new_objects=None):
+        for (bevel_name,material_name), paths in self.paths.items():
+            curveData = createCurveObject('ObjCurves',bpy.data.objects[bevel_name],material_name,new_objects)
+            for cList in paths:
+                addSpline(curveData,cList,self.spacing)
+        self.paths = {}
+
+# New curve datablock linked to the scene by a new object, with the given bevel and material
+def createCurveObject(name,bevel,material_name,new_objects=None):
 
-    weight = 1
-    cList = gradient_path.points
     curveData = bpy.data.curves.new(name='curve',type='CURVE')
     curveData.dimensions = '3D'
 
-    objectData = bpy.data.objects.new('ObjCurve',curveData)
+    objectData = bpy.data.objects.new(name,curveData)
     objectData.location = (0,0,0)
     objectData.data.materials.append(bpy.data.materials[material_name])
     objectData.data.bevel_object = bevel
-    bpy.context.scene.objects.link(objectData)
-
-    polyLine = curveData.splines.new('POLY')
-    polyLine.points.add(len(cList)-1)
-    for num in range(len(cList)):
-        x,y,z = cList[num].position_vector
-        polyLine.points[num].co = (x,y,z,weight)
-
-def createBevelCircle(name,scale):
-
-    bpy.ops.curve.primitive_bezier_circle_add()
-    bpy.context.scene.objects.active = bpy.data.objects['BezierCircle']
-    bpy.context.object.name = name
-    bpy.context.object.hide_render = True
-    bpy.ops.transform.resize(value=(scale,scale,scale))
+    addObject(objectData,new_objects)
+    return curveData
 
-def drawRings(rings):
-    print("drawRings: To be implemented")
+# Add a spline through an (N,3) array of points to a curve, as drawGradientPath describes. The
+# points and handles are set with foreach_set from flat float32 arrays rather than point by point.
+def addSpline(curveData,cList,spacing=0.0):
 
-def drawRing(ring):
-    for atomic_interaction_line in ring.atomic_interaction_lines:
-        drawAtomicInteractionLine(atomic_interaction_line)
-
-def drawCages(cages):
-    print("drawCages: To be implemented")
+    weight = 1
 
-def drawCage(cage):
-    for ring in cage.rings:
-        drawRing(ring)
+    if (spacing > 0):
+        samples = Simplification.resamplePolyline(cList,spacing)
+        left_handles, right_handles = Simplification.bezierHandles(samples)
+        bezierCurve = curveData.splines.new('BEZIER')
+        bezierCurve.bezier_points.add(len(samples)-1)
+        # Handle types cannot be set in bulk, but new points have FREE handles
+        ends = (bezierCurve.bezier_points[0],bezierCurve.bezier_points[-1])
+        if any(bezier_point.handle_left_type != 'FREE' or bezier_point.handle_right_type != 'FREE' for bezier_point in ends):
+            for bezier_point in bezierCurve.bezier_points:
+                bezier_point.handle_left_type  = 'FREE'
+                bezier_point.handle_right_type = 'FREE'
+        bezierCurve.bezier_points.foreach_set('co',samples.astype(numpy.float32).ravel())
+        bezierCurve.bezier_points.foreach_set('handle_left',left_handles.astype(numpy.float32).ravel())
+        bezierCurve.bezier_points.foreach_set('handle_right',right_handles.astype(numpy.float32).ravel())
+        return
 
+    polyLine = curveData.splines.new('POLY')
+    polyLine.points.add(len(cList)-1)
+    # Poly points are (x,y,z,weight)
+    co = numpy.empty((len(cList),4),dtype=numpy.float32)
+    co[:,:3] = cList
+    co[:,3]  = weight
+    polyLine.points.foreach_set('co',co.ravel())
+
+# Bezier circle of radius scale, as made by primitive_bezier_circle_add and resized, to be the
+# bevel object of curves. Its handles are set to make a circle rather than calculated.
+def createBevelCircle(name,scale,new_objects=None):
+
+    # Keep the bevel object of an earlier import or tile load, which may have been resized
+    if name in bpy.data.objects:
+        return
+
+    # Points are clockwise from (-1,0,0), each handle a quarter circle's kappa from its point
+    kappa = 4 * (2**0.5 - 1) / 3
+    co = numpy.array([(-1,0,0),(0,1,0),(1,0,0),(0,-1,0)],dtype=numpy.float32)
+    tangents = numpy.array([(0,1,0),(1,0,0),(0,-1,0),(-1,0,0)],dtype=numpy.float32) * kappa
+
+    curveData = bpy.data.curves.new(name=name,type='CURVE')
+    curveData.dimensions = '3D'
+    circle = curveData.splines.new('BEZIER')
+    circle.bezier_points.add(3)
+    for bezier_point in circle.bezier_points:
+        bezier_point.handle_left_type  = 'ALIGN'
+        bezier_point.handle_right_type = 'ALIGN'
+    circle.bezier_points.foreach_set('co',co.ravel())
+    circle.bezier_points.foreach_set('handle_left',(co - tangents).ravel())
+    circle.bezier_points.foreach_set('handle_right',(co + tangents).ravel())
+    circle.use_cyclic_u = True
+
+    bevel = bpy.data.objects.new(name,curveData)
+    bevel.scale = (scale,scale,scale)
+    bevel.hide_render = True
+    addObject(bevel,new_objects)
+
+# Keep a new object in new_objects, to be linked to the scene by linkObjects, or link it now when
+# there is no list. Objects can be found in bpy.data.objects, e.g. bevel objects by name, before
+# they are linked.
+def addObject(newObj,new_objects=None):
+    if new_objects is None:
+        bpy.context.scene.objects.link(newObj)
+    else:
+        new_objects.append(newObj)
+
+# Link the objects kept in new_objects to the scene, update it once and empty the list
+def linkObjects(new_objects):
+    if not new_objects:
+        return
+    scene = bpy.context.scene
+    for newObj in new_objects:
+        scene.objects.link(newObj)
+    del new_objects[:]
+    scene.update()
+
+def drawRings(rings,critical_points,material_name='Ring-surface-material',new_objects=None):
+    for ring in rings:
+        drawRing(ring,critical_points,material_name,new_objects)
+
+# A ring is drawn as a surface spanning the paths of its AILs, which are drawn with the molecular
+# graph, so that it stands out from the bonds around it
+def drawRing(ring,critical_points,material_name='Ring-surface-material',new_objects=None):
+    surface = RingPerception.ringSurface(ring,critical_points)
+    if (surface is not None):
+        drawMesh(surface,material_name,new_objects=new_objects)
+
+def drawCages(cages,critical_points,material_name='Cage-surface-material',new_objects=None):
+    for cage in cages:
+        drawCage(cage,critical_points,material_name,new_objects)
+
+# A cage is drawn as one mesh of the surfaces of its rings
+def drawCage(cage,critical_points,material_name='Cage-surface-material',new_objects=None):
+    surface = RingPerception.cageSurface(cage,critical_points)
+    if (surface is not None):
+        drawMesh(surface,material_name,new_objects=new_objects)
@@ -49,6 +49,8 @@ def createGenericMaterials():
     createMaterial((0.04,0.04,0.04),'SURFACE',1.0,'Bond','curve')
     createMaterial((0.4,0.4,0.4),'SURFACE',1.0,'Non-Bond','curve')
     createMaterial((0.2,0.2,0.2),'SURFACE',1.0,'Ring-Path','curve')
+    createMaterial((0.0,0.0,1.0),'SURFACE',0.5,'Ring','surface')
+    createMaterial((0.0,1.0,0.0),'SURFACE',0.3,'Cage','surface')
 
 def createAllMaterials(suffix,material_type):
 
@@ -71,5 +73,6 @@ def createMaterial(color,type,alpha,prefix,suffix):
     mat.specular_shader = 'COOKTORR'
     mat.specular_intensity = 0.5
     mat.alpha = alpha
+    mat.use_transparency = alpha < 1.0
     mat.ambient = 1
     mat.type = type
@@ -0,0 +1,184 @@
+# ParseCache Python 3 Module
+# Rhorix: An interface between quantum chemical topology and the 3D graphics program Blender
+
+# Parsing a large .top file is by far the slowest stage of an import, and the same file is
+# often opened many times while adjusting render settings. This module keeps pickled snapshots
+# of parsed Topology objects in a local cache directory, keyed by the content of the .top file
+# and the parser version/options, so that re-opening an unchanged file skips the XML parse.
+# The cache is only used when asked for (ParseTopology.parseTopology(use_cache=True)). It is
+# bounded in size and the least recently used snapshots are evicted first; a snapshot larger than
+# the cap is abandoned while it is written, without being held in memory. The digest index keeps
+# at most max_index_entries files, dropping those hashed longest ago.
+# Snapshots are only ever read from the user's own cache directory; never point the cache
+# at a directory writable by others, as unpickling untrusted data is unsafe.
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+
+cache_directory = os.environ.get('RHORIX_CACHE_DIR',os.path.join(os.path.expanduser('~'),'.cache','rhorix'))
+max_cache_bytes = 2 * 1024 * 1024 * 1024
+max_index_entries = 1000
+
+snapshot_suffix = '.pickle'
+index_name      = 'index.json'
+
+# Change the location and/or size cap (in bytes) of the cache
+def configure(directory=None,max_bytes=None):
+    global cache_directory, max_cache_bytes
+    if directory is not None:
+        cache_directory = directory
+    if max_bytes is not None:
+        max_cache_bytes = max_bytes
+    evict()
+
+# Return the topology parsed from filepath, either from a cached snapshot or by calling parse()
+# options must identify everything besides the file content that changes the parsed result
+def loadTopology(filepath,parse,options=()):
+
+    key = computeKey(filepath,options)
+    if key is None:
+        return parse()
+
+    snapshot_path = os.path.join(cache_directory,key+snapshot_suffix)
+    try:
+        with open(snapshot_path,'rb') as snapshot:
+            topology = pickle.load(snapshot)
+        os.utime(snapshot_path) # mark as recently used
+        return topology
+    except (OSError,EOFError,pickle.UnpicklingError,ImportError,AttributeError):
+        pass
+
+    topology = parse()
+    storeTopology(snapshot_path,topology)
+    return topology
+
+# Write a snapshot atomically, then evict old snapshots if the cache is over its cap
+# The topology is pickled straight to a temporary file, which is removed if it grows over the cap
+def storeTopology(snapshot_path,topology):
+    try:
+        os.makedirs(cache_directory,exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=cache_directory)
+    except OSError:
+        return
+    try:
+        with os.fdopen(handle,'wb') as snapshot:
+            pickle.dump(topology,BoundedWriter(snapshot,max_cache_bytes),protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path,snapshot_path)
+    except (OSError,SnapshotTooLarge):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return
+    evict()
+
+class SnapshotTooLarge(Exception):
+    pass
+
+# File-like object passing writes on to a file until more than max_bytes have been written
+class BoundedWriter():
+
+    def __init__(self,output,max_bytes):
+        self.output    = output
+        self.remaining = max_bytes
+
+    def write(self,data):
+        self.remaining -= memoryview(data).nbytes
+        if self.remaining < 0:
+            raise SnapshotTooLarge()
+        return self.output.write(data)
+
+# Remove least recently used snapshots until the cache is within its size cap
+def evict():
+
+    snapshots = []
+    try:
+        for entry in os.scandir(cache_directory):
+            if entry.name.endswith(snapshot_suffix):
+                stat = entry.stat()
+                snapshots.append((stat.st_mtime,stat.st_size,entry.path))
+    except OSError:
+        return
+
+    total = sum(size for mtime, size, path in snapshots)
+    for mtime, size, path in sorted(snapshots):
+        if total <= max_cache_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+# Remove every snapshot and the digest index
+def clear():
+    try:
+        for entry in os.scandir(cache_directory):
+            if entry.name.endswith(snapshot_suffix) or entry.name == index_name:
+                os.remove(entry.path)
+    except OSError:
+        pass
+
+# The cache key combines the content digest of the file with the parse options
+def computeKey(filepath,options):
+    digest = computeDigest(filepath)
+    if digest is None:
+        return None
+    key = hashlib.sha1(digest.encode('ascii'))
+    key.update(repr(tuple(options)).encode('utf-8'))
+    return key.hexdigest()
+
+# Hashing the file content is much cheaper than parsing it, but is still avoided when the
+# path, size and modification time match an entry of the digest index
+def computeDigest(filepath):
+
+    try:
+        path = os.path.realpath(filepath)
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    index = readIndex()
+    entry = index.get(path)
+    if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+        return entry[2]
+
+    content_hash = hashlib.sha1()
+    try:
+        with open(path,'rb') as topology_file:
+            for chunk in iter(lambda: topology_file.read(1 << 20),b''):
+                content_hash.update(chunk)
+    except OSError:
+        return None
+    digest = str(stat.st_size) + '-' + content_hash.hexdigest()
+
+    index[path] = [stat.st_size,stat.st_mtime_ns,digest,time.time()]
+    writeIndex(index)
+    return digest
+
+def readIndex():
+    try:
+        with open(os.path.join(cache_directory,index_name),'r') as index_file:
+            return json.load(index_file)
+    except (OSError,ValueError):
+        return {}
+
+# Entries are [size, modification time, digest, time hashed]; beyond max_index_entries, those
+# hashed longest ago are dropped
+def writeIndex(index):
+    if len(index) > max_index_entries:
+        paths = sorted(index,key=lambda path: index[path][3] if len(index[path]) > 3 else 0.0)
+        for path in paths[:len(index)-max_index_entries]:
+            del index[path]
+    try:
+        os.makedirs(cache_directory,exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=cache_directory)
+        with os.fdopen(handle,'w') as index_file:
+            json.dump(index,index_file)
+        os.replace(temp_path,os.path.join(cache_directory,index_name))
+    except OSError:
+        pass
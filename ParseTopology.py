@@ -4,18 +4,77 @@
 # Rhorix uses the ElementTree API, a simple and lightweight XML parser included in Python 3.
 # Please be aware of XML vulnerabilities! https://docs.python.org/3/library/xml.html#xml-vulnerabilities
 import xml.etree.ElementTree as ET
-from . import TopologyClasses
+import functools
+import mmap
+import multiprocessing
+import os
+import re
+import sys
+import numpy
+from . import TopologyClasses, ParseCache, Validation
+
+# Increment whenever a change to this module or TopologyClasses alters the parsed objects,
+# so that snapshots written by ParseCache for an older parser are not reused
+PARSER_VERSION = 6
 
 # The following functions are all required for complete parsing of a Topology file
 
 # Function reads XML file matching Topology.dtd and returns Topology object
-def parseTopology(filepath):
+# If columnar is True, gradient paths and triangulations are stored as NumPy arrays
+# (see TopologyClasses.ColumnarGradientPath) rather than lists of Point objects
+# If use_cache is True, a snapshot of an earlier parse of the same file content is
+# loaded from the ParseCache directory when available, and one is stored otherwise
+# If processes is not 1, the gradient vector field is parsed in parallel by parseTopologyParallel,
+# by all CPUs if it is None or 0
+# If topology_filter (a Filters.TopologyFilter) is given, only the objects it accepts are parsed
+# parser selects the single process parser: 'etree' (ElementTree) or 'scan' (parseTopologyScan)
+# If validate is True, the element tree read by the etree parser is checked against Topology.dtd
+# before it is converted (see Validation), raising Validation.TopologyValidationError if it is
+# invalid. The scan and parallel parsers build no such tree, so validate may not be combined
+# with them; parseTopologyStreaming and iterTopology validate as they stream instead.
+# precision is the dtype of the arrays of columnar objects, 'float64' or 'float32' to halve their
+# memory (see TopologyClasses.convertPrecision); objects made of Points are unaffected
+def parseTopology(filepath,columnar=False,use_cache=False,processes=1,topology_filter=None,parser='etree',validate=False,precision='float64'):
+
+    if use_cache == True:
+        filter_key = None if topology_filter is None else topology_filter.key()
+        return ParseCache.loadTopology(filepath,
+                                       lambda: parseTopology(filepath,columnar=columnar,use_cache=False,processes=processes,topology_filter=topology_filter,parser=parser,validate=validate,precision=precision),
+                                       options=(PARSER_VERSION,columnar,filter_key,validate,precision))
+
+    if precision != 'float64':
+        topology = parseTopology(filepath,columnar=columnar,use_cache=False,processes=processes,topology_filter=topology_filter,parser=parser,validate=validate)
+        TopologyClasses.convertPrecision(topology,precision)
+        return topology
+
+    if validate == True and (processes != 1 or parser != 'etree'):
+        raise ValueError('validate is only supported by the etree parser in a single process')
+
+    if processes != 1:
+        return parseTopologyParallel(filepath,columnar=columnar,processes=processes,topology_filter=topology_filter)
+
+    if parser == 'scan':
+        return parseTopologyScan(filepath,columnar=columnar,topology_filter=topology_filter)
 
     # Call the parse method of ElementTree to read filepath from disk
     topologyTree = ET.parse(filepath) # ElementTree object - whole document as a single tree
-    # Validate the topologyTree using the Topology.dtd document model
     # Get a reference to the root element
     topologyRoot = topologyTree.getroot() # Element object (has tag and dict 'attrib') - single node of tree
+    # Validate the topologyTree using the Topology.dtd document model
+    if validate == True:
+        Validation.TopologyValidator().validate(topologyRoot)
+
+    name, nuclei, critical_points = parseTopologyHeader(topologyRoot)
+    if topology_filter is not None:
+        topology_filter = topology_filter.bind(nuclei,critical_points)
+
+    # Finally read the objects of the gradient vector field
+    gradient_vector_field = parseGradientVectorField(topologyRoot.find('GradientVectorField'),columnar=columnar,topology_filter=topology_filter)
+
+    return TopologyClasses.Topology(name,nuclei,critical_points,gradient_vector_field)
+
+# Read the name, nuclei and critical points from the root element of a Topology document
+def parseTopologyHeader(topologyRoot):
 
     name = topologyRoot.find('SystemName').text
     # As some CPs carry references to nuclei, read these first
@@ -28,11 +87,575 @@ def parseTopology(filepath):
     for cp in topologyRoot.findall('CriticalPoint'):
          critical_points.insert(parseCriticalPointIndex(cp),parseCriticalPoint(cp))
 
-    # Finally read the objects of the gradient vector field
-    gradient_vector_field = parseGradientVectorField(topologyRoot.find('GradientVectorField'))
+    return name, nuclei, critical_points
+
+# Start and end tags of the children of GradientVectorField, whose subtrees are independent
+# Ring also appears inside Cage, so nesting depth is tracked when scanning for these
+sectionTagPattern = re.compile(rb'<(/?)(GradientVectorField|MolecularGraph|AtomicBasin|Envelope|AtomicSurface|RingSurface|Ring|Cage)\b[^>]*?(/?)>')
+
+# Function reads XML file matching Topology.dtd using a pool of processes and returns Topology object
+# The raw bytes of the file are scanned for the boundaries of the top-level children of the
+# GradientVectorField element. Consecutive children are grouped into chunks of similar size, each
+# chunk is parsed by a worker process and the partial results are merged in document order.
+# The nuclei and critical points preceding the gradient vector field are parsed in this process.
+# processes defaults to the number of CPUs, as does 0, and may not be negative. Results are returned
+# to this process by pickling, which is much cheaper for columnar=True topologies.
+def parseTopologyParallel(filepath,columnar=False,processes=None,topology_filter=None):
+
+    if processes is None or processes == 0:
+        processes = os.cpu_count() or 1
+    elif processes < 0:
+        raise ValueError('Number of processes must not be negative, found '+str(processes))
+
+    header, sections = scanTopology(filepath)
+    name, nuclei, critical_points = parseTopologyHeader(ET.fromstring(header))
+    if topology_filter is not None:
+        topology_filter = topology_filter.bind(nuclei,critical_points)
+
+    chunks = []
+    if sections:
+        target = (sections[-1][2] - sections[0][1]) / (4 * processes)
+        chunk_start = sections[0][1]
+        for tag, start, end in sections:
+            if end - chunk_start >= target:
+                chunks.append((filepath,chunk_start,end,columnar,topology_filter))
+                chunk_start = end
+        if chunk_start < sections[-1][2]:
+            chunks.append((filepath,chunk_start,sections[-1][2],columnar,topology_filter))
 
+    if processes > 1 and len(chunks) > 1:
+        # Fork where available so that workers inherit this package without re-importing it
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+        with context.Pool(min(processes,len(chunks))) as pool:
+            results = pool.starmap(parseGradientVectorFieldChunk,chunks)
+    else:
+        results = [parseGradientVectorFieldChunk(*chunk) for chunk in chunks]
+
+    gradient_vector_field = TopologyClasses.GradientVectorField(TopologyClasses.MolecularGraph([]),[],[],[],[],[],[])
+    for result in results:
+        gradient_vector_field.molecular_graph.atomic_interaction_lines.extend(result.molecular_graph.atomic_interaction_lines)
+        gradient_vector_field.atomic_basins.extend(result.atomic_basins)
+        gradient_vector_field.envelopes.extend(result.envelopes)
+        gradient_vector_field.atomic_surfaces.extend(result.atomic_surfaces)
+        gradient_vector_field.ring_surfaces.extend(result.ring_surfaces)
+        gradient_vector_field.rings.extend(result.rings)
+        gradient_vector_field.cages.extend(result.cages)
+    TopologyClasses.shareRepeatedObjects(gradient_vector_field)
+
+    return TopologyClasses.Topology(name,nuclei,critical_points,gradient_vector_field)
+
+# Map from each collection of GradientVectorField to the tag of the elements it is read from
+gradientVectorFieldCollections = {
+    'molecular_graph' : 'MolecularGraph',
+    'atomic_basins'   : 'AtomicBasin',
+    'envelopes'       : 'Envelope',
+    'atomic_surfaces' : 'AtomicSurface',
+    'ring_surfaces'   : 'RingSurface',
+    'rings'           : 'Ring',
+    'cages'           : 'Cage',
+}
+
+# Function reads the nuclei and critical points of an XML file matching Topology.dtd and returns
+# a Topology object whose gradient vector field is a TopologyClasses.LazyGradientVectorField.
+# Each collection of the gradient vector field (see gradientVectorFieldCollections) is only parsed
+# from the file when first accessed. If sections is given, collections not named in it are
+# excluded and are always empty, e.g. sections=['molecular_graph'] for a graph-only import.
+# As the collections are read separately, the AILs repeated by rings and cages are not shared with
+# those of the molecular graph (see TopologyClasses.shareRepeatedObjects).
+# The file must not change while the topology is in use.
+def parseTopologyLazy(filepath,columnar=False,sections=None,topology_filter=None):
+
+    header, elements = scanTopology(filepath)
+    name, nuclei, critical_points = parseTopologyHeader(ET.fromstring(header))
+    if topology_filter is not None:
+        topology_filter = topology_filter.bind(nuclei,critical_points)
+
+    loaders = {}
+    for collection, tag in gradientVectorFieldCollections.items():
+        if sections is None or collection in sections:
+            ranges = [(start,end) for element_tag, start, end in elements if element_tag == tag]
+            loaders[collection] = functools.partial(parseGradientVectorFieldCollection,filepath,collection,ranges,columnar,topology_filter)
+
+    gradient_vector_field = TopologyClasses.LazyGradientVectorField(loaders)
     return TopologyClasses.Topology(name,nuclei,critical_points,gradient_vector_field)
 
+# Parse the elements of a single collection of the gradient vector field from the given byte ranges
+def parseGradientVectorFieldCollection(filepath,collection,ranges,columnar,topology_filter=None):
+
+    objects = []
+    with open(filepath,'rb') as topology_file:
+        for start, end in ranges:
+            topology_file.seek(start)
+            element = ET.fromstring(topology_file.read(end-start))
+            if collection == 'molecular_graph':
+                objects.append(parseMolecularGraph(element,columnar=columnar,topology_filter=topology_filter))
+            elif collection == 'atomic_basins':
+                objects.append(parseAtomicBasin(element,columnar=columnar,topology_filter=topology_filter))
+            elif collection == 'envelopes':
+                objects.append(parseEnvelope(element,columnar=columnar,topology_filter=topology_filter))
+            elif collection == 'atomic_surfaces':
+                objects.append(parseAtomicSurface(element,columnar=columnar,topology_filter=topology_filter))
+            elif collection == 'ring_surfaces':
+                objects.append(parseRingSurface(element,columnar=columnar,topology_filter=topology_filter))
+            elif collection == 'rings':
+                objects.append(parseRing(element,columnar=columnar,topology_filter=topology_filter))
+            elif collection == 'cages':
+                objects.append(parseCage(element,columnar=columnar,topology_filter=topology_filter))
+
+    if collection == 'molecular_graph':
+        return objects[0] if objects else TopologyClasses.MolecularGraph([])
+    return [collected for collected in objects if collected is not None]
+
+# Read the raw bytes of a topology file and locate the children of its GradientVectorField
+# Returns the bytes of the document up to the GradientVectorField, closed so that they form a
+# complete Topology document, and the list of (tag,start,end) for each child of the field
+def scanTopology(filepath):
+    with open(filepath,'rb') as topology_file:
+        buffer = mmap.mmap(topology_file.fileno(),0,access=mmap.ACCESS_READ)
+    try:
+        gvf_start, sections = findGradientVectorFieldSections(buffer)
+        if gvf_start is None:
+            header = buffer[:]
+        else:
+            header = buffer[:gvf_start] + b'</Topology>'
+    finally:
+        buffer.close()
+    return header, sections
+
+# Scan the bytes of a document for the GradientVectorField element and its children
+# Returns the offset of the GradientVectorField start tag (None if absent) and a list
+# of (tag,start,end), one per top-level child with its byte range, in document order
+def findGradientVectorFieldSections(buffer):
+
+    gvf_start = None
+    sections = []
+    depth = 0
+    for match in sectionTagPattern.finditer(buffer):
+        closing, tag, empty = match.group(1), match.group(2), match.group(3)
+        if tag == b'GradientVectorField':
+            if closing:
+                break
+            gvf_start = match.start()
+        elif gvf_start is None:
+            continue
+        elif empty:
+            if depth == 0:
+                sections.append((tag.decode('ascii'),match.start(),match.end()))
+        elif not closing:
+            if depth == 0:
+                section_start = match.start()
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                sections.append((tag.decode('ascii'),section_start,match.end()))
+
+    return gvf_start, sections
+
+# Parse the byte range [start,end) of filepath, holding complete children of a
+# GradientVectorField element, and return them as a GradientVectorField
+def parseGradientVectorFieldChunk(filepath,start,end,columnar,topology_filter=None):
+    with open(filepath,'rb') as topology_file:
+        topology_file.seek(start)
+        chunk = topology_file.read(end-start)
+    element = ET.fromstring(b'<GradientVectorField>' + chunk + b'</GradientVectorField>')
+    return parseGradientVectorField(element,columnar=columnar,topology_filter=topology_filter)
+
+# Function reads XML file matching Topology.dtd incrementally and returns Topology object
+# Rather than building the whole document tree, elements are read as a stream of start/end events.
+# Each GradientPath, Triangulation and container element is converted as soon as its end tag
+# is read and its subtree is then discarded, so peak memory is bounded by the largest single
+# element rather than the size of the whole document.
+# If validate is True, each element is checked against Topology.dtd by a Validation.TopologyValidator
+# before it is converted.
+def parseTopologyStreaming(filepath,columnar=False,topology_filter=None,validate=False):
+
+    name = None
+    nuclei = []
+    critical_points = []
+    gradient_vector_field = None
+    validator = Validation.TopologyValidator() if validate == True else None
+
+    # Each open element is stacked with the list of objects already converted from its children
+    stack = []
+    for event, element in ET.iterparse(filepath, events=('start','end')):
+
+        if event == 'start':
+            # Nuclei and CPs precede the gradient vector field, so the filter can now be bound
+            if element.tag == 'GradientVectorField' and topology_filter is not None:
+                topology_filter = topology_filter.bind(nuclei,critical_points)
+            stack.append((element,[]))
+            continue
+
+        element, children = stack.pop()
+        if validator is not None and (element.tag in validatedTags or not stack):
+            validator.validate(element,[ancestor for ancestor, converted in stack])
+
+        if element.tag == 'SystemName':
+            name = element.text
+        elif element.tag == 'Nucleus':
+            nuclei.insert(parseNucleusIndex(element),parseNucleus(element))
+        elif element.tag == 'CriticalPoint':
+            critical_points.insert(parseCriticalPointIndex(element),parseCriticalPoint(element))
+        elif element.tag == 'GradientVectorField':
+            gradient_vector_field = buildGradientVectorField(children)
+        elif element.tag == 'GradientPath':
+            stack[-1][1].append(parseGradientPath(element,columnar=columnar,topology_filter=topology_filter))
+        elif element.tag == 'Triangulation':
+            stack[-1][1].append(parseTriangulation(element,columnar=columnar,topology_filter=topology_filter))
+        elif element.tag in streamedTags:
+            stack[-1][1].append(buildStreamedElement(element,children,columnar,topology_filter))
+        else:
+            continue
+
+        # The element has been converted - drop its subtree
+        element.clear()
+        if stack:
+            if validator is not None:
+                validator.detach(stack[-1][0],element)
+            stack[-1][0].remove(element)
+
+    if gradient_vector_field is None:
+        gradient_vector_field = TopologyClasses.GradientVectorField(TopologyClasses.MolecularGraph([]),[],[],[],[],[],[])
+
+    return TopologyClasses.Topology(name,nuclei,critical_points,gradient_vector_field)
+
+# Container elements converted during streaming from the objects converted from their children
+streamedTags = ('AtomicInteractionLine','MolecularGraph','AtomicBasin','RingSurface','Ring','Cage',
+                'InteratomicSurface','AtomicSurface','Envelope')
+
+# Elements converted and then removed from the tree during streaming, which are therefore
+# validated (along with their remaining subtree) when their end tag is read
+validatedTags = frozenset(streamedTags + ('SystemName','Nucleus','CriticalPoint','GradientVectorField','GradientPath','Triangulation'))
+
+def buildStreamedElement(element,children,columnar,topology_filter):
+
+    if element.tag == 'AtomicInteractionLine':
+        return buildAtomicInteractionLine(children,topology_filter)
+    elif element.tag == 'MolecularGraph':
+        return buildMolecularGraph(children)
+    elif element.tag == 'AtomicBasin':
+        return buildAtomicBasin(children,topology_filter)
+    elif element.tag == 'RingSurface':
+        return buildRingSurface(children,topology_filter)
+    elif element.tag == 'Ring':
+        return buildRing(children,topology_filter)
+    elif element.tag == 'Cage':
+        return buildCage(children,topology_filter)
+    elif element.tag == 'InteratomicSurface':
+        gradient_paths = [child for child in children if not isinstance(child,TopologyClasses.Triangulation)]
+        triangulations = [child for child in children if isinstance(child,TopologyClasses.Triangulation)]
+        triangulation = triangulations[0] if triangulations else None
+        return buildInteratomicSurface(gradient_paths,triangulation,topology_filter)
+    elif element.tag == 'AtomicSurface':
+        return buildAtomicSurface(children,parseNuclearAttractorIndex(element),topology_filter)
+    elif element.tag == 'Envelope':
+        isovalue = float(element.find('isovalue').text)
+        points = parsePoints(element.findall('Point'),topology_filter)[0]
+        triangulation = children[0] if children else None
+        return buildEnvelope(isovalue,points,triangulation,topology_filter)
+
+# Collect the converted children of a streamed GradientVectorField element
+def buildGradientVectorField(children):
+
+    molecular_graph = TopologyClasses.MolecularGraph([])
+    atomic_basins   = []
+    envelopes       = []
+    atomic_surfaces = []
+    ring_surfaces   = []
+    rings           = []
+    cages           = []
+
+    for child in children:
+        if isinstance(child,TopologyClasses.MolecularGraph):
+            molecular_graph = child
+        elif isinstance(child,TopologyClasses.AtomicBasin):
+            atomic_basins.append(child)
+        elif isinstance(child,TopologyClasses.Envelope):
+            envelopes.append(child)
+        elif isinstance(child,TopologyClasses.AtomicSurface):
+            atomic_surfaces.append(child)
+        elif isinstance(child,TopologyClasses.RingSurface):
+            ring_surfaces.append(child)
+        elif isinstance(child,TopologyClasses.Ring):
+            rings.append(child)
+        elif isinstance(child,TopologyClasses.Cage):
+            cages.append(child)
+
+    gradient_vector_field = TopologyClasses.GradientVectorField(molecular_graph,atomic_basins,envelopes,atomic_surfaces,ring_surfaces,rings,cages)
+    TopologyClasses.shareRepeatedObjects(gradient_vector_field)
+    return gradient_vector_field
+
+# Generator reads XML file matching Topology.dtd incrementally and yields its objects as (kind,object)
+# pairs in document order, without building a Topology: first ('name',str), then each nucleus and
+# critical point, then each top-level object of the gradient vector field as soon as its end tag is
+# read (see iteratedKinds). Objects are not retained once yielded, so memory use does not grow with
+# the size of the file and consumers computing statistics or converting formats may simply drop them.
+# The AILs of rings and cages are yielded within their Ring or Cage, not individually.
+# If validate is True, the document is checked against Topology.dtd as it is read (see Validation).
+def iterTopology(filepath,columnar=False,topology_filter=None,validate=False):
+
+    nuclei = []
+    critical_points = []
+    validator = Validation.TopologyValidator() if validate == True else None
+
+    # Each open element is stacked with the list of objects already converted from its children
+    stack = []
+    for event, element in ET.iterparse(filepath, events=('start','end')):
+
+        if event == 'start':
+            # Nuclei and CPs precede the gradient vector field, so the filter can now be bound
+            if element.tag == 'GradientVectorField' and topology_filter is not None:
+                topology_filter = topology_filter.bind(nuclei,critical_points)
+            stack.append((element,[]))
+            continue
+
+        element, children = stack.pop()
+        if validator is not None and (element.tag in validatedTags or not stack):
+            validator.validate(element,[ancestor for ancestor, converted in stack])
+        parent_tag = stack[-1][0].tag if stack else None
+
+        kind = None
+        if element.tag == 'SystemName':
+            kind, converted = 'name', element.text
+        elif element.tag == 'Nucleus':
+            kind, converted = 'nucleus', parseNucleus(element)
+            nuclei.insert(parseNucleusIndex(element),converted)
+        elif element.tag == 'CriticalPoint':
+            kind, converted = 'critical_point', parseCriticalPoint(element)
+            critical_points.insert(parseCriticalPointIndex(element),converted)
+        elif element.tag == 'GradientPath':
+            stack[-1][1].append(parseGradientPath(element,columnar=columnar,topology_filter=topology_filter))
+        elif element.tag == 'Triangulation':
+            stack[-1][1].append(parseTriangulation(element,columnar=columnar,topology_filter=topology_filter))
+        elif element.tag in iteratedKinds and parent_tag in ('GradientVectorField','MolecularGraph'):
+            kind, converted = iteratedKinds[element.tag], buildStreamedElement(element,children,columnar,topology_filter)
+        elif element.tag in streamedTags and element.tag != 'MolecularGraph':
+            stack[-1][1].append(buildStreamedElement(element,children,columnar,topology_filter))
+        elif element.tag not in ('MolecularGraph','GradientVectorField'):
+            continue
+
+        # The element has been converted - drop its subtree
+        element.clear()
+        if stack:
+            if validator is not None:
+                validator.detach(stack[-1][0],element)
+            stack[-1][0].remove(element)
+
+        # Objects rejected by the filter are returned as None and are not yielded
+        if kind is not None and converted is not None:
+            yield kind, converted
+
+# Kinds yielded by iterTopology for the top-level objects of the gradient vector field
+iteratedKinds = {
+    'AtomicInteractionLine' : 'atomic_interaction_line',
+    'AtomicBasin'           : 'atomic_basin',
+    'Envelope'              : 'envelope',
+    'AtomicSurface'         : 'atomic_surface',
+    'RingSurface'           : 'ring_surface',
+    'Ring'                  : 'ring',
+    'Cage'                  : 'cage',
+}
+
+# Function reads XML file matching Topology.dtd with a scanner specialised to its grammar and
+# returns Topology object. The nuclei and critical points are parsed by ElementTree as usual, but
+# no elements are built for the gradient vector field: the raw bytes are scanned for the start and
+# end tags of the elements in scannedTagPattern, and when a GradientPath, Triangulation, Envelope
+# or AtomicSurface ends, the text of all of its x/y/z, key/value, cp_index and edge/face leaves is
+# collected with a single regular expression search each and converted to numbers in one batch.
+# Containers are built from their converted children by the same functions as the other parsers.
+# The grammar of Topology.dtd has no attributes, comments or entities within the gradient
+# vector field; files that use any of these are read with the ElementTree parser instead.
+def parseTopologyScan(filepath,columnar=False,topology_filter=None):
+
+    with open(filepath,'rb') as topology_file:
+        buffer = mmap.mmap(topology_file.fileno(),0,access=mmap.ACCESS_READ)
+    try:
+        gvf_start = buffer.find(b'<GradientVectorField')
+        for marker in scanUnsupportedMarkers:
+            if gvf_start >= 0 and buffer.find(marker,gvf_start) >= 0:
+                return parseTopology(filepath,columnar=columnar,use_cache=False,topology_filter=topology_filter)
+
+        header = buffer[:] if gvf_start < 0 else buffer[:gvf_start] + b'</Topology>'
+        name, nuclei, critical_points = parseTopologyHeader(ET.fromstring(header))
+        if topology_filter is not None:
+            topology_filter = topology_filter.bind(nuclei,critical_points)
+
+        gradient_vector_field = None
+        if gvf_start >= 0:
+            gradient_vector_field = scanGradientVectorField(buffer,gvf_start,columnar,topology_filter)
+    finally:
+        buffer.close()
+
+    if gradient_vector_field is None:
+        gradient_vector_field = TopologyClasses.GradientVectorField(TopologyClasses.MolecularGraph([]),[],[],[],[],[],[])
+
+    return TopologyClasses.Topology(name,nuclei,critical_points,gradient_vector_field)
+
+# Markup outside the grammar of Topology.dtd that the scanner does not handle
+# (comments, CDATA sections, processing instructions and entity references)
+scanUnsupportedMarkers = (b'<!',b'<?',b'&')
+
+# Start and end tags of the elements converted by parseTopologyScan
+scannedTagPattern = re.compile(rb'<(/?)(GradientVectorField|MolecularGraph|AtomicInteractionLine|AtomicBasin|Envelope|AtomicSurface|InteratomicSurface|RingSurface|Ring|Cage|GradientPath|Triangulation)\b[^>]*?(/?)>')
+
+# Scanned elements that contain no other scanned elements
+scannedLeafTags = frozenset(('GradientPath','Triangulation'))
+
+# Text of the leaf elements, searched for within the text of a single scanned element
+coordinatePattern = re.compile(rb'<[xyz]>([^<]*)<')
+keyPattern        = re.compile(rb'<key>([^<]*)<')
+valuePattern      = re.compile(rb'<value>([^<]*)<')
+pointPairPattern  = re.compile(rb'<(Point)>|<key>([^<]*)</key>\s*<value>([^<]*)<')
+cpIndexPattern    = re.compile(rb'<cp_index>([^<]*)<')
+edgePattern       = re.compile(rb'<edge_[ab]>([^<]*)<')
+facePattern       = re.compile(rb'<face_[abc]>([^<]*)<')
+isovaluePattern   = re.compile(rb'<isovalue>([^<]*)<')
+nacpIndexPattern  = re.compile(rb'<nacp_index>([^<]*)<')
+
+# Scan buffer from the GradientVectorField start tag at gvf_start to its end tag
+def scanGradientVectorField(buffer,gvf_start,columnar,topology_filter):
+
+    # Each open element is stacked as [tag, converted children, (start,end) of its own text, start of
+    # the current text]. The text of an element excludes that of its scanned children.
+    stack = []
+    position = gvf_start
+    while True:
+        match = scannedTagPattern.search(buffer,position)
+        if match is None:
+            raise ValueError('GradientVectorField is not closed')
+        position = match.end()
+        closing, tag, empty = match.group(1), match.group(2).decode('ascii'), match.group(3)
+
+        if not closing:
+            if stack:
+                stack[-1][2].append((stack[-1][3],match.start()))
+            if empty:
+                converted = convertScannedElement(tag,[],b'',columnar,topology_filter)
+            elif tag in scannedLeafTags:
+                # Most of the document is within these elements, so rather than searching for tags
+                # in their text, skip directly to the end tag
+                end = buffer.find(b'</' + match.group(2),position)
+                if end < 0:
+                    raise ValueError(tag + ' is not closed')
+                converted = convertScannedElement(tag,[],buffer[position:end],columnar,topology_filter)
+                position = buffer.find(b'>',end) + 1
+            else:
+                stack.append([tag,[],[],position])
+                continue
+        else:
+            tag, children, ranges, text_start = stack.pop()
+            ranges.append((text_start,match.start()))
+            text = b''.join(buffer[text_start:text_end] for text_start, text_end in ranges)
+            converted = convertScannedElement(tag,children,text,columnar,topology_filter)
+
+        if tag == 'GradientVectorField':
+            return converted
+        stack[-1][1].append(converted)
+        stack[-1][3] = position
+
+# Convert a scanned element from the objects converted from its children and its own text
+def convertScannedElement(tag,children,text,columnar,topology_filter):
+
+    if tag == 'GradientPath':
+        indices = [int(index)-1 for index in cpIndexPattern.findall(text)]
+        if topology_filter is not None and not topology_filter.acceptsCriticalPointIndices(indices):
+            return None
+        coordinates, scalar_properties = scanPointColumns(text,topology_filter)[:2]
+        if columnar == True:
+            return TopologyClasses.ColumnarGradientPath(indices,coordinates,scalar_properties)
+        return TopologyClasses.GradientPath(indices,TopologyClasses.pointsFromColumns(coordinates,scalar_properties))
+    elif tag == 'Triangulation':
+        coordinates, scalar_properties, mask = scanPointColumns(text,topology_filter)
+        edges = numpy.array(edgePattern.findall(text),dtype=numpy.int32).reshape(-1,2)
+        faces = numpy.array(facePattern.findall(text),dtype=numpy.int32).reshape(-1,3)
+        if mask is not None:
+            edges, faces = remapTriangulation(numpy.flatnonzero(mask),len(mask),edges,faces)
+        if columnar == True:
+            return TopologyClasses.ColumnarTriangulation(coordinates,scalar_properties,edges,faces)
+        edge_objects = [TopologyClasses.Edge(a,b) for a, b in edges.tolist()]
+        face_objects = [TopologyClasses.Face(a,b,c) for a, b, c in faces.tolist()]
+        return TopologyClasses.Triangulation(TopologyClasses.pointsFromColumns(coordinates,scalar_properties),edge_objects,face_objects)
+    elif tag == 'Envelope':
+        coordinates, scalar_properties = scanPointColumns(text,topology_filter)[:2]
+        points = TopologyClasses.pointsFromColumns(coordinates,scalar_properties)
+        triangulation = children[0] if children else None
+        return buildEnvelope(float(isovaluePattern.search(text).group(1)),points,triangulation,topology_filter)
+    elif tag == 'InteratomicSurface':
+        gradient_paths = [child for child in children if not isinstance(child,TopologyClasses.Triangulation)]
+        triangulations = [child for child in children if isinstance(child,TopologyClasses.Triangulation)]
+        triangulation = triangulations[0] if triangulations else None
+        return buildInteratomicSurface(gradient_paths,triangulation,topology_filter)
+    elif tag == 'AtomicSurface':
+        nacp_index = nacpIndexPattern.search(text)
+        if nacp_index is not None:
+            nacp_index = int(nacp_index.group(1))
+        return buildAtomicSurface(children,nacp_index,topology_filter)
+    elif tag == 'AtomicInteractionLine':
+        return buildAtomicInteractionLine(children,topology_filter)
+    elif tag == 'MolecularGraph':
+        return buildMolecularGraph(children)
+    elif tag == 'AtomicBasin':
+        return buildAtomicBasin(children,topology_filter)
+    elif tag == 'RingSurface':
+        return buildRingSurface(children,topology_filter)
+    elif tag == 'Ring':
+        return buildRing(children,topology_filter)
+    elif tag == 'Cage':
+        return buildCage(children,topology_filter)
+    elif tag == 'GradientVectorField':
+        return buildGradientVectorField(children)
+
+# Read the points in the text of a scanned element into an (N,3) coordinate array and a dict
+# mapping each scalar property name to an (N,) array (NaN where absent), as parsePointColumns.
+# Points rejected by the filter are omitted; the boolean mask of those kept is also returned,
+# or None if the filter does not act on points.
+def scanPointColumns(text,topology_filter=None):
+
+    coordinates = numpy.array(coordinatePattern.findall(text),dtype=numpy.float64).reshape(-1,3)
+    num_points = len(coordinates)
+
+    scalar_properties = {}
+    keys = keyPattern.findall(text)
+    if keys:
+        values = valuePattern.findall(text)
+        num_keys = len(keys) // num_points if num_points else 0
+        first_keys = keys[:num_keys]
+        if (len(values) == len(keys) and num_keys * num_points == len(keys)
+                and len(set(first_keys)) == num_keys and keys == first_keys * num_points):
+            # Usually every point has the same properties in the same order, so the
+            # values form an (N,K) table
+            table = numpy.array(values,dtype=numpy.float64).reshape(num_points,num_keys)
+            for column, key in enumerate(first_keys):
+                scalar_properties[sys.intern(key.decode('utf-8'))] = numpy.ascontiguousarray(table[:,column])
+        else:
+            columns = {}
+            row = -1
+            for point, key, value in pointPairPattern.findall(text):
+                if point:
+                    row += 1
+                    continue
+                if key not in columns:
+                    columns[key] = ([],[])
+                columns[key][0].append(row)
+                columns[key][1].append(value)
+            for key, (rows, values) in columns.items():
+                column = numpy.full(num_points,numpy.nan)
+                column[rows] = numpy.array(values,dtype=numpy.float64)
+                scalar_properties[sys.intern(key.decode('utf-8'))] = column
+
+    if topology_filter is None or not topology_filter.filtersPoints():
+        return coordinates, scalar_properties, None
+
+    mask = topology_filter.acceptsPoints(coordinates,scalar_properties)
+    coordinates = coordinates[mask]
+    for key in scalar_properties:
+        scalar_properties[key] = scalar_properties[key][mask]
+    return coordinates, scalar_properties, mask
+
 def parseNucleusIndex(NucleusElement):
     return int(NucleusElement.find('nucleus_index').text)
 
@@ -50,106 +673,239 @@ def parseCriticalPoint(CriticalPointElement):
     point = parsePoint(CriticalPointElement.find('Point'))
     return TopologyClasses.CriticalPoint(point.position_vector,point.scalar_properties,rank,signature)
 
-def parseGradientVectorField(GradientVectorFieldElement):
+def parseGradientVectorField(GradientVectorFieldElement,columnar=False,topology_filter=None):
 
-    molecular_graph = parseMolecularGraph(GradientVectorFieldElement.find('MolecularGraph'))
+    if GradientVectorFieldElement.find('MolecularGraph') is not None:
+        molecular_graph = parseMolecularGraph(GradientVectorFieldElement.find('MolecularGraph'),columnar=columnar,topology_filter=topology_filter)
+    else:
+        molecular_graph = TopologyClasses.MolecularGraph([])
 
     atomic_basins = []
     for atomic_basin in GradientVectorFieldElement.findall('AtomicBasin'):
-        atomic_basins.append(parseAtomicBasin(atomic_basin))
+        atomic_basins.append(parseAtomicBasin(atomic_basin,columnar=columnar,topology_filter=topology_filter))
 
     envelopes = []
     for envelope in GradientVectorFieldElement.findall('Envelope'):
-        envelopes.append(parseEnvelope(envelope))
+        envelopes.append(parseEnvelope(envelope,columnar=columnar,topology_filter=topology_filter))
 
     atomic_surfaces = []
     for atomic_surface in GradientVectorFieldElement.findall('AtomicSurface'):
-        atomic_surfaces.append(parseAtomicSurface(atomic_surface))
+        atomic_surfaces.append(parseAtomicSurface(atomic_surface,columnar=columnar,topology_filter=topology_filter))
 
     ring_surfaces = []
     for ring_surface in GradientVectorFieldElement.findall('RingSurface'):
-        ring_surfaces.append(parseRingSurface(ring_surface))
+        ring_surfaces.append(parseRingSurface(ring_surface,columnar=columnar,topology_filter=topology_filter))
 
     rings = []
     for ring in GradientVectorFieldElement.findall('Ring'):
-        rings.append(parseRing(ring))
+        rings.append(parseRing(ring,columnar=columnar,topology_filter=topology_filter))
 
     cages = []
     for cage in GradientVectorFieldElement.findall('Cage'):
-       cages.append(parseCage(cage))
+       cages.append(parseCage(cage,columnar=columnar,topology_filter=topology_filter))
+
+    # Objects rejected by the filter are returned as None
+    if topology_filter is not None:
+        atomic_basins   = [atomic_basin for atomic_basin in atomic_basins if atomic_basin is not None]
+        envelopes       = [envelope for envelope in envelopes if envelope is not None]
+        atomic_surfaces = [atomic_surface for atomic_surface in atomic_surfaces if atomic_surface is not None]
+        ring_surfaces   = [ring_surface for ring_surface in ring_surfaces if ring_surface is not None]
+        rings           = [ring for ring in rings if ring is not None]
+        cages           = [cage for cage in cages if cage is not None]
 
-    return TopologyClasses.GradientVectorField(molecular_graph,atomic_basins,envelopes,atomic_surfaces,ring_surfaces,rings,cages)
+    gradient_vector_field = TopologyClasses.GradientVectorField(molecular_graph,atomic_basins,envelopes,atomic_surfaces,ring_surfaces,rings,cages)
+    TopologyClasses.shareRepeatedObjects(gradient_vector_field)
+    return gradient_vector_field
 
-def parseMolecularGraph(MolecularGraphElement):
+def parseMolecularGraph(MolecularGraphElement,columnar=False,topology_filter=None):
     ails = []
     for atomic_interaction_line in MolecularGraphElement.findall('AtomicInteractionLine'):
-        ails.append(parseAtomicInteractionLine(atomic_interaction_line))
-    return TopologyClasses.MolecularGraph(ails)
+        ails.append(parseAtomicInteractionLine(atomic_interaction_line,columnar=columnar,topology_filter=topology_filter))
+    return buildMolecularGraph(ails)
 
-def parseAtomicBasin(AtomicBasinElement):
+def parseAtomicBasin(AtomicBasinElement,columnar=False,topology_filter=None):
     gradient_paths = []
     for gradient_path in AtomicBasinElement.findall('GradientPath'):
-        gradient_paths.append(parseGradientPath(gradient_path))
-    return TopologyClasses.AtomicBasin(gradient_paths)
+        gradient_paths.append(parseGradientPath(gradient_path,columnar=columnar,topology_filter=topology_filter))
+    return buildAtomicBasin(gradient_paths,topology_filter)
 
-def parseEnvelope(EnvelopeElement):
+def parseEnvelope(EnvelopeElement,columnar=False,topology_filter=None):
     isovalue = float(EnvelopeElement.find('isovalue').text)
-    points = []
-    for point in EnvelopeElement.findall('Point'):
-        points.append(parsePoint(point))
-    triangulation = parseTriangulation(EnvelopeElement.find('Triangulation'))
-    return TopologyClasses.Envelope(isovalue,points,triangulation)
+    points = parsePoints(EnvelopeElement.findall('Point'),topology_filter)[0]
+    triangulation = parseTriangulation(EnvelopeElement.find('Triangulation'),columnar=columnar,topology_filter=topology_filter)
+    return buildEnvelope(isovalue,points,triangulation,topology_filter)
 
-def parseAtomicSurface(AtomicSurfaceElement):
+def parseAtomicSurface(AtomicSurfaceElement,columnar=False,topology_filter=None):
     interatomic_surfaces = []
     for interatomic_surface in AtomicSurfaceElement.findall('InteratomicSurface'):
-        interatomic_surfaces.append(parseInteratomicSurface(interatomic_surface))
+        interatomic_surfaces.append(parseInteratomicSurface(interatomic_surface,columnar=columnar,topology_filter=topology_filter))
+    return buildAtomicSurface(interatomic_surfaces,parseNuclearAttractorIndex(AtomicSurfaceElement),topology_filter)
+
+def parseNuclearAttractorIndex(AtomicSurfaceElement):
     if AtomicSurfaceElement.find('nacp_index') != None:
-        nacp_index = int(AtomicSurfaceElement.find('nacp_index').text)
-        return TopologyClasses.AtomicSurface(interatomic_surfaces,nacp_index=nacp_index)
-    else:
-        return TopologyClasses.AtomicSurface(interatomic_surfaces)
-    
-def parseRingSurface(RingSurfaceElement):
+        return int(AtomicSurfaceElement.find('nacp_index').text)
+    return None
+
+def parseRingSurface(RingSurfaceElement,columnar=False,topology_filter=None):
     gradient_paths = []
     for gradient_path in RingSurfaceElement.findall('GradientPath'):
-        gradient_paths.append(parseGradientPath(gradient_path))
-    return TopologyClasses.RingSurface(gradient_paths)
+        gradient_paths.append(parseGradientPath(gradient_path,columnar=columnar,topology_filter=topology_filter))
+    return buildRingSurface(gradient_paths,topology_filter)
 
-def parseRing(RingElement):
+def parseRing(RingElement,columnar=False,topology_filter=None):
     atomic_interaction_lines = []
     for atomic_interaction_line in RingElement.findall('AtomicInteractionLine'):
-        atomic_interaction_lines.append(parseAtomicInteractionLine(atomic_interaction_line))
-    return TopologyClasses.Ring(atomic_interaction_lines)
+        atomic_interaction_lines.append(parseAtomicInteractionLine(atomic_interaction_line,columnar=columnar,topology_filter=topology_filter))
+    return buildRing(atomic_interaction_lines,topology_filter)
 
-def parseCage(CageElement):
+def parseCage(CageElement,columnar=False,topology_filter=None):
     rings = []
     for ring in CageElement.findall('Ring'):
-        rings.append(parseRing(ring))
-    return TopologyClasses.Cage(rings)
+        rings.append(parseRing(ring,columnar=columnar,topology_filter=topology_filter))
+    return buildCage(rings,topology_filter)
 
-def parseInteratomicSurface(InteratomicSurfaceElement):
+def parseInteratomicSurface(InteratomicSurfaceElement,columnar=False,topology_filter=None):
     gradient_paths = []
     for gradient_path in InteratomicSurfaceElement.findall('GradientPath'):
-        gradient_paths.append(parseGradientPath(gradient_path))
-    triangulation= parseTriangulation(InteratomicSurfaceElement.find('Triangulation'))
-    return TopologyClasses.InteratomicSurface(gradient_paths,triangulation)
+        gradient_paths.append(parseGradientPath(gradient_path,columnar=columnar,topology_filter=topology_filter))
+    triangulation= parseTriangulation(InteratomicSurfaceElement.find('Triangulation'),columnar=columnar,topology_filter=topology_filter)
+    return buildInteratomicSurface(gradient_paths,triangulation,topology_filter)
 
-def parseAtomicInteractionLine(AtomicInteractionLineElement):
+def parseAtomicInteractionLine(AtomicInteractionLineElement,columnar=False,topology_filter=None):
     gradient_paths = []
     for gradient_path in AtomicInteractionLineElement.findall('GradientPath'):
-        gradient_paths.append(parseGradientPath(gradient_path))
+        gradient_paths.append(parseGradientPath(gradient_path,columnar=columnar,topology_filter=topology_filter))
+    return buildAtomicInteractionLine(gradient_paths,topology_filter)
+
+# The following functions build the container objects from their parsed children.
+# With a filter, children rejected by it are None and rejected containers are returned as None.
+# Without a filter they simply wrap their children.
+
+def buildMolecularGraph(atomic_interaction_lines):
+    return TopologyClasses.MolecularGraph([ail for ail in atomic_interaction_lines if ail is not None])
+
+# An AIL is only kept whole, so it is rejected if any of its paths ends at a rejected CP
+def buildAtomicInteractionLine(gradient_paths,topology_filter):
+    if topology_filter is None:
+        return TopologyClasses.AtomicInteractionLine(gradient_paths)
+    if None in gradient_paths:
+        return None
+    gradient_paths = acceptedGradientPaths(gradient_paths)
+    if not gradient_paths:
+        return None
     return TopologyClasses.AtomicInteractionLine(gradient_paths)
 
-def parseGradientPath(GradientPathElement):
-    points = []
-    for point in GradientPathElement.findall('Point'):
-        points.append(parsePoint(point));
+def buildAtomicBasin(gradient_paths,topology_filter):
+    if topology_filter is None:
+        return TopologyClasses.AtomicBasin(gradient_paths)
+    gradient_paths = acceptedGradientPaths(gradient_paths)
+    if not gradient_paths:
+        return None
+    return TopologyClasses.AtomicBasin(gradient_paths)
+
+def buildRingSurface(gradient_paths,topology_filter):
+    if topology_filter is None:
+        return TopologyClasses.RingSurface(gradient_paths)
+    gradient_paths = acceptedGradientPaths(gradient_paths)
+    if not gradient_paths:
+        return None
+    return TopologyClasses.RingSurface(gradient_paths)
+
+def buildRing(atomic_interaction_lines,topology_filter):
+    if topology_filter is not None and (None in atomic_interaction_lines or not atomic_interaction_lines):
+        return None
+    return TopologyClasses.Ring(atomic_interaction_lines)
+
+def buildCage(rings,topology_filter):
+    if topology_filter is not None and (None in rings or not rings):
+        return None
+    return TopologyClasses.Cage(rings)
+
+def buildInteratomicSurface(gradient_paths,triangulation,topology_filter):
+    if topology_filter is None:
+        return TopologyClasses.InteratomicSurface(gradient_paths,triangulation)
+    gradient_paths = acceptedGradientPaths(gradient_paths)
+    if triangulation is not None and len(triangulation.getCoordinates()) == 0:
+        triangulation = None
+    if not gradient_paths and triangulation is None:
+        return None
+    return TopologyClasses.InteratomicSurface(gradient_paths,triangulation)
+
+def buildAtomicSurface(interatomic_surfaces,nacp_index,topology_filter):
+    if topology_filter is not None:
+        if nacp_index is not None and not topology_filter.acceptsCriticalPointIndices([nacp_index]):
+            return None
+        interatomic_surfaces = [surface for surface in interatomic_surfaces if surface is not None]
+        if not interatomic_surfaces:
+            return None
+    if nacp_index is not None:
+        return TopologyClasses.AtomicSurface(interatomic_surfaces,nacp_index=nacp_index)
+    else:
+        return TopologyClasses.AtomicSurface(interatomic_surfaces)
+
+def buildEnvelope(isovalue,points,triangulation,topology_filter):
+    if topology_filter is not None:
+        if triangulation is not None and len(triangulation.getCoordinates()) == 0:
+            triangulation = None
+        if not points and triangulation is None:
+            return None
+    return TopologyClasses.Envelope(isovalue,points,triangulation)
+
+# Drop the paths rejected by a filter and those left without any points
+def acceptedGradientPaths(gradient_paths):
+    accepted = []
+    for gradient_path in gradient_paths:
+        if gradient_path is None:
+            continue
+        if isinstance(gradient_path,TopologyClasses.ColumnarGradientPath):
+            if len(gradient_path.coordinates) == 0:
+                continue
+        elif not gradient_path.points:
+            continue
+        accepted.append(gradient_path)
+    return accepted
+
+def parseCriticalPointIndices(GradientPathElement):
     indices = []
     for index in GradientPathElement.findall('cp_index'):
         indices.append(int(index.text)-1)
+    return indices
+
+# Returns None if the path ends at a critical point rejected by the filter
+def parseGradientPath(GradientPathElement,columnar=False,topology_filter=None):
+    indices = parseCriticalPointIndices(GradientPathElement)
+    if topology_filter is not None and not topology_filter.acceptsCriticalPointIndices(indices):
+        return None
+    if columnar == True:
+        coordinates, scalar_properties = parsePointColumns(GradientPathElement.findall('Point'),topology_filter)[:2]
+        return TopologyClasses.ColumnarGradientPath(indices,coordinates,scalar_properties)
+    points = parsePoints(GradientPathElement.findall('Point'),topology_filter)[0]
     return TopologyClasses.GradientPath(indices,points)
 
+# Read a sequence of Point elements, omitting those rejected by the filter
+# Returns the list of Point objects and the positions in the sequence of those kept,
+# or None for the latter if the filter does not act on points
+def parsePoints(PointElements,topology_filter=None):
+
+    if topology_filter is None or not topology_filter.filtersPoints():
+        points = []
+        for point in PointElements:
+            points.append(parsePoint(point))
+        return points, None
+
+    points = []
+    kept = []
+    for n, point in enumerate(PointElements):
+        position_vector = parsePositionVector(point.find('PositionVector'))
+        if not topology_filter.acceptsPosition(position_vector):
+            continue
+        scalar_properties = parseMap(point.find('Map'))
+        if not topology_filter.acceptsScalarProperties(scalar_properties):
+            continue
+        points.append(TopologyClasses.Point(position_vector,scalar_properties))
+        kept.append(n)
+    return points, kept
+
 def parsePoint(PointElement):
     position_vector   = parsePositionVector(PointElement.find('PositionVector'))
     scalar_properties = parseMap(PointElement.find('Map'))
@@ -158,7 +914,7 @@ def parsePoint(PointElement):
 def parseMap(MapElement):
     scalar_properties = {}
     for pair in MapElement.findall('Pair'):
-        key = pair.find('key').text
+        key = sys.intern(pair.find('key').text)
         value = float(pair.find('value').text)
         scalar_properties[key] = value
     return scalar_properties
@@ -168,14 +924,78 @@ def parsePositionVector(position_vector):
     y = float(position_vector.find('y').text)
     z = float(position_vector.find('z').text)
     return (x,y,z)
-    
-def parseTriangulation(TriangulationElement):
+
+# Read a sequence of Point elements into an (N,3) coordinate array and a dict mapping
+# each scalar property name to an (N,) array. Properties missing at a point are NaN.
+# Points rejected by the filter are omitted; the positions in the sequence of those kept
+# are also returned, or None if the filter does not act on points.
+def parsePointColumns(PointElements,topology_filter=None):
+
+    filtering = topology_filter is not None and topology_filter.filtersPoints()
+    coordinates = []
+    columns = {}
+    kept = []
+    for n, point in enumerate(PointElements):
+        position_vector = parsePositionVector(point.find('PositionVector'))
+        if filtering and not topology_filter.acceptsPosition(position_vector):
+            continue
+        map_element = point.find('Map')
+        scalar_properties = parseMap(map_element) if map_element is not None else {}
+        if filtering and not topology_filter.acceptsScalarProperties(scalar_properties):
+            continue
+        row = len(kept)
+        kept.append(n)
+        coordinates.extend(position_vector)
+        for key, value in scalar_properties.items():
+            if key not in columns:
+                columns[key] = [float('nan')] * row
+            columns[key].append(value)
+        for column in columns.values():
+            if len(column) == row:
+                column.append(float('nan'))
+
+    coordinates = numpy.array(coordinates,dtype=numpy.float64).reshape(-1,3)
+    scalar_properties = {}
+    for key, column in columns.items():
+        scalar_properties[key] = numpy.array(column,dtype=numpy.float64)
+    return coordinates, scalar_properties, (kept if filtering else None)
+
+def parseTriangulation(TriangulationElement,columnar=False,topology_filter=None):
 
     if (TriangulationElement is None):
         return None
 
+    filtering = topology_filter is not None and topology_filter.filtersPoints()
+    point_elements = TriangulationElement.findall('Point')
+
+    if columnar == True or filtering:
+        edges = []
+        for edge in TriangulationElement.findall('Edge'):
+            edges.append(int(edge.find('edge_a').text))
+            edges.append(int(edge.find('edge_b').text))
+        faces = []
+        for face in TriangulationElement.findall('Face'):
+            faces.append(int(face.find('face_a').text))
+            faces.append(int(face.find('face_b').text))
+            faces.append(int(face.find('face_c').text))
+        edges = numpy.array(edges,dtype=numpy.int32).reshape(-1,2)
+        faces = numpy.array(faces,dtype=numpy.int32).reshape(-1,3)
+
+        if columnar == True:
+            coordinates, scalar_properties, kept = parsePointColumns(point_elements,topology_filter)
+        else:
+            points, kept = parsePoints(point_elements,topology_filter)
+        if kept is not None:
+            edges, faces = remapTriangulation(kept,len(point_elements),edges,faces)
+
+        if columnar == True:
+            return TopologyClasses.ColumnarTriangulation(coordinates,scalar_properties,edges,faces)
+        edge_objects = [TopologyClasses.Edge(a,b) for a, b in edges.tolist()]
+        face_objects = [TopologyClasses.Face(a,b,c) for a, b, c in faces.tolist()]
+        return TopologyClasses.Triangulation(points,edge_objects,face_objects)
+
     points = []
-    for point in TriangulationElement.findall('Point'):
+    for point in point_elements:
         points.append(parsePoint(point))
 
     edges = []
@@ -188,6 +1008,17 @@ def parseTriangulation(TriangulationElement):
 
     return TopologyClasses.Triangulation(points,edges,faces)
 
+# Renumber the edges and faces of a triangulation of which only the vertices at positions kept
+# (of num_points) remain, dropping any edge or face that uses a removed vertex
+def remapTriangulation(kept,num_points,edges,faces):
+    new_index = numpy.full(num_points,-1,dtype=numpy.int32)
+    new_index[numpy.asarray(kept,dtype=numpy.intp)] = numpy.arange(len(kept),dtype=numpy.int32)
+    edges = new_index[edges]
+    faces = new_index[faces]
+    edges = edges[numpy.all(edges >= 0,axis=1)]
+    faces = faces[numpy.all(faces >= 0,axis=1)]
+    return edges, faces
+
 def parseEdge(EdgeElement):
     a = int(EdgeElement.find('edge_a').text)
     b = int(EdgeElement.find('edge_b').text)
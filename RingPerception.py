@@ -0,0 +1,375 @@
+# RingPerception Python 3 Module
+# Rhorix: An interface between quantum chemical topology and the 3D graphics program Blender
+
+# Many topology files have no Ring or Cage elements, so the rings and cages are perceived from the
+# molecular graph instead. A ConnectivityGraph is built once from the indexed topology, with the
+# nuclei (NACPs) as vertices and the AILs joining two of them as edges.
+#
+# Rings are a minimum cycle basis of the graph. Only the biconnected components of the graph
+# contain cycles, and these are found in linear time, so the acyclic parts of large biomolecular
+# graphs cost nothing further. Within each component, candidate rings are the cycles of Horton,
+# a shortest path from a vertex to each end of an edge and the edge itself, gathered by a
+# breadth first search from each vertex that stops at half the ring size. The candidates are
+# taken shortest first while they are independent over GF(2), each reduced as a set of edges by
+# the basis cycle of its greatest edge, until the rank of the cycle space is reached. The searches
+# are first bounded at rings of six nuclei and widened two at a time to max_ring_size only while
+# the basis is incomplete. As they are bounded, the work grows linearly with the size of the
+# graph, and rings of more than max_ring_size nuclei are not perceived.
+#
+# A cage is perceived around each CCP as a closed surface of rings. Starting from the edge nearest
+# the CCP, the shortest candidate ring (nearest the CCP among those as short) containing an edge
+# that is covered by only one ring so far is added, until every edge is covered by exactly two
+# rings. A closed surface has one ring more than the rank of its cycle space, so the rings of
+# cages may include candidates that are not in the cycle basis; these are added to the rings.
+
+import numpy
+from . import TopologyClasses
+
+# Connectivity graph of the molecular graph of a topology. Vertex v is the NACP of index
+# vertices[v] at positions[v]; edge e joins the vertices edges[e] and is drawn by the AIL ails[e].
+# adjacency[v] lists the (neighbour,edge) pairs of vertex v. AILs that do not join two distinct
+# NACPs, and further AILs between the same pair, are left out.
+class ConnectivityGraph():
+
+    __slots__ = ('vertices','positions','edges','ails','adjacency')
+
+    def __init__(self,topology):
+
+        if topology.index is None:
+            topology.buildIndex()
+        critical_points = topology.critical_points
+
+        vertex_numbers = {}
+        self.vertices  = []
+        self.edges     = []
+        self.ails      = []
+        self.adjacency = []
+        joined = set()
+
+        def vertexNumber(nacp_index):
+            if nacp_index not in vertex_numbers:
+                vertex_numbers[nacp_index] = len(self.vertices)
+                self.vertices.append(nacp_index)
+                self.adjacency.append([])
+            return vertex_numbers[nacp_index]
+
+        for ail in topology.gradient_vector_field.molecular_graph.atomic_interaction_lines:
+            nacp_indices = set(ail.getNuclearIndices(critical_points))
+            if len(nacp_indices) != 2:
+                continue
+            a, b = sorted(vertexNumber(index) for index in nacp_indices)
+            if (a,b) in joined:
+                continue
+            joined.add((a,b))
+            edge = len(self.edges)
+            self.edges.append((a,b))
+            self.ails.append(ail)
+            self.adjacency[a].append((b,edge))
+            self.adjacency[b].append((a,edge))
+
+        self.positions = numpy.array([critical_points[index].position_vector for index in self.vertices],dtype=numpy.float64).reshape(-1,3)
+
+    # Lists of the edges of each biconnected component that contains a cycle (Tarjan's algorithm,
+    # iterative so that long chains do not exhaust the recursion limit)
+    def biconnectedComponents(self):
+
+        discovery = [-1] * len(self.adjacency)
+        low       = [0] * len(self.adjacency)
+        components = []
+        counter = 0
+        for root in range(len(self.adjacency)):
+            if discovery[root] >= 0:
+                continue
+            discovery[root] = low[root] = counter
+            counter += 1
+            stack = [(root,-1,iter(self.adjacency[root]))]
+            edge_stack = []
+            while stack:
+                vertex, parent_edge, neighbours = stack[-1]
+                descended = False
+                for neighbour, edge in neighbours:
+                    if edge == parent_edge:
+                        continue
+                    if discovery[neighbour] < 0:
+                        edge_stack.append(edge)
+                        discovery[neighbour] = low[neighbour] = counter
+                        counter += 1
+                        stack.append((neighbour,edge,iter(self.adjacency[neighbour])))
+                        descended = True
+                        break
+                    elif discovery[neighbour] < discovery[vertex]:
+                        edge_stack.append(edge)
+                        low[vertex] = min(low[vertex],discovery[neighbour])
+                if descended:
+                    continue
+                stack.pop()
+                if stack:
+                    parent = stack[-1][0]
+                    low[parent] = min(low[parent],low[vertex])
+                    if low[vertex] >= discovery[parent]:
+                        component = []
+                        while True:
+                            edge = edge_stack.pop()
+                            component.append(edge)
+                            if edge == parent_edge:
+                                break
+                        # A single edge is a bridge, on no cycle
+                        if len(component) > 1:
+                            components.append(component)
+        return components
+
+    # Candidate rings of a biconnected component of at most max_ring_size edges, as a dict from
+    # the frozenset of the edges of each to its length
+    def hortonCycles(self,component,max_ring_size):
+
+        in_component = set(component)
+        vertices = sorted(set(vertex for edge in component for vertex in self.edges[edge]))
+        depth = max_ring_size // 2
+        candidates = {}
+
+        for root in vertices:
+            distance = {root: 0}
+            parent   = {root: (-1,-1)} # (vertex,edge) towards the root
+            order = [root]
+            for vertex in order:
+                if distance[vertex] == depth:
+                    continue
+                for neighbour, edge in self.adjacency[vertex]:
+                    if neighbour not in distance and edge in in_component:
+                        distance[neighbour] = distance[vertex] + 1
+                        parent[neighbour] = (vertex,edge)
+                        order.append(neighbour)
+
+            for x in order:
+                for y, edge in self.adjacency[x]:
+                    if y < x or y not in distance or edge not in in_component:
+                        continue
+                    if edge == parent[x][1] or edge == parent[y][1]:
+                        continue
+                    length = distance[x] + distance[y] + 1
+                    if length > max_ring_size:
+                        continue
+                    # The paths from x and y back to the root must meet only at the root
+                    on_path = set()
+                    cycle = [edge]
+                    vertex = x
+                    while vertex != root:
+                        on_path.add(vertex)
+                        vertex, path_edge = parent[vertex]
+                        cycle.append(path_edge)
+                    vertex = y
+                    while vertex != root and vertex not in on_path:
+                        vertex, path_edge = parent[vertex]
+                        cycle.append(path_edge)
+                    if vertex == root:
+                        candidates[frozenset(cycle)] = length
+        return candidates
+
+    def otherEnd(self,edge,vertex):
+        a, b = self.edges[edge]
+        return b if vertex == a else a
+
+    # The edges of a cycle, given as a set of edges, in order around it
+    def orderCycle(self,cycle_edges):
+        at_vertex = {}
+        for edge in cycle_edges:
+            for vertex in self.edges[edge]:
+                at_vertex.setdefault(vertex,[]).append(edge)
+        edge = min(cycle_edges)
+        start = vertex = self.edges[edge][0]
+        ordered = []
+        while True:
+            ordered.append(edge)
+            vertex = self.otherEnd(edge,vertex)
+            if vertex == start:
+                return ordered
+            first, second = at_vertex[vertex]
+            edge = second if first == edge else first
+
+# Rings of a minimum cycle basis of the molecular graph of a topology, and cages around its
+# CCPs, as lists of TopologyClasses.Ring and TopologyClasses.Cage objects. The AILs of each ring
+# are those of the molecular graph, in order around the ring.
+def perceiveRingsAndCages(topology,max_ring_size=12,max_cage_rings=128):
+
+    graph = ConnectivityGraph(topology)
+
+    basis_cycles = [] # each a frozenset of edges
+    pool         = [] # candidates of every component, (frozenset of edges,length)
+    for component in graph.biconnectedComponents():
+        rank = len(component) - len(set(vertex for edge in component for vertex in graph.edges[edge])) + 1
+        # Most rings are short, so the searches are first bounded at six nuclei and widened only
+        # while the basis is incomplete
+        limit = min(6,max_ring_size)
+        candidates = {}
+        basis = {} # reduced cycles by their greatest edge
+        while True:
+            found = graph.hortonCycles(component,limit)
+            new = sorted((length,sorted(edges),edges) for edges, length in found.items() if edges not in candidates)
+            candidates.update(found)
+            for length, ordered, edges in new:
+                pool.append((edges,length))
+                if len(basis) == rank:
+                    continue
+                reduced = set(edges)
+                while reduced:
+                    pivot = max(reduced)
+                    if pivot not in basis:
+                        basis[pivot] = reduced
+                        basis_cycles.append(edges)
+                        break
+                    reduced ^= basis[pivot]
+            if len(basis) == rank or limit >= max_ring_size:
+                break
+            limit = min(limit+2,max_ring_size)
+
+    cage_cycles = []
+    ccp_indices = topology.index.cp_indices_by_kind['ccp'].tolist()
+    if ccp_indices and pool:
+        cage_pool = CagePool(graph,pool)
+        found = set()
+        for ccp_index in ccp_indices:
+            cage = cage_pool.closeCage(numpy.asarray(topology.critical_points[ccp_index].position_vector,dtype=numpy.float64),max_cage_rings)
+            if cage is not None and frozenset(cage) not in found:
+                found.add(frozenset(cage))
+                cage_cycles.append(cage)
+
+    ring_objects = {}
+    rings = []
+    for cycle in basis_cycles + [cycle for cage in cage_cycles for cycle in cage]:
+        if cycle not in ring_objects:
+            ring_objects[cycle] = TopologyClasses.Ring([graph.ails[edge] for edge in graph.orderCycle(cycle)])
+            rings.append(ring_objects[cycle])
+    cages = [TopologyClasses.Cage([ring_objects[cycle] for cycle in cage]) for cage in cage_cycles]
+    return rings, cages
+
+# Candidate rings from which cages are closed, with the rings containing each edge, the centroid
+# of each ring and the midpoint of each edge on a ring, computed once for all the CCPs
+class CagePool():
+
+    __slots__ = ('graph','pool','rings_at_edge','centroids','cyclic_edges','midpoints')
+
+    def __init__(self,graph,pool):
+        self.graph = graph
+        self.pool  = pool
+        self.rings_at_edge = {}
+        for n, (edges, length) in enumerate(pool):
+            for edge in edges:
+                self.rings_at_edge.setdefault(edge,[]).append(n)
+        self.centroids = numpy.array([graph.positions[list(set(vertex for edge in edges for vertex in graph.edges[edge]))].mean(axis=0) for edges, length in pool]).reshape(-1,3)
+        self.cyclic_edges = sorted(self.rings_at_edge)
+        ends = numpy.array([graph.edges[edge] for edge in self.cyclic_edges],dtype=numpy.int64).reshape(-1,2)
+        self.midpoints = (graph.positions[ends[:,0]] + graph.positions[ends[:,1]]) / 2
+
+    # Close a surface of candidate rings around a CCP at position, as described above. Returns
+    # the list of rings (frozensets of edges) or None if no closed surface enclosing the CCP is
+    # found within max_cage_rings rings.
+    def closeCage(self,position,max_cage_rings):
+
+        pool = self.pool
+        start = self.cyclic_edges[int(numpy.argmin(numpy.linalg.norm(self.midpoints - position,axis=1)))]
+        chosen = []
+        covered = {}
+        open_edges = {start}
+        while open_edges:
+            if len(chosen) == max_cage_rings:
+                return None
+            best = None
+            for edge in open_edges:
+                for n in self.rings_at_edge[edge]:
+                    if n in chosen or any(covered.get(other,0) >= 2 for other in pool[n][0]):
+                        continue
+                    key = (pool[n][1],float(numpy.linalg.norm(self.centroids[n] - position)))
+                    if best is None or key < best[0]:
+                        best = (key,n)
+            if best is None:
+                return None
+            chosen.append(best[1])
+            for edge in pool[best[1]][0]:
+                covered[edge] = covered.get(edge,0) + 1
+            open_edges = set(edge for edge, count in covered.items() if count == 1)
+
+        # The surface must enclose the CCP, at least within the box of its nuclei
+        vertices = list(set(vertex for edge in covered for vertex in self.graph.edges[edge]))
+        box = self.graph.positions[vertices]
+        if numpy.any(position < box.min(axis=0)) or numpy.any(position > box.max(axis=0)):
+            return None
+        return [pool[n][0] for n in chosen]
+
+# Add the rings and cages perceived from the molecular graph to a topology whose file had none.
+# Returns the number of rings and of cages added.
+def completeRingsAndCages(topology,max_ring_size=12,max_cage_rings=128):
+    gradient_vector_field = topology.gradient_vector_field
+    if gradient_vector_field.rings or gradient_vector_field.cages:
+        return 0, 0
+    rings, cages = perceiveRingsAndCages(topology,max_ring_size=max_ring_size,max_cage_rings=max_cage_rings)
+    gradient_vector_field.rings = rings
+    gradient_vector_field.cages = cages
+    return len(rings), len(cages)
+
+# The following functions give the geometry drawn for rings and cages
+
+# Closed outline of a ring following the paths of its AILs, as an (N,3) array, or None if its AILs
+# do not form a cycle of NACPs. The AILs may be in any order.
+def ringOutline(ring,critical_points):
+
+    ails = ring.atomic_interaction_lines
+    ends = [list(set(ail.getNuclearIndices(critical_points))) for ail in ails]
+    if not ails or any(len(nacp_indices) != 2 for nacp_indices in ends):
+        return None
+
+    start = current = ends[0][0]
+    used = set()
+    segments = []
+    for step in range(len(ails)):
+        following = next((n for n in range(len(ails)) if n not in used and current in ends[n]),None)
+        if following is None:
+            return None
+        used.add(following)
+        a, b = ends[following]
+        after = b if current == a else a
+        segment = ailPoints(ails[following],current,after,critical_points)
+        segments.append(segment if not segments else segment[1:])
+        current = after
+    if current != start:
+        return None
+    return numpy.concatenate(segments)[:-1]
+
+# Points of the paths of an AIL from the NACP of index u to that of index v
+def ailPoints(ail,u,v,critical_points):
+    u_position = numpy.asarray(critical_points[u].position_vector,dtype=numpy.float64)
+    v_position = numpy.asarray(critical_points[v].position_vector,dtype=numpy.float64)
+    halves = {}
+    for gradient_path in ail.gradient_paths:
+        nacp_index = gradient_path.getNuclearIndex(critical_points)
+        coordinates = numpy.asarray(gradient_path.getCoordinates(),dtype=numpy.float64)
+        if nacp_index in (u,v) and nacp_index not in halves and len(coordinates):
+            position = u_position if nacp_index == u else v_position
+            # Orient each half to run from its nucleus to the BCP
+            if numpy.linalg.norm(coordinates[0] - position) > numpy.linalg.norm(coordinates[-1] - position):
+                coordinates = coordinates[::-1]
+            halves[nacp_index] = coordinates
+    if u not in halves or v not in halves:
+        return numpy.array([u_position,v_position])
+    return numpy.concatenate((halves[u],halves[v][::-1][1:]))
+
+# Surface of a ring, a fan of triangles from the centroid of its outline, as a triangulation
+def ringSurface(ring,critical_points):
+    outline = ringOutline(ring,critical_points)
+    if outline is None or len(outline) < 3:
+        return None
+    num_points = len(outline)
+    coordinates = numpy.concatenate((outline,outline.mean(axis=0)[None,:]))
+    around = numpy.arange(num_points)
+    faces = numpy.column_stack((around,(around + 1) % num_points,numpy.full(num_points,num_points))).astype(numpy.int32)
+    return TopologyClasses.ColumnarTriangulation(coordinates,{},numpy.zeros((0,2),dtype=numpy.int32),faces)
+
+# Surface of a cage, the surfaces of its rings joined into one triangulation
+def cageSurface(cage,critical_points):
+    surfaces = [ringSurface(ring,critical_points) for ring in cage.rings]
+    surfaces = [surface for surface in surfaces if surface is not None]
+    if not surfaces:
+        return None
+    offsets = numpy.cumsum([0] + [len(surface.coordinates) for surface in surfaces[:-1]])
+    coordinates = numpy.concatenate([surface.coordinates for surface in surfaces])
+    faces = numpy.concatenate([surface.faces + offset for surface, offset in zip(surfaces,offsets.tolist())]).astype(numpy.int32)
+    return TopologyClasses.ColumnarTriangulation(coordinates,{},numpy.zeros((0,2),dtype=numpy.int32),faces)
@@ -0,0 +1,154 @@
+# Simplification Python 3 Module
+# Rhorix: An interface between quantum chemical topology and the 3D graphics program Blender
+
+# Gradient paths are written with a point at every integration step, so most of their points lie
+# on nearly straight stretches and add vertices to the curves drawn by Mapping without changing
+# their shape. These functions remove such points with the Ramer-Douglas-Peucker algorithm before
+# mapping, so that every removed point lies within a tolerance (in bohr) of the simplified path.
+# The first and last points of each path, at its critical points, are always kept.
+#
+# Rather than recursing on one segment at a time, every segment of every path of a collection is
+# split at once: each pass measures the distance of all points from the segment between the kept
+# points either side of them, and keeps the furthest point of each segment where that exceeds the
+# tolerance. The number of passes is the depth of the recursion, not the number of points kept.
+#
+# For smooth curves, Mapping may instead resample each path to points evenly spaced by arc length
+# and draw a Bezier spline through them, using resamplePolyline and bezierHandles.
+
+import numpy
+from . import TopologyClasses
+
+# Simplify the gradient paths of a gradient vector field in place. The paths of interatomic
+# surfaces without a triangulation are left alone if keep_surface_paths is True. SurfaceMesh
+# joins neighbouring paths by their fractions of length rather than by point index, so their
+# meshes stay within the tolerance of those of the original paths. Returns the number of points
+# removed and the number of points there were.
+def simplifyGradientVectorField(gradient_vector_field,tolerance,keep_surface_paths=False):
+
+    # Paths shared by several objects are listed once, so none is simplified twice, which could
+    # move it further than the tolerance from the original
+    gradient_paths = TopologyClasses.collectGeometry(gradient_vector_field)[0]
+    excluded = set()
+    if keep_surface_paths and (not isinstance(gradient_vector_field,TopologyClasses.LazyGradientVectorField)
+                               or gradient_vector_field.isLoaded('atomic_surfaces')):
+        for atomic_surface in gradient_vector_field.atomic_surfaces:
+            for interatomic_surface in atomic_surface.interatomic_surfaces:
+                if interatomic_surface.triangulation is None:
+                    excluded.update(id(gradient_path) for gradient_path in interatomic_surface.gradient_paths)
+
+    return simplifyGradientPaths([gradient_path for gradient_path in gradient_paths if id(gradient_path) not in excluded],tolerance)
+
+# Simplify the gradient paths of a topology in place, as simplifyGradientVectorField. Its
+# bounding volume and spatial index are cleared, to be rebuilt from the simplified paths.
+def simplifyTopology(topology,tolerance,keep_surface_paths=False):
+    removed, total = simplifyGradientVectorField(topology.gradient_vector_field,tolerance,keep_surface_paths)
+    if removed:
+        topology.bounds        = None
+        topology.spatial_index = None
+    return removed, total
+
+# Simplify a list of gradient paths in place. Returns the number of points removed and the
+# number of points there were. A tolerance of zero or less leaves the paths as they are.
+def simplifyGradientPaths(gradient_paths,tolerance):
+
+    coordinates = [gradient_path.getCoordinates() for gradient_path in gradient_paths]
+    lengths = numpy.array([len(path_coordinates) for path_coordinates in coordinates],dtype=numpy.int64)
+    total = int(lengths.sum())
+    if tolerance <= 0 or total == 0:
+        return 0, total
+
+    offsets = numpy.concatenate(([0],numpy.cumsum(lengths)))
+    keep = simplificationMask(numpy.concatenate(coordinates),offsets,tolerance)
+
+    removed = 0
+    for gradient_path, start, end in zip(gradient_paths,offsets[:-1].tolist(),offsets[1:].tolist()):
+        path_keep = keep[start:end]
+        if path_keep.all():
+            continue
+        removed += int(len(path_keep) - numpy.count_nonzero(path_keep))
+        if isinstance(gradient_path,TopologyClasses.ColumnarGradientPath):
+            gradient_path.coordinates = gradient_path.coordinates[path_keep]
+            gradient_path.scalar_properties = {key: column[path_keep] for key, column in gradient_path.scalar_properties.items()}
+        else:
+            gradient_path.points = [point for point, kept in zip(gradient_path.points,path_keep.tolist()) if kept]
+    return removed, total
+
+# Ramer-Douglas-Peucker simplification of the polylines held end to end in an (N,3) coordinate
+# array, the points of polyline i being coordinates[offsets[i]:offsets[i+1]]. Returns an (N,) bool
+# mask of the points to keep: the ends of every polyline, and enough other points that every
+# point removed is within tolerance of the segment joining the kept points either side of it.
+def simplificationMask(coordinates,offsets,tolerance):
+
+    coordinates = numpy.asarray(coordinates,dtype=numpy.float64)
+    offsets     = numpy.asarray(offsets,dtype=numpy.int64)
+    num_points  = len(coordinates)
+    keep        = numpy.zeros(num_points,dtype=bool)
+    starts      = offsets[:-1][offsets[1:] > offsets[:-1]]
+    ends        = offsets[1:][offsets[1:] > offsets[:-1]] - 1
+    keep[starts] = True
+    keep[ends]   = True
+
+    indices    = numpy.arange(num_points)
+    tolerance2 = tolerance * tolerance
+    # Points whose segment is within tolerance stay settled, and are not measured again
+    active = ~keep
+    while active.any():
+        # Kept points either side of each point; the ends of every polyline are kept, so these
+        # never belong to a different polyline
+        previous  = numpy.maximum.accumulate(numpy.where(keep,indices,0))
+        following = numpy.minimum.accumulate(numpy.where(keep,indices,num_points-1)[::-1])[::-1]
+
+        measured = numpy.flatnonzero(active)
+        a = coordinates[previous[measured]]
+        ab = coordinates[following[measured]] - a
+        ap = coordinates[measured] - a
+        length2 = numpy.einsum('ij,ij->i',ab,ab)
+        t = numpy.einsum('ij,ij->i',ap,ab) / numpy.where(length2 > 0,length2,1)
+        offset = ap - numpy.clip(t,0,1)[:,None] * ab
+        distance2 = numpy.einsum('ij,ij->i',offset,offset)
+
+        # The furthest point of each segment, taking the first where several are equally far.
+        # The points of a segment are consecutive in measured, so each segment is a group.
+        segment = previous[measured]
+        new_group = numpy.concatenate(([True],segment[1:] != segment[:-1]))
+        group_starts = numpy.flatnonzero(new_group)
+        group = numpy.cumsum(new_group) - 1
+        group_max = numpy.maximum.reduceat(distance2,group_starts)
+        candidates = numpy.flatnonzero((distance2 == group_max[group]) & (group_max[group] > tolerance2))
+        if len(candidates) == 0:
+            break
+        split = candidates[numpy.concatenate(([True],group[candidates][1:] != group[candidates][:-1]))]
+
+        keep[measured[split]] = True
+        # Only the points of segments that were split need measuring again
+        split_segments = numpy.zeros(num_points,dtype=bool)
+        split_segments[segment[split]] = True
+        active[measured] = split_segments[segment]
+        active &= ~keep
+    return keep
+
+# Points spaced evenly by arc length along a polyline, about spacing (in bohr) apart, as an (M,3)
+# array. The ends of the polyline are kept, so paths of every source program are drawn with the
+# same density of points whatever their integration steps were.
+def resamplePolyline(coordinates,spacing):
+
+    coordinates = numpy.asarray(coordinates,dtype=numpy.float64).reshape(-1,3)
+    if len(coordinates) < 2:
+        return coordinates.copy()
+    arc_length = numpy.concatenate(([0],numpy.cumsum(numpy.linalg.norm(numpy.diff(coordinates,axis=0),axis=1))))
+    num_intervals = max(1,int(round(arc_length[-1] / spacing)))
+    samples = numpy.linspace(0,arc_length[-1],num_intervals+1)
+    return numpy.column_stack([numpy.interp(samples,arc_length,coordinates[:,axis]) for axis in range(3)])
+
+# Handles of a smooth Bezier curve through an (M,3) array of points, as (M,3) arrays of the left
+# and right handle positions. The tangent at each point is that of a Catmull-Rom spline, half the
+# difference of its neighbours, so the curve is smooth through evenly spaced points.
+def bezierHandles(points):
+
+    points = numpy.asarray(points,dtype=numpy.float64).reshape(-1,3)
+    tangents = numpy.zeros_like(points)
+    if len(points) > 1:
+        tangents[1:-1] = (points[2:] - points[:-2]) / 2
+        tangents[0]    = points[1] - points[0]
+        tangents[-1]   = points[-1] - points[-2]
+    return points - tangents / 3, points + tangents / 3
@@ -0,0 +1,114 @@
+# SurfaceMesh Python 3 Module
+# Rhorix: An interface between quantum chemical topology and the 3D graphics program Blender
+
+# Interatomic surfaces and ring surfaces without a triangulation are given as gradient paths
+# leaving a common CP (a BCP or an RCP), each next to the one before it around the CP. These
+# functions mesh such a surface with a strip of triangles between each pair of neighbouring paths,
+# and one more strip from the last path back to the first, so that the surface is drawn as one
+# mesh with faces rather than as a curve per path.
+#
+# Neighbouring paths may have different numbers of points. Each point is given its fraction of
+# the length of its path, and each strip is zipped from the start of its two paths to their ends:
+# a triangle is added for each point of either path, taken in order of these fractions, joining
+# that point to the one before it on its own path and the current point of the other path. The
+# points of every strip of a surface are ordered at once with a single lexsort.
+
+import numpy
+from . import TopologyClasses
+
+# Mesh of the gradient paths of an interatomic or ring surface, as a ColumnarTriangulation, or None
+# if fewer than two paths have points. Points at which key (rho) is not greater than max_rho are
+# left out, as when drawing the wireframe of a surface. If centre is given, each path is oriented
+# to start nearest it, and if sort_by_angle is True the paths are ordered by their angle around
+# it rather than taken in the order given.
+def gradientPathSurface(gradient_paths,centre=None,max_rho=None,key='rho',sort_by_angle=False,closed=True):
+
+    paths = []
+    for gradient_path in gradient_paths:
+        coordinates = numpy.asarray(gradient_path.getCoordinates(),dtype=numpy.float64)
+        if centre is not None and len(coordinates) > 1:
+            if numpy.linalg.norm(coordinates[0] - centre) > numpy.linalg.norm(coordinates[-1] - centre):
+                coordinates = coordinates[::-1]
+                kept = slice(None,None,-1)
+            else:
+                kept = slice(None)
+        else:
+            kept = slice(None)
+        if max_rho is not None:
+            # Points without a value are kept
+            values = gradient_path.getScalarProperty(key)[kept]
+            coordinates = coordinates[~(values <= max_rho)]
+        if len(coordinates):
+            paths.append(coordinates)
+
+    if centre is not None and sort_by_angle and len(paths) > 2:
+        paths = [paths[n] for n in numpy.argsort(anglesAround(paths,numpy.asarray(centre,dtype=numpy.float64)),kind='mergesort')]
+
+    if len(paths) < 2:
+        return None
+    coordinates = numpy.concatenate(paths)
+    lengths = numpy.array([len(path) for path in paths],dtype=numpy.int64)
+    faces = zipStrips(coordinates,lengths,closed=closed and len(paths) > 2)
+    return TopologyClasses.ColumnarTriangulation(coordinates,{},numpy.zeros((0,2),dtype=numpy.int32),faces)
+
+# Triangles of the strips between neighbouring polylines held end to end in an (N,3) coordinate
+# array, polyline j having lengths[j] points, as an (F,3) array of vertex indices. Polyline j is
+# joined to polyline j+1, and the last to the first if closed. Triangles whose corners are not all
+# distinct points, e.g. at a CP where the paths meet, are left out.
+def zipStrips(coordinates,lengths,closed=True):
+
+    num_paths = len(lengths)
+    offsets = numpy.concatenate(([0],numpy.cumsum(lengths)))[:-1]
+    fractions = lengthFractions(coordinates,lengths)
+
+    a = numpy.arange(num_paths if closed else num_paths-1)
+    b = (a + 1) % num_paths
+    num_strips = len(a)
+
+    # An advance to each point but the first of path a (side 0) or path b (side 1) of each strip
+    sides = []
+    for side, path in ((0,a),(1,b)):
+        steps = lengths[path] - 1
+        strip = numpy.repeat(numpy.arange(num_strips),steps)
+        point = numpy.repeat(offsets[path] + 1 - exclusiveSum(steps),steps) + numpy.arange(steps.sum())
+        sides.append((strip,point,numpy.full(len(strip),side,dtype=numpy.int8)))
+    strip = numpy.concatenate((sides[0][0],sides[1][0]))
+    point = numpy.concatenate((sides[0][1],sides[1][1]))
+    side  = numpy.concatenate((sides[0][2],sides[1][2]))
+    order = numpy.lexsort((side,fractions[point],strip))
+    strip, point, side = strip[order], point[order], side[order]
+
+    # The number of advances along each path of its strip before each advance gives the current
+    # point of each path
+    advances_a = numpy.cumsum(side == 0) - (side == 0)
+    advances_b = numpy.cumsum(side == 1) - (side == 1)
+    first = numpy.concatenate(([0],numpy.cumsum(numpy.bincount(strip,minlength=num_strips))))[:-1]
+    current_a = offsets[a][strip] + advances_a - advances_a[first][strip]
+    current_b = offsets[b][strip] + advances_b - advances_b[first][strip]
+
+    # Advancing along a: (current a, next a, current b); along b: (current a, next b, current b)
+    faces = numpy.column_stack((current_a,numpy.where(side == 0,current_a + 1,current_b + 1),current_b))
+    corners = coordinates[faces]
+    distinct = (numpy.any(corners[:,0] != corners[:,1],axis=1) & numpy.any(corners[:,1] != corners[:,2],axis=1)
+                & numpy.any(corners[:,2] != corners[:,0],axis=1))
+    return faces[distinct].astype(numpy.int32)
+
+# Fraction of the length of its polyline at each point, 0 at the start and 1 at the end of each
+def lengthFractions(coordinates,lengths):
+    step_lengths = numpy.concatenate(([0],numpy.linalg.norm(numpy.diff(coordinates,axis=0),axis=1)))
+    starts = numpy.concatenate(([0],numpy.cumsum(lengths)))[:-1]
+    step_lengths[starts] = 0
+    along = numpy.cumsum(step_lengths)
+    along -= numpy.repeat(along[starts],lengths)
+    totals = numpy.repeat(along[starts + lengths - 1],lengths)
+    return numpy.where(totals > 0,along / numpy.where(totals > 0,totals,1),0.0)
+
+# Angle of each path around centre, in the plane that best fits the directions from centre to the
+# middle point of each path
+def anglesAround(paths,centre):
+    directions = numpy.array([path[len(path)//2] for path in paths]) - centre
+    axes = numpy.linalg.svd(directions,full_matrices=False)[2]
+    return numpy.arctan2(directions.dot(axes[1]),directions.dot(axes[0]))
+
+def exclusiveSum(counts):
+    return numpy.concatenate(([0],numpy.cumsum(counts)))[:-1]
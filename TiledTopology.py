@@ -0,0 +1,351 @@
+# TiledTopology Python 3 Module
+# Rhorix: An interface between quantum chemical topology and the 3D graphics program Blender
+
+# Out-of-core access to topologies too large to load whole.
+#
+# writeTiledTopology partitions the atomic basin paths, interatomic surfaces, ring surfaces and
+# envelopes of a Topology between the leaves of an octree, and writes each leaf (a tile) as a
+# section of a binary topology file (see BinaryTopology). Basin paths are tiled individually, as
+# a single basin may span much of the system; each interatomic surface, ring surface and
+# envelope is kept whole in the tile containing the centre of its bounding box. A leaf is split
+# while it holds more than max_points_per_tile points, down to max_depth levels. The nuclei,
+# critical points, molecular graph, rings and cages are small and are stored untiled, so the
+# file is also read by BinaryTopology.readTopology, which gives the topology without its tiled
+# collections. The table of contents lists a summary of each tile under 'tiles':
+#   section             - name of the section holding the tile
+#   octant              - path of the leaf from the root of the octree, one digit 0-7 per level
+#   minimum, maximum    - bounding box of the geometry in the tile
+#   num_points          - number of points (path points, envelope points and vertices)
+#   num_gradient_paths  - number of gradient paths
+#   num_triangulations  - number of triangulations
+#   property_ranges     - dict from scalar property name to the [low,high] of its values
+#
+# A TiledTopologyFile reads the untiled part on opening, then loads the tiles intersecting a box
+# or a camera frustum on request. Each load adds the new geometry to the topology in place, in
+# its original order, and returns a GradientVectorField holding just that geometry so that only
+# it needs to be drawn. Tiles already loaded are skipped, so as the region of interest moves the
+# same call streams in the tiles newly within it. Loading every tile reproduces the original
+# topology, less any basins and surfaces that had no geometry at all.
+
+import collections
+import itertools
+import numpy
+from . import BinaryTopology, TopologyClasses
+
+# Write topology to filepath as a tiled binary topology file. precision is the dtype used for
+# coordinates and scalar properties, either 'float64' or 'float32'.
+def writeTiledTopology(topology,filepath,max_points_per_tile=65536,max_depth=8,precision='float64'):
+
+    dtype = numpy.dtype(precision)
+    gvf = topology.gradient_vector_field
+    untiled = TopologyClasses.Topology(topology.name,topology.nuclei,topology.critical_points,
+                                       TopologyClasses.GradientVectorField(gvf.molecular_graph,[],[],[],[],gvf.rings,gvf.cages))
+    toc, sections = BinaryTopology.encodeTopology(untiled,dtype)
+
+    items = tileItems(gvf)
+    minima  = numpy.empty((len(items),3))
+    maxima  = numpy.empty((len(items),3))
+    centers = numpy.empty((len(items),3))
+    num_points = numpy.zeros(len(items),dtype=numpy.int64)
+    for n, item in enumerate(items):
+        coordinates = itemCoordinates(item)
+        num_points[n] = len(coordinates)
+        if len(coordinates):
+            minima[n] = coordinates.min(axis=0)
+            maxima[n] = coordinates.max(axis=0)
+        else:
+            minima[n], maxima[n] = numpy.inf, -numpy.inf
+    low  = minima.min(axis=0) if len(items) else numpy.zeros(3)
+    high = maxima.max(axis=0) if len(items) else numpy.zeros(3)
+    low, high = numpy.minimum(low,high), numpy.maximum(low,high) # no geometry at all
+    centers[:] = numpy.where(num_points[:,None] > 0,(minima + maxima) / 2.0,low)
+
+    toc['tiles'] = []
+    def tileSections():
+        leaves = partitionOctree(centers,num_points,low,high,max_points_per_tile,max_depth)
+        for n, (octant, members, octant_low, octant_high) in enumerate(leaves):
+            metadata, arrays = encodeTile([items[m] for m in members.tolist()],dtype)
+            has_points = num_points[members] > 0
+            summary = {'section': 'tile/'+str(n),
+                       'octant': octant,
+                       'minimum': minima[members][has_points].min(axis=0).tolist() if has_points.any() else octant_low.tolist(),
+                       'maximum': maxima[members][has_points].max(axis=0).tolist() if has_points.any() else octant_high.tolist(),
+                       'num_points': int(num_points[members].sum()),
+                       'num_gradient_paths': metadata['num_gradient_paths'],
+                       'num_triangulations': metadata['num_triangulations'],
+                       'property_ranges': propertyRanges(arrays)}
+            toc['tiles'].append(summary)
+            yield summary['section'], (metadata,arrays)
+
+    BinaryTopology.writeSections(filepath,toc,itertools.chain(sections.items(),tileSections()))
+
+# The units of geometry placed in tiles, as (kind, container, rank, object) tuples:
+#   ('atomic_basin', i, rank, gradient_path)     - the rank-th path of atomic basin i
+#   ('interatomic_surface', (i,j), nacp_index, interatomic_surface) - surface j of atomic surface i
+#   ('ring_surface', i, None, ring_surface)
+#   ('envelope', i, None, envelope)
+def tileItems(gradient_vector_field):
+    items = []
+    for i, atomic_basin in enumerate(gradient_vector_field.atomic_basins):
+        for rank, gradient_path in enumerate(atomic_basin.gradient_paths):
+            items.append(('atomic_basin',i,rank,gradient_path))
+    for i, atomic_surface in enumerate(gradient_vector_field.atomic_surfaces):
+        for j, interatomic_surface in enumerate(atomic_surface.interatomic_surfaces):
+            items.append(('interatomic_surface',(i,j),atomic_surface.nacp_index,interatomic_surface))
+    for i, ring_surface in enumerate(gradient_vector_field.ring_surfaces):
+        items.append(('ring_surface',i,None,ring_surface))
+    for i, envelope in enumerate(gradient_vector_field.envelopes):
+        items.append(('envelope',i,None,envelope))
+    return items
+
+# All the coordinates of an item as an (N,3) array
+def itemCoordinates(item):
+    kind, container, rank, item_object = item
+    if kind == 'atomic_basin':
+        return item_object.getCoordinates()
+    arrays = []
+    if kind == 'envelope':
+        arrays.append(numpy.array([point.position_vector for point in item_object.points],dtype=numpy.float64).reshape(-1,3))
+    else:
+        arrays.extend(gradient_path.getCoordinates() for gradient_path in item_object.gradient_paths)
+    if kind != 'ring_surface' and item_object.triangulation is not None:
+        arrays.append(item_object.triangulation.getCoordinates())
+    return numpy.concatenate(arrays) if arrays else numpy.zeros((0,3))
+
+# Split items between the leaves of an octree over the box low..high by the octant of their
+# centers. Returns (octant, member indices, octant low, octant high) for each non-empty leaf in
+# depth-first order.
+def partitionOctree(centers,num_points,low,high,max_points_per_tile,max_depth):
+
+    leaves = []
+    stack = [('',numpy.arange(len(centers)),low,high)]
+    while stack:
+        octant, members, low, high = stack.pop()
+        if len(octant) >= max_depth or len(members) <= 1 or num_points[members].sum() <= max_points_per_tile:
+            leaves.append((octant,members,low,high))
+            continue
+        middle = (low + high) / 2.0
+        codes = ((centers[members] >= middle) * numpy.array([1,2,4])).sum(axis=1)
+        for code in range(7,-1,-1): # pushed in reverse so that octant 0 is visited first
+            child = members[codes == code]
+            if len(child):
+                upper = numpy.array([code & 1,code & 2,code & 4],dtype=bool)
+                stack.append((octant+str(code),child,numpy.where(upper,middle,low),numpy.where(upper,high,middle)))
+    return leaves
+
+# Convert the items of a tile to the metadata and arrays of its section
+def encodeTile(items,dtype):
+
+    metadata = {}
+    arrays = collections.OrderedDict()
+    by_kind = {}
+    for item in items:
+        by_kind.setdefault(item[0],[]).append(item)
+
+    basin_items = by_kind.get('atomic_basin',[])
+    metadata['atomic_basin_paths'] = len(basin_items)
+    if basin_items:
+        BinaryTopology.encodeGradientPaths(arrays,'atomic_basin/',[item[3] for item in basin_items],dtype)
+        arrays['atomic_basin/basins'] = numpy.array([item[1] for item in basin_items],dtype=numpy.int32)
+        arrays['atomic_basin/ranks']  = numpy.array([item[2] for item in basin_items],dtype=numpy.int64)
+
+    surface_items = by_kind.get('interatomic_surface',[])
+    metadata['interatomic_surfaces'] = []
+    if surface_items:
+        surfaces = [item[3] for item in surface_items]
+        BinaryTopology.encodeGradientPaths(arrays,'interatomic_surface/',[path for surface in surfaces for path in surface.gradient_paths],dtype)
+        arrays['interatomic_surface/path_offsets'] = BinaryTopology.encodeOffsets([len(surface.gradient_paths) for surface in surfaces])
+        for n, (kind, (i, j), nacp_index, surface) in enumerate(surface_items):
+            metadata['interatomic_surfaces'].append([i,j,nacp_index,surface.triangulation is not None])
+            if surface.triangulation is not None:
+                BinaryTopology.encodeTriangulation(arrays,'interatomic_surface/triangulation/'+str(n)+'/',surface.triangulation,dtype)
+
+    ring_surface_items = by_kind.get('ring_surface',[])
+    metadata['ring_surfaces'] = [item[1] for item in ring_surface_items]
+    if ring_surface_items:
+        ring_surfaces = [item[3] for item in ring_surface_items]
+        BinaryTopology.encodeGradientPaths(arrays,'ring_surface/',[path for surface in ring_surfaces for path in surface.gradient_paths],dtype)
+        arrays['ring_surface/path_offsets'] = BinaryTopology.encodeOffsets([len(surface.gradient_paths) for surface in ring_surfaces])
+
+    metadata['envelopes'] = []
+    for n, (kind, i, rank, envelope) in enumerate(by_kind.get('envelope',[])):
+        prefix = 'envelope/'+str(n)+'/'
+        metadata['envelopes'].append([i,envelope.isovalue,envelope.triangulation is not None])
+        BinaryTopology.encodePoints(arrays,prefix,envelope.points,dtype)
+        if envelope.triangulation is not None:
+            BinaryTopology.encodeTriangulation(arrays,prefix+'triangulation/',envelope.triangulation,dtype)
+
+    metadata['num_gradient_paths'] = (len(basin_items)
+                                      + sum(len(item[3].gradient_paths) for item in surface_items + ring_surface_items))
+    metadata['num_triangulations'] = (sum(1 for entry in metadata['interatomic_surfaces'] if entry[3])
+                                      + sum(1 for entry in metadata['envelopes'] if entry[2]))
+    return metadata, arrays
+
+# [low,high] of each scalar property among the arrays of a tile, ignoring NaN
+def propertyRanges(arrays):
+    ranges = {}
+    for name, array in arrays.items():
+        if '/property/' not in name:
+            continue
+        values = array[~numpy.isnan(array)]
+        if not len(values):
+            continue
+        key = name.rsplit('/property/',1)[1]
+        low, high = float(values.min()), float(values.max())
+        if key in ranges:
+            low, high = min(low,ranges[key][0]), max(high,ranges[key][1])
+        ranges[key] = [low,high]
+    return ranges
+
+# A tiled binary topology file. topology holds the untiled part on opening, and the geometry of
+# each tile is added to it as the tile is loaded.
+class TiledTopologyFile(BinaryTopology.BinaryTopologyFile):
+
+    def __init__(self,filepath):
+
+        BinaryTopology.BinaryTopologyFile.__init__(self,filepath)
+        if 'tiles' not in self.toc:
+            raise ValueError(filepath+' is not a tiled binary topology file')
+        self.tiles        = self.toc['tiles']
+        self.tile_minimum = numpy.array([tile['minimum'] for tile in self.tiles],dtype=numpy.float64).reshape(-1,3)
+        self.tile_maximum = numpy.array([tile['maximum'] for tile in self.tiles],dtype=numpy.float64).reshape(-1,3)
+        self.loaded_tiles = set()
+        self.topology     = self.readTopology()
+
+        # The containers loaded so far, by their index in the original topology
+        self.atomic_basins        = {} # basin index to AtomicBasin
+        self.atomic_basin_paths   = {} # basin index to [(rank,gradient_path)]
+        self.atomic_surfaces      = {} # atomic surface index to AtomicSurface
+        self.interatomic_surfaces = {} # atomic surface index to {j: InteratomicSurface}
+        self.ring_surfaces        = {} # ring surface index to RingSurface
+        self.envelopes            = {} # envelope index to Envelope
+
+    # Numbers of the tiles whose bounding boxes intersect the box minimum..maximum
+    def tilesInBox(self,minimum,maximum):
+        minimum = numpy.array(tuple(minimum),dtype=numpy.float64)
+        maximum = numpy.array(tuple(maximum),dtype=numpy.float64)
+        intersects = (self.tile_maximum >= minimum).all(axis=1) & (self.tile_minimum <= maximum).all(axis=1)
+        return numpy.flatnonzero(intersects).tolist()
+
+    # Numbers of the tiles whose bounding boxes are not wholly outside any of planes, each a pair
+    # (normal,offset) bounding the region where dot(normal,x) + offset >= 0, e.g. the six planes
+    # of a camera frustum (see World.cameraFrustumPlanes). The test is conservative: a box near
+    # an edge of the frustum but outside it may be included.
+    def tilesInFrustum(self,planes):
+        inside = numpy.ones(len(self.tiles),dtype=bool)
+        for normal, offset in planes:
+            normal = numpy.array(tuple(normal),dtype=numpy.float64)
+            # the corner of each box furthest along the normal
+            corner = numpy.where(normal >= 0.0,self.tile_maximum,self.tile_minimum)
+            inside &= corner.dot(normal) + offset >= 0.0
+        return numpy.flatnonzero(inside).tolist()
+
+    def loadBox(self,minimum,maximum):
+        return self.loadTiles(self.tilesInBox(minimum,maximum))
+
+    def loadFrustum(self,planes):
+        return self.loadTiles(self.tilesInFrustum(planes))
+
+    def loadAll(self):
+        return self.loadTiles(range(len(self.tiles)))
+
+    # Load the given tiles, skipping those already loaded, and add their geometry to topology
+    # Returns a GradientVectorField holding only the geometry loaded by this call
+    def loadTiles(self,tiles):
+
+        new_basin_paths          = {} # basin index to [(rank,gradient_path)]
+        new_interatomic_surfaces = {}
+        new_ring_surfaces        = {}
+        new_envelopes            = {}
+
+        for tile in tiles:
+            if tile in self.loaded_tiles:
+                continue
+            self.loaded_tiles.add(tile)
+            section = self.section(self.tiles[tile]['section'])
+            metadata = section.metadata
+
+            if metadata['atomic_basin_paths']:
+                gradient_paths = section.gradientPaths('atomic_basin/')
+                basins = section.array('atomic_basin/basins').tolist()
+                ranks  = section.array('atomic_basin/ranks').tolist()
+                for gradient_path, basin, rank in zip(gradient_paths,basins,ranks):
+                    new_basin_paths.setdefault(basin,[]).append((rank,gradient_path))
+                    self.atomic_basin_paths.setdefault(basin,[]).append((rank,gradient_path))
+
+            if metadata['interatomic_surfaces']:
+                gradient_paths = section.gradientPaths('interatomic_surface/')
+                paths = BinaryTopology.split(gradient_paths,section.array('interatomic_surface/path_offsets'))
+                for n, (i, j, nacp_index, triangulated) in enumerate(metadata['interatomic_surfaces']):
+                    triangulation = None
+                    if triangulated:
+                        triangulation = section.triangulation('interatomic_surface/triangulation/'+str(n)+'/')
+                    interatomic_surface = TopologyClasses.InteratomicSurface(paths[n],triangulation)
+                    new_interatomic_surfaces.setdefault(i,{})[j] = interatomic_surface
+                    self.interatomic_surfaces.setdefault(i,{})[j] = interatomic_surface
+                    if i not in self.atomic_surfaces:
+                        self.atomic_surfaces[i] = TopologyClasses.AtomicSurface([],nacp_index=nacp_index)
+
+            if metadata['ring_surfaces']:
+                gradient_paths = section.gradientPaths('ring_surface/')
+                paths = BinaryTopology.split(gradient_paths,section.array('ring_surface/path_offsets'))
+                for i, ring_surface_paths in zip(metadata['ring_surfaces'],paths):
+                    new_ring_surfaces[i] = TopologyClasses.RingSurface(ring_surface_paths)
+                    self.ring_surfaces[i] = new_ring_surfaces[i]
+
+            for n, (i, isovalue, triangulated) in enumerate(metadata['envelopes']):
+                prefix = 'envelope/'+str(n)+'/'
+                points = TopologyClasses.pointsFromColumns(section.array(prefix+'coordinates'),section.properties(prefix))
+                triangulation = None
+                if triangulated:
+                    triangulation = section.triangulation(prefix+'triangulation/')
+                new_envelopes[i] = TopologyClasses.Envelope(isovalue,points,triangulation)
+                self.envelopes[i] = new_envelopes[i]
+
+        # Rebuild the collections of the topology in their original order
+        for basin in new_basin_paths:
+            if basin not in self.atomic_basins:
+                self.atomic_basins[basin] = TopologyClasses.AtomicBasin([])
+            self.atomic_basins[basin].gradient_paths = rankedPaths(self.atomic_basin_paths[basin])
+        for i in new_interatomic_surfaces:
+            surfaces = self.interatomic_surfaces[i]
+            self.atomic_surfaces[i].interatomic_surfaces = [surfaces[j] for j in sorted(surfaces)]
+
+        gvf = self.topology.gradient_vector_field
+        gvf.atomic_basins   = [self.atomic_basins[i] for i in sorted(self.atomic_basins)]
+        gvf.atomic_surfaces = [self.atomic_surfaces[i] for i in sorted(self.atomic_surfaces)]
+        gvf.ring_surfaces   = [self.ring_surfaces[i] for i in sorted(self.ring_surfaces)]
+        gvf.envelopes       = [self.envelopes[i] for i in sorted(self.envelopes)]
+
+        # The cached index, bounds and spatial index no longer cover the whole topology
+        self.topology.index         = None
+        self.topology.bounds        = None
+        self.topology.spatial_index = None
+
+        new_atomic_surfaces = []
+        for i in sorted(new_interatomic_surfaces):
+            surfaces = new_interatomic_surfaces[i]
+            new_atomic_surfaces.append(TopologyClasses.AtomicSurface([surfaces[j] for j in sorted(surfaces)],
+                                                                     nacp_index=self.atomic_surfaces[i].nacp_index))
+        return TopologyClasses.GradientVectorField(TopologyClasses.MolecularGraph([]),
+                                                   [TopologyClasses.AtomicBasin(rankedPaths(new_basin_paths[i])) for i in sorted(new_basin_paths)],
+                                                   [new_envelopes[i] for i in sorted(new_envelopes)],
+                                                   new_atomic_surfaces,
+                                                   [new_ring_surfaces[i] for i in sorted(new_ring_surfaces)],
+                                                   [],
+                                                   [])
+
+    # Index the objects of a gradient vector field returned by loadTiles (see
+    # TopologyClasses.TopologyIndex), so that they have the same CP references as those of an
+    # indexed topology. Only the newly loaded objects are indexed, and the problems found are theirs.
+    def indexTiles(self,gradient_vector_field):
+        topology = self.topology
+        return TopologyClasses.TopologyIndex(TopologyClasses.Topology(topology.name,topology.nuclei,topology.critical_points,gradient_vector_field))
+
+# The gradient paths of a list of (rank,gradient_path) pairs in order of rank
+def rankedPaths(ranked_paths):
+    return [gradient_path for rank, gradient_path in sorted(ranked_paths,key=lambda ranked_path: ranked_path[0])]
+
+# True if filepath is a binary topology file holding tiles
+def isTiled(filepath):
+    return 'tiles' in BinaryTopology.readTableOfContents(filepath)
@@ -3,85 +3,413 @@
 
 # This is a Python implementation of the class hierarchy needed to parse XML files
 # adhering to the document model defined in Topology.dtd.
+#
+# A large topology holds millions of points, so every class declares __slots__ rather than
+# carrying a per-instance __dict__, and the parsers intern the scalar property keys and
+# element symbols so that each distinct string is held once. Array-backed (columnar) objects
+# keep float32 coordinates and scalar properties as float32 instead of widening them to
+# float64 (see convertPrecision).
 
-import mathutils
 import math
+import sys
+import numpy
 
 class Point():
+
+    __slots__ = ('position_vector','scalar_properties')
+
     def __init__(self,position_vector,scalar_properties):
         self.position_vector   = position_vector
         self.scalar_properties = scalar_properties
 
 class Topology():
-	
+
+    __slots__ = ('name','nuclei','critical_points','gradient_vector_field','index','bounds','spatial_index')
+
     def __init__(self,name,nuclei,critical_points,gradient_vector_field):
         self.name                  = name
         self.nuclei                = nuclei
         self.critical_points       = critical_points
         self.gradient_vector_field = gradient_vector_field
+        self.index                 = None
+        self.bounds                = None
+        self.spatial_index         = None
+
+    # Build the cross-reference index of the topology (see TopologyIndex), which also makes the
+    # CP lookups of the gradient paths and their containers O(1). Called once after loading.
+    def buildIndex(self):
+        self.index = TopologyIndex(self)
+        return self.index
+
+    # The bounding box and sphere of everything in the topology (see BoundingVolume), computed
+    # on first use. Used to place the camera and lights.
+    def computeBounds(self):
+        if self.bounds is None:
+            self.bounds = BoundingVolume(self)
+        return self.bounds
+
+    # The spatial index of the critical points and gradient paths (see SpatialIndex), built on
+    # first use
+    def getSpatialIndex(self):
+        if self.spatial_index is None:
+            self.spatial_index = SpatialIndex(self)
+        return self.spatial_index
+
+# Axis-aligned bounding box and bounding sphere of the nuclei, critical points, gradient path
+# points, envelope points and triangulation vertices of a topology:
+#   minimum, maximum - opposite corners of the box
+#   center, radius   - sphere about the center of the box containing every point
+# Points are gathered into NumPy arrays (those of columnar objects are used as they are) and
+# reduced array by array, so no Python loop runs per point. A topology with no points has a
+# zero radius sphere at the origin. Collections of a LazyGradientVectorField are only included
+# if already loaded.
+class BoundingVolume():
+
+    __slots__ = ('minimum','maximum','center','radius')
+
+    def __init__(self,topology):
+
+        gradient_paths, triangulations, envelopes = collectGeometry(topology.gradient_vector_field)
+
+        # Positions of Point objects are collected into one array rather than one per path
+        positions = [nucleus.position_vector for nucleus in topology.nuclei]
+        positions.extend(cp.position_vector for cp in topology.critical_points)
+        arrays = []
+        for item in gradient_paths + triangulations:
+            if isinstance(item,(ColumnarGradientPath,ColumnarTriangulation)):
+                arrays.append(item.coordinates)
+            else:
+                positions.extend(point.position_vector for point in item.points)
+        for envelope in envelopes:
+            positions.extend(point.position_vector for point in envelope.points)
+        arrays.append(numpy.array(positions,dtype=numpy.float64).reshape(-1,3))
+        arrays = [array for array in arrays if len(array)]
+
+        if not arrays:
+            self.minimum = self.maximum = self.center = (0.0,0.0,0.0)
+            self.radius  = 0.0
+            return
+
+        minimum = numpy.min([array.min(axis=0) for array in arrays],axis=0).astype(numpy.float64)
+        maximum = numpy.max([array.max(axis=0) for array in arrays],axis=0).astype(numpy.float64)
+        center = (minimum + maximum) / 2.0
+        radius_squared = max(float(numpy.einsum('ij,ij->i',array - center,array - center).max()) for array in arrays)
+
+        self.minimum = tuple(minimum.tolist())
+        self.maximum = tuple(maximum.tolist())
+        self.center  = tuple(center.tolist())
+        self.radius  = math.sqrt(radius_squared)
+
+# Spatial index of the critical points and gradient path points of a topology, answering radius,
+# box and k-nearest queries with the CriticalPoint and GradientPath objects themselves. Results
+# of radius and box queries are in the order of the critical points or of collectGeometry, and
+# k-nearest results are nearest first. A gradient path matches if any of its points does, so a
+# path passing through a box between two consecutive points is not found. Collections of a
+# LazyGradientVectorField are only indexed if already loaded.
+class SpatialIndex():
+
+    __slots__ = ('critical_points','gradient_paths','critical_point_grid','gradient_path_grid')
+
+    def __init__(self,topology,cell_size=None):
+
+        self.critical_points = list(topology.critical_points)
+        coordinates = numpy.array([cp.position_vector for cp in self.critical_points],dtype=numpy.float64).reshape(-1,3)
+        self.critical_point_grid = PointGrid(coordinates,numpy.arange(len(coordinates)),cell_size)
+
+        self.gradient_paths = collectGeometry(topology.gradient_vector_field)[0]
+        arrays = [gradient_path.getCoordinates() for gradient_path in self.gradient_paths]
+        coordinates = numpy.concatenate(arrays).astype(numpy.float64,copy=False) if arrays else numpy.zeros((0,3))
+        owners = numpy.repeat(numpy.arange(len(arrays)),[len(array) for array in arrays])
+        self.gradient_path_grid = PointGrid(coordinates,owners,cell_size)
+
+    def criticalPointsInRadius(self,center,radius):
+        return [self.critical_points[n] for n in self.critical_point_grid.ownersInRadius(center,radius)]
+
+    def criticalPointsInBox(self,minimum,maximum):
+        return [self.critical_points[n] for n in self.critical_point_grid.ownersInBox(minimum,maximum)]
+
+    def nearestCriticalPoints(self,position,k=1):
+        return [self.critical_points[n] for n in self.critical_point_grid.nearestOwners(position,k)]
+
+    def gradientPathsInRadius(self,center,radius):
+        return [self.gradient_paths[n] for n in self.gradient_path_grid.ownersInRadius(center,radius)]
+
+    def gradientPathsInBox(self,minimum,maximum):
+        return [self.gradient_paths[n] for n in self.gradient_path_grid.ownersInBox(minimum,maximum)]
+
+    def nearestGradientPaths(self,position,k=1):
+        return [self.gradient_paths[n] for n in self.gradient_path_grid.nearestOwners(position,k)]
+
+# Uniform grid over an (N,3) array of points, each belonging to the object numbered by owners.
+# The points are sorted by cell and only occupied cells are stored, as a sorted array of cell
+# keys with the start of each cell's points, so memory is O(N) however the points are spread.
+# A query finds the occupied cells overlapping its box by binary search (or, for a box spanning
+# more cells than are occupied, by testing every occupied cell) and tests only their points.
+# Unless given, the cell size is chosen for about points_per_cell points per cell were the
+# points spread evenly through their bounding box.
+class PointGrid():
+
+    __slots__ = ('points','owners','origin','cell_size','dims','cell_keys','cell_starts','cell_coordinates')
+
+    def __init__(self,points,owners,cell_size=None,points_per_cell=8):
+
+        num_points = len(points)
+        self.origin = points.min(axis=0) if num_points else numpy.zeros(3)
+        extent = points.max(axis=0) - self.origin if num_points else numpy.zeros(3)
+        if cell_size is None:
+            cell_size = float(extent.max()) / max(1.0,(num_points / points_per_cell) ** (1.0/3.0))
+        self.cell_size = cell_size if cell_size > 0.0 else 1.0
+        self.dims = numpy.floor(extent / self.cell_size).astype(numpy.int64) + 1
+        if float(numpy.prod(self.dims.astype(numpy.float64))) >= 2.0**62:
+            raise ValueError('Cell size ' + str(cell_size) + ' is too small for the extent of the points')
+
+        cells = self.cellOf(points)
+        keys = (cells[:,0] * self.dims[1] + cells[:,1]) * self.dims[2] + cells[:,2]
+        order = numpy.argsort(keys,kind='mergesort')
+        self.points = numpy.ascontiguousarray(points[order])
+        self.owners = numpy.asarray(owners)[order]
+        self.cell_keys, starts = numpy.unique(keys[order],return_index=True)
+        self.cell_starts = numpy.append(starts,num_points)
+        self.cell_coordinates = cells[order][starts]
+
+    # Integer cell coordinates of an (N,3) array of positions, clipped to the grid
+    def cellOf(self,positions):
+        cells = numpy.floor((positions - self.origin) / self.cell_size).astype(numpy.int64)
+        return numpy.clip(cells,0,self.dims-1)
+
+    # Indices into self.points of the points in the cells overlapping the box low..high
+    def candidateIndices(self,low,high):
+
+        first = numpy.floor((low - self.origin) / self.cell_size)
+        last  = numpy.floor((high - self.origin) / self.cell_size)
+        if not len(self.cell_keys) or (last < 0).any() or (first >= self.dims).any() or (first > last).any():
+            return numpy.zeros(0,dtype=numpy.int64)
+        first = numpy.maximum(first,0).astype(numpy.int64)
+        last  = numpy.minimum(last,self.dims-1).astype(numpy.int64)
+
+        if numpy.prod(last - first + 1) > len(self.cell_keys):
+            inside = ((self.cell_coordinates >= first) & (self.cell_coordinates <= last)).all(axis=1)
+            cells = numpy.flatnonzero(inside)
+        else:
+            keys = ((numpy.arange(first[0],last[0]+1)[:,None,None] * self.dims[1]
+                     + numpy.arange(first[1],last[1]+1)[None,:,None]) * self.dims[2]
+                    + numpy.arange(first[2],last[2]+1)[None,None,:]).ravel()
+            positions = numpy.minimum(numpy.searchsorted(self.cell_keys,keys),len(self.cell_keys)-1)
+            cells = positions[self.cell_keys[positions] == keys]
+
+        # Concatenate the ranges of points of the cells without a Python loop
+        starts  = self.cell_starts[cells]
+        lengths = self.cell_starts[cells+1] - starts
+        offsets = numpy.repeat(starts - numpy.cumsum(lengths) + lengths,lengths)
+        return offsets + numpy.arange(len(offsets))
+
+    # Sorted owners of the points within radius of center
+    def ownersInRadius(self,center,radius):
+        center = numpy.array(tuple(center),dtype=numpy.float64)
+        indices = self.candidateIndices(center - radius,center + radius)
+        offsets = self.points[indices] - center
+        within = numpy.einsum('ij,ij->i',offsets,offsets) <= radius * radius
+        return numpy.unique(self.owners[indices[within]]).tolist()
+
+    # Sorted owners of the points within the box minimum..maximum
+    def ownersInBox(self,minimum,maximum):
+        minimum = numpy.array(tuple(minimum),dtype=numpy.float64)
+        maximum = numpy.array(tuple(maximum),dtype=numpy.float64)
+        indices = self.candidateIndices(minimum,maximum)
+        points = self.points[indices]
+        inside = ((points >= minimum) & (points <= maximum)).all(axis=1)
+        return numpy.unique(self.owners[indices[inside]]).tolist()
+
+    # The k owners with the points nearest to position, nearest first. The search reaches out
+    # to the k-th nearest owner among the points of the cell containing position, or failing
+    # that grows until k owners are found within reach. Every point within reach is a candidate,
+    # so no owner outside it can be nearer.
+    def nearestOwners(self,position,k):
+
+        position = numpy.array(tuple(position),dtype=numpy.float64)
+        if not len(self.points) or k < 1:
+            return []
+        grid_low  = self.origin
+        grid_high = self.origin + self.dims * self.cell_size
+
+        reach = self.cell_size
+        owners, distances = self.nearestOf(self.candidateIndices(position,position),position)
+        if len(owners) >= k:
+            reach = math.sqrt(distances[k-1])
+        while True:
+            covers_grid = (position - reach <= grid_low).all() and (position + reach >= grid_high).all()
+            indices = self.candidateIndices(position - reach,position + reach)
+            owners, distances = self.nearestOf(indices,position,None if covers_grid else reach)
+            if len(owners) >= k or covers_grid:
+                return owners[:k].tolist()
+            reach *= 2.0
+
+    # The distinct owners of the points at indices, nearest to position first, with the squared
+    # distance of the nearest point of each; points further than reach are left out if it is given
+    def nearestOf(self,indices,position,reach=None):
+        offsets = self.points[indices] - position
+        distances = numpy.einsum('ij,ij->i',offsets,offsets)
+        if reach is not None:
+            within = distances <= reach * reach
+            indices, distances = indices[within], distances[within]
+        order = numpy.argsort(distances,kind='mergesort')
+        owners, nearest = numpy.unique(self.owners[indices[order]],return_index=True)
+        nearest.sort()
+        return self.owners[indices[order[nearest]]], distances[order[nearest]]
+
+# The kinds of critical point, indexed by the codes returned by CriticalPoint.computeTypeCode
+cp_kinds = ('nacp','bcp','rcp','ccp','unk','dgn')
+NACP, BCP, RCP, CCP, UNK, DGN = range(len(cp_kinds))
+
+# Cross-reference index of a topology, built once after loading by Topology.buildIndex:
+#   cp_type_codes      - (N,) array of the kind code (see cp_kinds) of each critical point
+#   cp_indices_by_kind - dict from each of cp_kinds to the array of indices of CPs of that kind
+#   problems           - descriptions of the dangling or missing references found
+# Each gradient path is given the indices of its first NACP, BCP and RCP (nacp_index, bcp_index,
+# rcp_index), each AIL its BCP and NACPs (bcp_index, nacp_indices), each atomic basin its NACP,
+# each interatomic surface its BCP and each ring surface its RCP, so that the lookups made while
+# mapping are O(1). Missing references are left as None and reported in problems, as are CP
+# indices beyond the critical points and NACPs without a nucleus of the same index. Negative
+# indices (cp_index 0 in the file) mark a path end not at a CP and are ignored.
+# Collections of a LazyGradientVectorField are only indexed if already loaded.
+class TopologyIndex():
+
+    __slots__ = ('cp_type_codes','cp_indices_by_kind','problems','codes','num_nuclei')
+
+    def __init__(self,topology):
+
+        self.cp_type_codes = numpy.array([cp.computeTypeCode() for cp in topology.critical_points],dtype=numpy.int8)
+        self.cp_indices_by_kind = {}
+        for code, kind in enumerate(cp_kinds):
+            self.cp_indices_by_kind[kind] = numpy.flatnonzero(self.cp_type_codes == code)
+        self.problems = []
+
+        self.codes      = self.cp_type_codes.tolist()
+        self.num_nuclei = len(topology.nuclei)
+
+        gradient_vector_field = topology.gradient_vector_field
+        def loaded(name):
+            return not isinstance(gradient_vector_field,LazyGradientVectorField) or gradient_vector_field.isLoaded(name)
+
+        if loaded('molecular_graph'):
+            for n, ail in enumerate(gradient_vector_field.molecular_graph.atomic_interaction_lines):
+                self.indexAtomicInteractionLine(ail,'AtomicInteractionLine ' + str(n))
+        if loaded('atomic_basins'):
+            for n, atomic_basin in enumerate(gradient_vector_field.atomic_basins):
+                name = 'AtomicBasin ' + str(n)
+                for gradient_path in atomic_basin.gradient_paths:
+                    self.indexGradientPath(gradient_path,name)
+                    if atomic_basin.nacp_index is None:
+                        atomic_basin.nacp_index = gradient_path.nacp_index
+                self.requireNucleus(atomic_basin.nacp_index,name)
+        if loaded('atomic_surfaces'):
+            for n, atomic_surface in enumerate(gradient_vector_field.atomic_surfaces):
+                name = 'AtomicSurface ' + str(n)
+                if atomic_surface.nacp_index is not None and not 0 <= atomic_surface.nacp_index < self.num_nuclei:
+                    self.problems.append(name + ': nacp_index ' + str(atomic_surface.nacp_index) + ' has no nucleus')
+                for m, interatomic_surface in enumerate(atomic_surface.interatomic_surfaces):
+                    surface_name = name + ' InteratomicSurface ' + str(m)
+                    for gradient_path in interatomic_surface.gradient_paths:
+                        self.indexGradientPath(gradient_path,surface_name)
+                        self.requireNucleus(gradient_path.nacp_index,surface_name)
+                        if interatomic_surface.bcp_index is None:
+                            interatomic_surface.bcp_index = gradient_path.bcp_index
+        if loaded('ring_surfaces'):
+            for n, ring_surface in enumerate(gradient_vector_field.ring_surfaces):
+                name = 'RingSurface ' + str(n)
+                for gradient_path in ring_surface.gradient_paths:
+                    self.indexGradientPath(gradient_path,name)
+                    if ring_surface.rcp_index is None:
+                        ring_surface.rcp_index = gradient_path.rcp_index
+                if ring_surface.gradient_paths and ring_surface.rcp_index is None:
+                    self.problems.append(name + ': no ring critical point')
+        if loaded('rings'):
+            for n, ring in enumerate(gradient_vector_field.rings):
+                for m, ail in enumerate(ring.atomic_interaction_lines):
+                    self.indexAtomicInteractionLine(ail,'Ring ' + str(n) + ' AtomicInteractionLine ' + str(m))
+        if loaded('cages'):
+            for n, cage in enumerate(gradient_vector_field.cages):
+                for m, ring in enumerate(cage.rings):
+                    for l, ail in enumerate(ring.atomic_interaction_lines):
+                        self.indexAtomicInteractionLine(ail,'Cage ' + str(n) + ' Ring ' + str(m) + ' AtomicInteractionLine ' + str(l))
+
+        del self.codes
+
+    # An AIL must have a BCP, and each of its paths a NACP with a nucleus
+    def indexAtomicInteractionLine(self,ail,name):
+        nacp_indices = []
+        for gradient_path in ail.gradient_paths:
+            self.indexGradientPath(gradient_path,name)
+            self.requireNucleus(gradient_path.nacp_index,name)
+            if gradient_path.nacp_index is not None:
+                nacp_indices.append(gradient_path.nacp_index)
+            if ail.bcp_index is None:
+                ail.bcp_index = gradient_path.bcp_index
+        ail.nacp_indices = nacp_indices
+        if ail.bcp_index is None:
+            self.problems.append(name + ': no bond critical point')
+
+    def indexGradientPath(self,gradient_path,name):
+        codes = self.codes
+        for index in gradient_path.cp_indices:
+            if index < 0:
+                continue
+            if index >= len(codes):
+                self.problems.append(name + ': critical point index ' + str(index) + ' is beyond the ' + str(len(codes)) + ' critical points')
+                continue
+            code = codes[index]
+            if code == NACP:
+                if gradient_path.nacp_index is None:
+                    gradient_path.nacp_index = index
+            elif code == BCP:
+                if gradient_path.bcp_index is None:
+                    gradient_path.bcp_index = index
+            elif code == RCP:
+                if gradient_path.rcp_index is None:
+                    gradient_path.rcp_index = index
+
+    # Nuclei are coloured by the element of the nucleus with the same index as their NACP
+    def requireNucleus(self,nacp_index,name):
+        if nacp_index is None:
+            self.problems.append(name + ': no nuclear attractor critical point')
+        elif nacp_index >= self.num_nuclei:
+            self.problems.append(name + ': nuclear attractor critical point ' + str(nacp_index) + ' has no nucleus')
 
-    # Find the center of the distribution of critical points
-    def computeCenter(self):
-
-        x_total = 0.0
-        y_total = 0.0
-        z_total = 0.0
-
-        for cp in self.critical_points:
-            x_total += cp.position_vector[0]
-            y_total += cp.position_vector[1]
-            z_total += cp.position_vector[2]
-
-        N = len(self.critical_points)
-        x_origin = x_total / N
-        y_origin = y_total / N
-        z_origin = z_total / N
-
-        #return mathutils.Vector((float(x_origin),float(y_origin),float(z_origin)))
-        return (x_origin,y_origin,z_origin)
-
-    # Get the radius of a sphere containing all the critical point objects
-    def computeRadius(self,center):
-
-        max = float('-inf')
-
-        position = [0.0, 0.0, 0.0]
-        for cp in self.critical_points:
-            position[0] = cp.position_vector[0] - center[0]
-            position[1] = cp.position_vector[1] - center[1]
-            position[2] = cp.position_vector[2] - center[2]
-            r = math.sqrt(position[0]*position[0] + position[1]*position[1] + position[2]*position[2])
-
-            if position[0] > max:
-                max = position[0]
+class Nucleus():
 
-        return max
+    __slots__ = ('element','position_vector')
 
-class Nucleus():
     def __init__(self,element,position_vector):
-        self.element         = element
+        self.element         = sys.intern(element)
         self.position_vector = position_vector
 
 class CriticalPoint(Point):
+
+    __slots__ = ('rank','signature')
+
     def __init__(self,position_vector,scalar_properties,rank,signature):
         Point.__init__(self,position_vector,scalar_properties)
         self.rank          = rank
         self.signature     = signature
 
     def computeType(self):
+        return cp_kinds[self.computeTypeCode()]
+
+    # The kind of critical point as an index into cp_kinds
+    def computeTypeCode(self):
         if self.rank == 3:
             if self.signature == -3:
-                return "nacp" # element of nucleus
+                return NACP # element of nucleus
             elif self.signature == 3:
-                return "ccp"
+                return CCP
             elif self.signature == 1:
-                return "rcp"
+                return RCP
             elif self.signature == -1:
-                return "bcp"
+                return BCP
             else:
-                return "unk" # should not be possible
+                return UNK # should not be possible
         else:
-            return "dgn"
+            return DGN
 
     def toStdout(self):
         print("CriticalPoint")
@@ -89,6 +417,9 @@ class CriticalPoint(Point):
         print('signature = ', self.signature)
 
 class GradientVectorField():
+
+    __slots__ = ('molecular_graph','atomic_basins','envelopes','atomic_surfaces','ring_surfaces','rings','cages')
+
     def __init__(self,molecular_graph,atomic_basins,envelopes,atomic_surfaces,ring_surfaces,rings,cages):
         self.molecular_graph = molecular_graph
         self.atomic_basins   = atomic_basins
@@ -98,15 +429,62 @@ class GradientVectorField():
         self.rings           = rings
         self.cages           = cages
 
+# A gradient vector field whose collections are only read when first accessed
+# loaders maps the name of each collection (e.g. 'atomic_basins') to a function returning it
+# Collections without a loader are empty
+class LazyGradientVectorField(GradientVectorField):
+
+    __slots__ = ('loaders',)
+
+    collection_names = GradientVectorField.__slots__
+
+    def __init__(self,loaders):
+        self.loaders = loaders
+
+    # Only called for attributes not yet set, i.e. collections not yet loaded
+    def __getattr__(self,name):
+        if name not in LazyGradientVectorField.collection_names:
+            raise AttributeError(name)
+        if name in self.loaders:
+            collection = self.loaders[name]()
+        elif name == 'molecular_graph':
+            collection = MolecularGraph([])
+        else:
+            collection = []
+        setattr(self,name,collection)
+        return collection
+
+    # True if the named collection has been read, without reading it
+    def isLoaded(self,name):
+        try:
+            object.__getattribute__(self,name)
+        except AttributeError:
+            return False
+        return True
+
+    # Read every collection that has not been read yet
+    def load(self):
+        for name in LazyGradientVectorField.collection_names:
+            getattr(self,name)
+
 class MolecularGraph():
+
+    __slots__ = ('atomic_interaction_lines',)
+
     def __init__(self,atomic_interaction_lines):
         self.atomic_interaction_lines = atomic_interaction_lines
 
 class AtomicBasin():
+
+    __slots__ = ('gradient_paths','nacp_index')
+
     def __init__(self,gradient_paths):
         self.gradient_paths = gradient_paths
+        self.nacp_index     = None # set by TopologyIndex
 
     def getNuclearAttractorCriticalPointIndex(self,critical_points):
+        if self.nacp_index is not None:
+            return self.nacp_index
         for gradient_path in self.gradient_paths:
             for index in gradient_path.cp_indices:
                 if (critical_points[index].computeType() == 'nacp'):
@@ -115,6 +493,9 @@ class AtomicBasin():
 # An envelope is a set of points with an optional triangulation thereof.
 # As it does not have gradient paths it must have an explicit critical point member.
 class Envelope():
+
+    __slots__ = ('isovalue','points','triangulation')
+
     def __init__(self,isovalue,points,triangulation):
         self.isovalue      = isovalue
         self.points        = points
@@ -122,6 +503,9 @@ class Envelope():
 
 # An atomic surface is a set of interatomic surfaces sharing a common BCP
 class AtomicSurface():
+
+    __slots__ = ('interatomic_surfaces','nacp_index')
+
     def __init__(self,interatomic_surfaces,nacp_index=0):
         self.interatomic_surfaces = interatomic_surfaces
         self.nacp_index = nacp_index
@@ -130,26 +514,41 @@ class AtomicSurface():
 # There are a set of ring paths - GPs from the RCP to BCPs
 # and the remainder connect the RCP to nuclei connected by the BCPs
 class RingSurface():
+
+    __slots__ = ('gradient_paths','rcp_index')
+
     def __init__(self,gradient_paths):
         self.gradient_paths = gradient_paths
+        self.rcp_index      = None # set by TopologyIndex
 
-    def getRingCriticalPoint():
-        for gradient_path in gradient_paths:
-            for cp in gradient_path.cp_indices:
-                if (cp.rank == 3 and cp.signature == +1):
-                    return cp
+    def getRingCriticalPoint(self,critical_points):
+        if self.rcp_index is not None:
+            return critical_points[self.rcp_index]
+        for gradient_path in self.gradient_paths:
+            for index in gradient_path.cp_indices:
+                if (critical_points[index].computeType() == 'rcp'):
+                    return critical_points[index]
 
 class AtomicInteractionLine():
+
+    __slots__ = ('gradient_paths','bcp_index','nacp_indices')
+
     def __init__(self,gradient_paths):
         self.gradient_paths = gradient_paths
+        self.bcp_index      = None # set by TopologyIndex
+        self.nacp_indices   = None
 
     def getBCP(self,critical_points):
+        if self.bcp_index is not None:
+            return critical_points[self.bcp_index]
         for gradient_path in self.gradient_paths:
             for index in gradient_path.cp_indices:
                 if (critical_points[index].computeType() == 'bcp'):
                     return critical_points[index]
 
     def getNuclearIndices(self,critical_points):
+        if self.nacp_indices is not None:
+            return self.nacp_indices
         indices = []
         for gradient_path in self.gradient_paths:
             for index in gradient_path.cp_indices:
@@ -159,17 +558,26 @@ class AtomicInteractionLine():
 
 # The gradient paths of an interatomic surface share a single BCP
 class InteratomicSurface():
+
+    __slots__ = ('gradient_paths','triangulation','bcp_index')
+
     def __init__(self,gradient_paths,triangulation):
         self.gradient_paths = gradient_paths
         self.triangulation  = triangulation
+        self.bcp_index      = None # set by TopologyIndex
 
-    def getBondCriticalPoint():
-        for gradient_path in gradient_paths:
-            for cp in gradient_path.critical_points:
-                if (cp.rank == 3 and cp.signature == -1):
-                    return cp
+    def getBondCriticalPoint(self,critical_points):
+        if self.bcp_index is not None:
+            return critical_points[self.bcp_index]
+        for gradient_path in self.gradient_paths:
+            for index in gradient_path.cp_indices:
+                if (critical_points[index].computeType() == 'bcp'):
+                    return critical_points[index]
 
 class Triangulation():
+
+    __slots__ = ('points','edge_objects','face_objects','edge_arrays','face_arrays')
+
     def __init__(self,points,edge_objects,face_objects):
         self.points = points
         self.edge_objects  = edge_objects
@@ -183,34 +591,370 @@ class Triangulation():
             face_array = [face.a,face.b,face.c]
             self.face_arrays.append(face_array)
 
+    # Cartesian coordinates of the vertices as an (N,3) array
+    def getCoordinates(self):
+        return numpy.array([point.position_vector for point in self.points],dtype=numpy.float64).reshape(-1,3)
+
+    # Values of the named scalar property at each vertex as an (N,) array, NaN where absent
+    def getScalarProperty(self,key):
+        return numpy.array([point.scalar_properties.get(key,float('nan')) for point in self.points],dtype=numpy.float64)
+
+    # Names of the scalar properties present at any vertex
+    def getScalarPropertyKeys(self):
+        return scalarPropertyKeys(self.points)
+
+    # Vertex indices of the edges as an (E,2) array
+    def getEdgeIndices(self):
+        return numpy.array(self.edge_arrays,dtype=numpy.int32).reshape(-1,2)
+
+    # Vertex indices of the faces as an (F,3) array
+    def getFaceIndices(self):
+        return numpy.array(self.face_arrays,dtype=numpy.int32).reshape(-1,3)
+
+# Array-backed triangulation holding the vertex coordinates, scalar properties and
+# edge/face indices as contiguous NumPy arrays. The list attributes of Triangulation
+# are provided as read-only properties built on demand.
+class ColumnarTriangulation(Triangulation):
+
+    __slots__ = ('coordinates','scalar_properties','edges','faces')
+
+    def __init__(self,coordinates,scalar_properties,edges,faces):
+        self.coordinates       = floatArray(coordinates).reshape(-1,3)
+        self.scalar_properties = scalar_properties
+        self.edges             = numpy.ascontiguousarray(edges,dtype=numpy.int32).reshape(-1,2)
+        self.faces             = numpy.ascontiguousarray(faces,dtype=numpy.int32).reshape(-1,3)
+
+    # Pickle the arrays only; the default state would include the properties below
+    def __getstate__(self):
+        return (None,{name: getattr(self,name) for name in ColumnarTriangulation.__slots__})
+
+    @property
+    def points(self):
+        return pointsFromColumns(self.coordinates,self.scalar_properties)
+
+    @property
+    def edge_objects(self):
+        return [Edge(a,b) for a, b in self.edges.tolist()]
+
+    @property
+    def face_objects(self):
+        return [Face(a,b,c) for a, b, c in self.faces.tolist()]
+
+    @property
+    def edge_arrays(self):
+        return self.edges.tolist()
+
+    @property
+    def face_arrays(self):
+        return self.faces.tolist()
+
+    def getCoordinates(self):
+        return self.coordinates
+
+    def getScalarProperty(self,key):
+        if key in self.scalar_properties:
+            return self.scalar_properties[key]
+        return numpy.full(len(self.coordinates),float('nan'))
+
+    def getScalarPropertyKeys(self):
+        return list(self.scalar_properties)
+
+    def getEdgeIndices(self):
+        return self.edges
+
+    def getFaceIndices(self):
+        return self.faces
+
 class Edge():
+
+    __slots__ = ('a','b')
+
     def __init__(self,a,b):
         self.a = a
         self.b = b
 
 class Face():
+
+    __slots__ = ('a','b','c')
+
     def __init__(self,a,b,c):
         self.a = a
         self.b = b
         self.c = c
 
 class GradientPath():
+
+    __slots__ = ('cp_indices','points','nacp_index','bcp_index','rcp_index')
+
     def __init__(self,cp_indices,points):
         self.cp_indices = cp_indices
         self.points = points
+        self.clearCriticalPointIndices()
+
+    # Indices of the first NACP, BCP and RCP among cp_indices, set by TopologyIndex
+    def clearCriticalPointIndices(self):
+        self.nacp_index = None
+        self.bcp_index  = None
+        self.rcp_index  = None
 
     def getNuclearIndex(self,critical_points):
+        if self.nacp_index is not None:
+            return self.nacp_index
         for index in self.cp_indices:
             if (critical_points[index].computeType() == 'nacp'):
                 return index
 
+    # Cartesian coordinates of the points as an (N,3) array
+    def getCoordinates(self):
+        return numpy.array([point.position_vector for point in self.points],dtype=numpy.float64).reshape(-1,3)
+
+    # Values of the named scalar property at each point as an (N,) array, NaN where absent
+    def getScalarProperty(self,key):
+        return numpy.array([point.scalar_properties.get(key,float('nan')) for point in self.points],dtype=numpy.float64)
+
+    # Names of the scalar properties present at any point
+    def getScalarPropertyKeys(self):
+        return scalarPropertyKeys(self.points)
+
+# Array-backed gradient path. The coordinates are held in a single contiguous (N,3) array
+# and each scalar property (rho, etc.) as a named (N,) column, so no Point objects are
+# allocated. The points attribute of GradientPath is built on demand for compatibility.
+class ColumnarGradientPath(GradientPath):
+
+    __slots__ = ('coordinates','scalar_properties')
+
+    def __init__(self,cp_indices,coordinates,scalar_properties):
+        self.cp_indices        = cp_indices
+        self.coordinates       = floatArray(coordinates).reshape(-1,3)
+        self.scalar_properties = scalar_properties
+        self.clearCriticalPointIndices()
+
+    # Pickle the arrays and indices only; the default state would include points
+    def __getstate__(self):
+        return (None,{name: getattr(self,name) for name in ColumnarGradientPath.__slots__ + GradientPath.__slots__ if name != 'points'})
+
+    @property
+    def points(self):
+        return pointsFromColumns(self.coordinates,self.scalar_properties)
+
+    def getCoordinates(self):
+        return self.coordinates
+
+    def getScalarProperty(self,key):
+        if key in self.scalar_properties:
+            return self.scalar_properties[key]
+        return numpy.full(len(self.coordinates),float('nan'))
+
+    def getScalarPropertyKeys(self):
+        return list(self.scalar_properties)
+
+# Coordinates and scalar property columns are held as float64, unless given as float32
+def floatArray(values):
+    if isinstance(values,numpy.ndarray) and values.dtype == numpy.float32:
+        return numpy.ascontiguousarray(values)
+    return numpy.ascontiguousarray(values,dtype=numpy.float64)
+
+# Convert the coordinates and scalar property columns of the array-backed gradient paths and
+# triangulations of a topology to precision, 'float64' or 'float32'. Point objects hold Python
+# floats and are left as they are, as are the collections of a LazyGradientVectorField not yet loaded.
+def convertPrecision(topology,precision):
+    dtype = numpy.dtype(precision)
+    for item in arrayBackedObjects(topology.gradient_vector_field):
+        item.coordinates = item.coordinates.astype(dtype,copy=False)
+        item.scalar_properties = {key: column.astype(dtype,copy=False) for key, column in item.scalar_properties.items()}
+
+# Generate the ColumnarGradientPath and ColumnarTriangulation objects of a gradient vector field
+def arrayBackedObjects(gradient_vector_field):
+    gradient_paths, triangulations, envelopes = collectGeometry(gradient_vector_field)
+    for gradient_path in gradient_paths:
+        if isinstance(gradient_path,ColumnarGradientPath):
+            yield gradient_path
+    for triangulation in triangulations:
+        if isinstance(triangulation,ColumnarTriangulation):
+            yield triangulation
+
+# The gradient paths, triangulations and envelopes of a gradient vector field, as three lists
+# Collections of a LazyGradientVectorField that are not yet loaded are left out, and paths shared
+# by several objects (see shareRepeatedObjects) are listed once
+def collectGeometry(gradient_vector_field):
+
+    def loaded(name):
+        return not isinstance(gradient_vector_field,LazyGradientVectorField) or gradient_vector_field.isLoaded(name)
+
+    gradient_paths = []
+    triangulations = []
+    envelopes      = []
+    if loaded('molecular_graph'):
+        for ail in gradient_vector_field.molecular_graph.atomic_interaction_lines:
+            gradient_paths.extend(ail.gradient_paths)
+    if loaded('atomic_basins'):
+        for atomic_basin in gradient_vector_field.atomic_basins:
+            gradient_paths.extend(atomic_basin.gradient_paths)
+    if loaded('envelopes'):
+        envelopes.extend(gradient_vector_field.envelopes)
+        for envelope in gradient_vector_field.envelopes:
+            triangulations.append(envelope.triangulation)
+    if loaded('atomic_surfaces'):
+        for atomic_surface in gradient_vector_field.atomic_surfaces:
+            for interatomic_surface in atomic_surface.interatomic_surfaces:
+                gradient_paths.extend(interatomic_surface.gradient_paths)
+                triangulations.append(interatomic_surface.triangulation)
+    if loaded('ring_surfaces'):
+        for ring_surface in gradient_vector_field.ring_surfaces:
+            gradient_paths.extend(ring_surface.gradient_paths)
+    rings = list(gradient_vector_field.rings) if loaded('rings') else []
+    if loaded('cages'):
+        for cage in gradient_vector_field.cages:
+            rings.extend(cage.rings)
+    for ring in rings:
+        for ail in ring.atomic_interaction_lines:
+            gradient_paths.extend(ail.gradient_paths)
+
+    # Listed in order of first appearance, which does not depend on the order of a dict
+    unique_paths = []
+    seen = set()
+    for gradient_path in gradient_paths:
+        if id(gradient_path) not in seen:
+            seen.add(id(gradient_path))
+            unique_paths.append(gradient_path)
+    triangulations = [triangulation for triangulation in triangulations if triangulation is not None]
+    return unique_paths, triangulations, envelopes
+
+# Make the AILs of rings and the rings of cages that repeat ones read earlier refer to the same
+# objects. Topology.dtd has each Ring repeat in full the AILs of the molecular graph it passes
+# through, and each Cage its Rings, so without this they are held several times over.
+# Collections of a LazyGradientVectorField that are not yet loaded are left out.
+# Returns the number of AILs and the number of rings replaced by a shared object.
+def shareRepeatedObjects(gradient_vector_field):
+
+    def loaded(name):
+        return not isinstance(gradient_vector_field,LazyGradientVectorField) or gradient_vector_field.isLoaded(name)
+
+    shared_ails  = IdenticalObjects(atomicInteractionLineSignature,sameAtomicInteractionLine)
+    # Rings are compared once their AILs are shared, so by the identity of their AILs
+    shared_rings = IdenticalObjects(lambda ring: tuple(id(ail) for ail in ring.atomic_interaction_lines),lambda a, b: True)
+    counts = [0,0]
+
+    def shareAtomicInteractionLines(ring):
+        ails = ring.atomic_interaction_lines
+        for n, ail in enumerate(ails):
+            found = shared_ails.find(ail)
+            if found is None:
+                shared_ails.add(ail)
+            elif found[0] is not ail:
+                ails[n] = found[0]
+                counts[0] += 1
+        found = shared_rings.find(ring)
+        if found is None:
+            shared_rings.add(ring)
+            return ring
+        return found[0]
+
+    if loaded('molecular_graph'):
+        for ail in gradient_vector_field.molecular_graph.atomic_interaction_lines:
+            shared_ails.add(ail)
+    if loaded('rings'):
+        for ring in gradient_vector_field.rings:
+            shareAtomicInteractionLines(ring)
+    if loaded('cages'):
+        for cage in gradient_vector_field.cages:
+            for n, ring in enumerate(cage.rings):
+                shared = shareAtomicInteractionLines(ring)
+                if shared is not ring:
+                    cage.rings[n] = shared
+                    counts[1] += 1
+    return counts[0], counts[1]
+
+# A collection of objects, each with an optional number, in which one identical to a given object
+# is found by first looking up those with the same signature (a cheap key, such as the CP indices
+# of an AIL) and then comparing them in full with same
+class IdenticalObjects():
+
+    __slots__ = ('signature','same','objects')
+
+    def __init__(self,signature,same):
+        self.signature = signature
+        self.same      = same
+        self.objects   = {} # signature to [(object,number)]
+
+    def add(self,item,number=None):
+        self.objects.setdefault(self.signature(item),[]).append((item,number))
+
+    # The (object,number) added that is identical to item, or None
+    def find(self,item):
+        for other, number in self.objects.get(self.signature(item),()):
+            if other is item or self.same(other,item):
+                return other, number
+        return None
+
+def atomicInteractionLineSignature(ail):
+    return tuple(tuple(gradient_path.cp_indices) for gradient_path in ail.gradient_paths)
+
+# True if two AILs have the same CP indices, coordinates and scalar properties
+def sameAtomicInteractionLine(a,b):
+    if len(a.gradient_paths) != len(b.gradient_paths):
+        return False
+    for path_a, path_b in zip(a.gradient_paths,b.gradient_paths):
+        if path_a is path_b:
+            continue
+        if list(path_a.cp_indices) != list(path_b.cp_indices):
+            return False
+        if isinstance(path_a,ColumnarGradientPath) and isinstance(path_b,ColumnarGradientPath):
+            if not sameArray(path_a.coordinates,path_b.coordinates) or set(path_a.scalar_properties) != set(path_b.scalar_properties):
+                return False
+            for key, column in path_a.scalar_properties.items():
+                if not sameArray(column,path_b.scalar_properties[key]):
+                    return False
+        elif [(point.position_vector,point.scalar_properties) for point in path_a.points] != [(point.position_vector,point.scalar_properties) for point in path_b.points]:
+            return False
+    return True
+
+# Arrays are the same if they have the same dtype, shape and bytes, so that NaNs match
+def sameArray(a,b):
+    return a.dtype == b.dtype and a.shape == b.shape and a.tobytes() == b.tobytes()
+
+# Names of the scalar properties present at any of a list of points, in order of appearance
+def scalarPropertyKeys(points):
+    keys = []
+    seen = set()
+    for point in points:
+        for key in point.scalar_properties:
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+    return keys
+
+# Build a list of Point objects from a coordinate array and a dict of property columns
+# NaN entries mark properties that were absent at a point and are omitted
+def pointsFromColumns(coordinates,scalar_properties):
+    keys = list(scalar_properties)
+    if keys and not any(numpy.isnan(column).any() for column in scalar_properties.values()):
+        # Every point has every property, so build the dicts a row at a time
+        rows = numpy.column_stack([scalar_properties[key] for key in keys]).tolist()
+        return [Point(tuple(position_vector),dict(zip(keys,row))) for position_vector, row in zip(coordinates.tolist(),rows)]
+    columns = {key: column.tolist() for key, column in scalar_properties.items()}
+    points = []
+    for i, position_vector in enumerate(coordinates.tolist()):
+        properties = {}
+        for key, column in columns.items():
+            if column[i] == column[i]:
+                properties[key] = column[i]
+        points.append(Point(tuple(position_vector),properties))
+    return points
+
 # A ring is the set of AILs bounding a RCP
 class Ring():
+
+    __slots__ = ('atomic_interaction_lines',)
+
     def __init__(self,atomic_interaction_lines):
         self.atomic_interaction_lines = atomic_interaction_lines
 
 # A cage is the set of rings bounding a CCP
 class Cage():
+
+    __slots__ = ('rings',)
+
     def __init__(self,rings):
         self.rings = rings
 		
@@ -0,0 +1,231 @@
+# Validation Python 3 Module
+# Rhorix: An interface between quantum chemical topology and the 3D graphics program Blender
+
+# A TopologyValidator checks a Topology document against Topology.dtd as it is read, so that
+# validation shares the single streaming pass of ParseTopology.parseTopologyStreaming and
+# ParseTopology.iterTopology rather than requiring a second read of the file (as the Perl script
+# conversion_scripts/validateXML.pl does).
+#
+# The parser calls validate() at the end tag of each element it converts, and of the root, before
+# converting it; the whole subtree still attached to the element is checked at once. As the parser
+# removes each converted element from its parent, it calls detach() so that the element is still
+# accounted for when the content model of the parent is checked. ParseTopology.parseTopology
+# instead validates the whole tree read by ElementTree at once, from its root.
+#
+# The following are checked:
+#   - the children of every element, in order, against its content model in Topology.dtd
+#   - that elements declared as #PCDATA contain only text, and that numeric fields are numbers
+#   - that cp_index and nucleus_index values identifying CPs and nuclei are unique
+#   - that the cp_index (one-based) and nacp_index (zero-based) references of the gradient
+#     vector field are to critical points read before it, by the cp_index of each. A cp_index of
+#     0 marks a gradient path end that is not at a critical point (e.g. at infinity).
+# The first violation found raises a TopologyValidationError naming the offending element.
+
+import os
+import re
+
+# Path of the document model shipped with Rhorix
+dtd_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),'Topology.dtd')
+
+# Leaf elements holding numbers, and the type each must be convertible to
+numericFields = {
+    'cp_index'      : int,
+    'nucleus_index' : int,
+    'nacp_index'    : int,
+    'rank'          : int,
+    'signature'     : int,
+    'edge_a'        : int,
+    'edge_b'        : int,
+    'face_a'        : int,
+    'face_b'        : int,
+    'face_c'        : int,
+    'x'             : float,
+    'y'             : float,
+    'z'             : float,
+    'value'         : float,
+    'isovalue'      : float,
+}
+
+# Children of the Edge and Face elements, which are checked directly by validateIndexTuple
+indexTupleTags = {
+    'Edge' : ['edge_a','edge_b'],
+    'Face' : ['face_a','face_b','face_c'],
+}
+
+class TopologyValidationError(ValueError):
+    pass
+
+class TopologyValidator():
+
+    def __init__(self):
+        self.content_models         = readContentModels()
+        self.detached               = {} # element to [(number of attached children before, tag)]
+        self.valid_children         = set() # (tag, children) already matched to a content model
+        self.critical_point_indices = set()
+        self.nucleus_indices        = set()
+        self.ancestors              = []
+        self.path                   = []
+
+    # Check element and its attached subtree. ancestors lists the open elements containing it,
+    # outermost first, and is only used to name the element in errors.
+    def validate(self,element,ancestors=()):
+        if not ancestors and element.tag != 'Topology':
+            raise TopologyValidationError('Root element is ' + element.tag + ', not Topology')
+        self.ancestors = list(ancestors)
+        self.path = []
+        self.validateElement(element,self.ancestors[-1].tag if self.ancestors else None)
+
+    # Record that element, already validated, is about to be removed from parent
+    def detach(self,parent,element):
+        position = next(n for n, child in enumerate(parent) if child is element)
+        self.detached.setdefault(parent,[]).append((position,element.tag))
+
+    def validateElement(self,element,parent_tag):
+
+        self.path.append(element)
+        tag = element.tag
+        if tag not in self.content_models:
+            self.fail('Element is not declared in Topology.dtd')
+        model = self.content_models[tag]
+
+        if model is None:
+            # #PCDATA
+            if len(element) or element in self.detached:
+                self.fail('Element may only contain text')
+            if tag in numericFields:
+                self.checkNumericField(tag,element.text,parent_tag)
+        else:
+            children = ''.join(child + ' ' for child in self.childTags(element))
+            if (tag,children) not in self.valid_children:
+                if model.fullmatch(children) is None:
+                    self.fail('Children (' + ','.join(children.split()) + ') do not match the content model in Topology.dtd')
+                self.valid_children.add((tag,children))
+            for child in element:
+                if child.tag == 'Point':
+                    self.validatePoint(child,tag)
+                elif child.tag in indexTupleTags:
+                    self.validateIndexTuple(child,tag)
+                else:
+                    self.validateElement(child,tag)
+            self.detached.pop(element,None)
+
+        self.path.pop()
+
+    # Points are by far the most numerous elements, so their usual form of a PositionVector and
+    # a Map of Pairs is checked directly. Anything else is checked by validateElement.
+    def validatePoint(self,point,parent_tag):
+        try:
+            position_vector = point[0]
+            x, y, z = position_vector
+            valid = (len(point) <= 2 and position_vector.tag == 'PositionVector'
+                     and x.tag == 'x' and y.tag == 'y' and z.tag == 'z' and not (len(x) or len(y) or len(z)))
+            if valid:
+                float(x.text)
+                float(y.text)
+                float(z.text)
+            if valid and len(point) == 2:
+                map_element = point[1]
+                valid = map_element.tag == 'Map'
+                for pair in map_element:
+                    key, value = pair
+                    if pair.tag != 'Pair' or key.tag != 'key' or value.tag != 'value' or len(key) or len(value):
+                        valid = False
+                        break
+                    float(value.text)
+        except (IndexError,TypeError,ValueError):
+            valid = False
+        if not valid:
+            self.validateElement(point,parent_tag)
+
+    # As validatePoint, for the Edge and Face elements of a triangulation
+    def validateIndexTuple(self,element,parent_tag):
+        try:
+            valid = [child.tag for child in element] == indexTupleTags[element.tag]
+            for child in element:
+                int(child.text)
+                valid = valid and not len(child)
+        except (TypeError,ValueError):
+            valid = False
+        if not valid:
+            self.validateElement(element,parent_tag)
+
+    def checkNumericField(self,tag,text,parent_tag):
+
+        try:
+            value = numericFields[tag]((text or '').strip())
+        except ValueError:
+            self.fail('Expected a number, found ' + repr(text))
+
+        if tag == 'cp_index':
+            if parent_tag == 'CriticalPoint':
+                if value in self.critical_point_indices:
+                    self.fail('Duplicate critical point index ' + str(value))
+                self.critical_point_indices.add(value)
+            elif value != 0 and value not in self.critical_point_indices:
+                self.fail('Critical point index ' + str(value) + ' is not that of a critical point')
+        elif tag == 'nacp_index':
+            if value + 1 not in self.critical_point_indices:
+                self.fail('Nuclear attractor critical point index ' + str(value) + ' is not that of a critical point')
+        elif tag == 'nucleus_index':
+            if value in self.nucleus_indices:
+                self.fail('Duplicate nucleus index ' + str(value))
+            self.nucleus_indices.add(value)
+
+    # Tags of the children of element in document order, including those detached from it
+    def childTags(self,element):
+        tags = [child.tag for child in element]
+        if element not in self.detached:
+            return tags
+        merged = []
+        attached = 0
+        for position, tag in self.detached[element]:
+            merged.extend(tags[attached:position])
+            attached = max(attached,position)
+            merged.append(tag)
+        merged.extend(tags[attached:])
+        return merged
+
+    # Raise an error naming the element being checked by its path from the root
+    def fail(self,message):
+        elements = self.ancestors + self.path
+        path = [elements[0].tag]
+        for parent, element in zip(elements,elements[1:]):
+            attached = next(n for n, child in enumerate(parent) if child is element)
+            detached = sum(1 for position, tag in self.detached.get(parent,()) if position <= attached)
+            preceding = self.childTags(parent)[:attached+detached+1]
+            path.append(element.tag + '[' + str(preceding.count(element.tag)) + ']')
+        raise TopologyValidationError('/'.join(path) + ': ' + message)
+
+content_models = None
+
+# Read the content model of each element declared in Topology.dtd, as a regular expression
+# matching the tags of its children each followed by a space, or None for #PCDATA
+def readContentModels():
+    global content_models
+    if content_models is None:
+        with open(dtd_path,'r') as dtd_file:
+            dtd = re.sub(r'<!--.*?-->','',dtd_file.read(),flags=re.DOTALL)
+        models = {}
+        for name, model in re.findall(r'<!ELEMENT\s+([\w.-]+)\s+([^>]*)>',dtd):
+            models[name] = compileContentModel(model.strip())
+        content_models = models
+    return content_models
+
+def compileContentModel(model):
+    if '#PCDATA' in model:
+        return None
+    if model == 'EMPTY':
+        return re.compile('')
+    if model == 'ANY':
+        return re.compile(r'(?:[\w.-]+ )*')
+    pattern = ''
+    for token in re.findall(r'[\w.-]+|[(),|?*+]',model):
+        if token == '(':
+            pattern += '(?:'
+        elif token == ',':
+            continue
+        elif token in ')|?*+':
+            pattern += token
+        else:
+            pattern += '(?:' + re.escape(token) + ' )'
+    return re.compile(pattern)
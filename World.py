@@ -6,6 +6,7 @@ import mathutils
 import math
 
 # This function sets up default render options, lights, camera to match the Morphy GUI
+# center and radius describe a sphere containing the whole topology (see Topology.computeBounds)
 def setup(center,radius):
 
     # quick fix for zero radius (single CP) case
@@ -16,12 +17,37 @@ def setup(center,radius):
     createLights(cam_ob.location,center,radius)
     defaultRenderSettings()
 
+# The six planes bounding the view of a camera object, as (normal,offset) pairs with the visible
+# region where normal.dot(x) + offset >= 0 (see TiledTopology.TiledTopologyFile.tilesInFrustum)
+def cameraFrustumPlanes(cam_ob,scene):
+
+    matrix  = cam_ob.matrix_world
+    eye     = matrix.translation
+    forward = -(matrix.to_3x3() * mathutils.Vector((0.0,0.0,1.0))).normalized() # cameras look along -z
+    corners = [matrix * corner for corner in cam_ob.data.view_frame(scene)]
+    inside  = sum(corners,mathutils.Vector()) / 4.0
+
+    planes = []
+    for n in range(4):
+        a = corners[n]
+        b = corners[(n+1) % 4]
+        # each side plane contains an edge of the frame and the direction of the rays through it
+        direction = forward if cam_ob.data.type == 'ORTHO' else a - eye
+        normal = (b - a).cross(direction)
+        if normal.dot(inside - a) < 0.0:
+            normal = -normal
+        planes.append((tuple(normal),-normal.dot(a)))
+    planes.append((tuple(forward),-forward.dot(eye) - cam_ob.data.clip_start))
+    planes.append((tuple(-forward),forward.dot(eye) + cam_ob.data.clip_end))
+    return planes
+
 def createCamera(center,radius):
 
     cam = bpy.data.cameras.new("Cam")
-    cam.clip_end = 1000.0
+    # the far side of the sphere is 5 radii from the camera, so allow twice that
+    cam.clip_end = max(1000.0,10.0 * radius)
     cam_ob = bpy.data.objects.new("Cam", cam)
-    cam_ob.location=(center[0],center[1],(4.0 * radius))
+    cam_ob.location=(center[0],center[1],center[2]+(4.0 * radius))
     bpy.context.scene.objects.link(cam_ob)
     return cam_ob
 
@@ -30,16 +56,18 @@ def createLights(cam_location,center,radius):
     rad45 = 45.0*(3.141519265359/180.0)
     rad90 = 90.0*(3.141519265359/180.0)
     sin45 = math.sin(rad45)
+    # the lights are placed relative to the center, at the distance of the camera from it
+    distance = cam_location[2] - center[2]
 
     def createKeyLight():
 
         # Must create spotlight for key light at camera position, pointing in camera direction
         bpy.ops.object.lamp_add(type='SPOT',location=cam_location)
         # move to the left (-ve x-direction), +ve along z and +ve along y
-        x = -cam_location[2]*sin45
+        x = -distance*sin45
         y = radius
-        z = cam_location[2]*sin45
-        bpy.context.active_object.location = (x, y, z)
+        z = distance*sin45
+        bpy.context.active_object.location = (center[0]+x, center[1]+y, center[2]+z)
 
         if (abs(y) != 0):
             angle = rad90 - math.atan(abs(x)/abs(y)) 
@@ -47,7 +75,7 @@ def createLights(cam_location,center,radius):
             angle = rad90
         bpy.context.active_object.rotation_euler = mathutils.Euler((0.0,-rad45,-angle),'XYZ')
 
-        bpy.context.active_object.data.distance = cam_location[2]
+        bpy.context.active_object.data.distance = distance
         bpy.context.active_object.data.energy = 15
         bpy.context.active_object.data.spot_size = 1.0 # rads!
 
@@ -56,10 +84,10 @@ def createLights(cam_location,center,radius):
     def createFillLight():
 
         bpy.ops.object.lamp_add(type='SPOT',location=cam_location)
-        x = cam_location[2]*sin45
+        x = distance*sin45
         y = radius
         z = x
-        bpy.context.active_object.location = (x, y, z)
+        bpy.context.active_object.location = (center[0]+x, center[1]+y, center[2]+z)
 
         if (abs(y) != 0):
             angle = rad90 - math.atan(abs(x)/abs(y)) 
@@ -67,17 +95,17 @@ def createLights(cam_location,center,radius):
             angle = rad90
         bpy.context.active_object.rotation_euler = mathutils.Euler((0.0,rad45,angle),'XYZ')
 
-        bpy.context.active_object.data.distance = cam_location[2]
+        bpy.context.active_object.data.distance = distance
         bpy.context.active_object.data.energy = 5
         bpy.context.active_object.data.spot_size = 1.0 # rads!
 
     def createRimLight():
         # and now the rim light
         bpy.ops.object.lamp_add(type='SPOT',location=cam_location)
-        bpy.context.active_object.location.z = -4.0*radius
+        bpy.context.active_object.location = (center[0], center[1], center[2]-4.0*radius)
         bpy.context.active_object.rotation_euler = mathutils.Euler((3.141519265359,0.0,0.0),'XYZ')
 
-        bpy.context.active_object.data.distance = cam_location[2]
+        bpy.context.active_object.data.distance = distance
         bpy.context.active_object.data.energy = 5
         bpy.context.active_object.data.spot_size = 1.0 # rads!
 